@@ -20,6 +20,7 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(BASE_DIR))))
 
 from utils.response_handler import ResponseHandler, StatusCode, api_response
+from utils.field_projection import parse_fields, select_columns
 
 # 从__init__.py导入蓝图
 from . import car_park_new_bp
@@ -43,6 +44,29 @@ from .utils import (
 
 logger = logging.getLogger(__name__)
 
+# /car_park 单独查询返回的字段 -> SQL 表达式
+CAR_INFO_COLUMNS = {
+    'owner': 'pp.pName',
+    'car_number': 'p.plateNumber',
+    'begin_time': 'p.beginTime',
+    'end_time': 'p.endTime',
+    'remark': 'p.pRemark',
+}
+
+# /car_park 同步模式返回的人员、车牌字段
+SYNC_PERSON_COLUMNS = (
+    'id', 'pName', 'pSex', 'departId', 'pAddress', 'pPhone',
+    'pParkSpaceCount', 'pNumber', 'upload_yun', 'IDCardNumber',
+    'upload_yun2', 'personIdStr', 'address1', 'address2', 'address3'
+)
+SYNC_PLATE_COLUMNS = (
+    'id', 'personId', 'plateNumber', 'plateType', 'plateParkingSpaceName',
+    'beginTime', 'endTime', 'createTime', 'authType', 'upload_yun',
+    'cNumber', 'pChargeId', 'pRemark', 'balance', 'cardNumber',
+    'plateStandard', 'thirdCount', 'upload_third', 'freeTime',
+    'createName', 'plateIdStr', 'isDel', 'upload_yun2', 'parkHourMinutes'
+)
+
 # 确保默认管理员用户存在
 def ensure_admin_user():
     """确保默认管理员用户存在于数据库中"""
@@ -689,11 +713,13 @@ def car_park_api():
             car_number = request.args.get('car_number')
             owner_name = request.args.get('owner_name')
 
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
             if car_number or owner_name:
-                # 单独查询模式
+                # 单独查询模式，fields 为逗号分隔的返回字段（owner/car_number/begin_time/end_time/remark）
+                try:
+                    select_list = select_columns(parse_fields(request.args.get('fields')), CAR_INFO_COLUMNS)
+                except ValueError as e:
+                    return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=str(e))
+
                 conditions = []
                 params = []
                 if car_number:
@@ -703,66 +729,56 @@ def car_park_api():
                     conditions.append("pp.pName LIKE ?")
                     params.append(f"%{owner_name}%")
 
-                query = """
-                SELECT pp.pName, p.plateNumber, p.beginTime, p.endTime, p.pRemark
+                query = f"""
+                SELECT {select_list}
                 FROM Sys_Park_Plate p
                 LEFT JOIN Sys_Park_Person pp ON p.personId = pp.id
                 WHERE """ + " OR ".join(conditions)
 
+                conn = get_db_connection()
+                cursor = conn.cursor()
                 cursor.execute(query, params)
-                results = cursor.fetchall()
-
-                if results:
-                    car_info = [{
-                        "owner": row[0],
-                        "car_number": row[1],
-                        "begin_time": row[2],
-                        "end_time": row[3],
-                        "remark": row[4]
-                    } for row in results]
-                    conn.close()
+                car_info = [dict(row) for row in cursor.fetchall()]
+                conn.close()
+
+                if car_info:
                     return ResponseHandler.success(data=car_info)
                 else:
-                    conn.close()
                     return ResponseHandler.error(
                         code=StatusCode.NOT_FOUND,
                         msg="未找到相关车辆信息"
                     )
             else:
-                # 同步模式：返回所有数据供客户端对比
+                # 同步模式：返回所有数据供客户端对比，person_fields/plate_fields 为逗号分隔的返回字段，id 总是返回
+                try:
+                    person_columns = select_columns(
+                        parse_fields(request.args.get('person_fields')), SYNC_PERSON_COLUMNS, required=('id',)
+                    )
+                    plate_columns = select_columns(
+                        parse_fields(request.args.get('plate_fields')), SYNC_PLATE_COLUMNS, required=('id',)
+                    )
+                except ValueError as e:
+                    return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=str(e))
+
+                conn = get_db_connection()
+                cursor = conn.cursor()
+
                 # 获取所有人员数据
-                cursor.execute("""
-                    SELECT id, pName, pSex, departId, pAddress, pPhone, 
-                           pParkSpaceCount, pNumber, upload_yun, IDCardNumber, 
-                           upload_yun2, personIdStr, address1, address2, address3
-                    FROM Sys_Park_Person
-                """)
-                persons = []
-                for row in cursor.fetchall():
-                    person = {}
-                    for idx, col in enumerate(cursor.description):
-                        person[col[0]] = row[idx]
-                    persons.append(person)
+                cursor.execute(f"SELECT {person_columns} FROM Sys_Park_Person")
+                persons = [dict(row) for row in cursor.fetchall()]
 
                 # 获取所有车牌数据
-                cursor.execute("""
-                    SELECT id, personId, plateNumber, plateType, plateParkingSpaceName,
-                           beginTime, endTime, createTime, authType, upload_yun,
-                           cNumber, pChargeId, pRemark, balance, cardNumber,
-                           plateStandard, thirdCount, upload_third, freeTime,
-                           createName, plateIdStr, isDel, upload_yun2, parkHourMinutes
-                    FROM Sys_Park_Plate
-                """)
+                cursor.execute(f"SELECT {plate_columns} FROM Sys_Park_Plate")
                 plates = []
                 for row in cursor.fetchall():
                     plate = {}
-                    for idx, col in enumerate(cursor.description):
+                    for key in row.keys():
                         # 处理日期时间字段
-                        if isinstance(row[idx], datetime):
-                            plate[col[0]] = row[idx].strftime(
+                        if isinstance(row[key], datetime):
+                            plate[key] = row[key].strftime(
                                 '%Y-%m-%d %H:%M:%S')
                         else:
-                            plate[col[0]] = row[idx]
+                            plate[key] = row[key]
                     plates.append(plate)
 
                 conn.close()
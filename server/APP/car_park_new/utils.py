@@ -15,6 +15,7 @@ import time
 import json
 import logging
 import sqlite3
+from utils import db_connection
 from datetime import datetime, timedelta
 from typing import Tuple, Any, Dict, List, Optional, Union
 import threading
@@ -56,7 +57,7 @@ DB_PATH = os.path.join(SERVER_DIR, 'database', 'car_park.db')
 
 def get_db_connection():
     """获取数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = db_connection.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
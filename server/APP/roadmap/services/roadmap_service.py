@@ -4,15 +4,19 @@ Roadmap服务模块
 提供计划管理相关的服务功能
 """
 import sqlite3
+from utils import db_connection
 import time
 import json
 import os
+import logging
 from flask import session, request
 import hashlib
 import requests
 # 从主应用导入配置
 from config.config import PROD_SERVER, ENV, Roadmap_SYNC_TIME
 
+logger = logging.getLogger(__name__)
+
 class RoadmapService:
     def __init__(self):
         # 调整数据库路径，使其相对于当前文件
@@ -214,7 +218,7 @@ class RoadmapService:
         return hashlib.md5(password.encode('utf-8')).hexdigest()
     
     def get_db(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
@@ -348,7 +352,7 @@ class RoadmapService:
         """
         conn = None
         try:
-            print("[Sync] 开始双向增量同步...")
+            logger.debug("[Sync] 开始双向增量同步...")
             
             # 准备同步请求头
             headers = {
@@ -359,7 +363,7 @@ class RoadmapService:
             
             # 1. 从生产环境获取增量更新
             sync_url = f"{PROD_SERVER['URL']}/roadmap/api/sync"
-            print(f"[Sync] 从生产环境获取增量更新 - 上次同步时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_sync_time))}")
+            logger.debug(f"[Sync] 从生产环境获取增量更新 - 上次同步时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_sync_time))}")
             
             # 添加SSL验证配置
             ssl_config = {
@@ -372,7 +376,7 @@ class RoadmapService:
                 raise Exception(f"获取生产环境数据失败: HTTP {response.status_code}")
             
             prod_updates = response.json().get('data', [])
-            print(f"[Sync] 收到 {len(prod_updates)} 条生产环境更新")
+            logger.info(f"[Sync] 收到 {len(prod_updates)} 条生产环境更新")
             
             # 2. 获取数据库连接
             conn = self.get_db()
@@ -402,7 +406,7 @@ class RoadmapService:
                             item.get('is_cycle_task', 0), item.get('cycle_duration'), item.get('next_reminder_time'),
                             item['id']
                         ))
-                        print(f"[Sync] 更新本地记录 {item['id']}: 生产环境时间 {item['edittime']} > 本地时间 {local_record['edittime']}")
+                        logger.debug(f"[Sync] 更新本地记录 {item['id']}: 生产环境时间 {item['edittime']} > 本地时间 {local_record['edittime']}")
                     else:
                         cursor.execute('''
                             INSERT INTO roadmap (id, name, description, status, color,
@@ -415,7 +419,7 @@ class RoadmapService:
                             item.get('order', 0), item.get('user_id', 1), item.get('is_deleted', 0),
                             item.get('is_cycle_task', 0), item.get('cycle_duration'), item.get('next_reminder_time')
                         ))
-                        print(f"[Sync] 插入新记录 {item['id']}")
+                        logger.debug(f"[Sync] 插入新记录 {item['id']}")
                     stats['from_prod'] += 1
             
             # 4. 获取本地需要同步到生产环境的更新
@@ -434,7 +438,7 @@ class RoadmapService:
             
             # 5. 将本地更新同步到生产环境
             if local_updates:
-                print(f"[Sync] 发现 {len(local_updates)} 条本地更新需要同步到生产环境")
+                logger.debug(f"[Sync] 发现 {len(local_updates)} 条本地更新需要同步到生产环境")
                 
                 sync_url = f"{PROD_SERVER['URL']}/roadmap/api/batch_sync"
                 response = requests.post(
@@ -450,7 +454,7 @@ class RoadmapService:
                 result = response.json()
                 if result.get('code') == 0:
                     stats['to_prod'] = len(local_updates)
-                    print(f"[Sync] 成功同步 {stats['to_prod']} 条记录到生产环境")
+                    logger.info(f"[Sync] 成功同步 {stats['to_prod']} 条记录到生产环境")
                 else:
                     raise Exception(f"同步到生产环境失败: {result.get('msg')}")
             
@@ -458,9 +462,7 @@ class RoadmapService:
             conn.commit()
             self.last_sync_time = int(time.time())
             
-            print(f"[Sync] 双向增量同步完成:")
-            print(f"从生产环境同步: {stats['from_prod']} 条")
-            print(f"同步到生产环境: {stats['to_prod']} 条")
+            logger.info(f"[Sync] 双向增量同步完成: 从生产环境同步 {stats['from_prod']} 条, 同步到生产环境 {stats['to_prod']} 条")
             
             return json.dumps({
                 'code': 0,
@@ -473,7 +475,7 @@ class RoadmapService:
             })
             
         except Exception as e:
-            print(f"[Sync] 同步失败: {str(e)}")
+            logger.error(f"[Sync] 同步失败: {str(e)}")
             if conn:
                 conn.rollback()
             return json.dumps({
@@ -489,11 +491,11 @@ class RoadmapService:
         """提供数据同步接口（仅在生产环境可用）"""
         conn = None
         # 记录请求信息，用于调试
-        print("\n[Sync] ==== 收到同步请求 ====")
-        print(f"[Sync] 远程地址: {request.remote_addr}")
-        print(f"[Sync] 请求方法: {request.method}")
-        print(f"[Sync] 请求路径: {request.path}")
-        print(f"[Sync] 请求头: {dict(request.headers)}")
+        logger.debug("[Sync] ==== 收到同步请求 ====")
+        logger.debug(f"[Sync] 远程地址: {request.remote_addr}")
+        logger.debug(f"[Sync] 请求方法: {request.method}")
+        logger.debug(f"[Sync] 请求路径: {request.path}")
+        logger.debug(f"[Sync] 请求头: {dict(request.headers)}")
         if ENV != 'prod':
             return json.dumps({
                 'code': 403,
@@ -505,7 +507,8 @@ class RoadmapService:
             # 验证API密钥
             api_key = request.headers.get('X-API-Key')
             if not api_key or api_key != PROD_SERVER['API_KEY']:
-                print(f"[Sync] API密钥验证失败: 收到 {api_key}, 期望 {PROD_SERVER['API_KEY']}")
+                # 不记录密钥内容，日志会持久化
+                logger.error(f"[Sync] API密钥验证失败: {'未提供密钥' if not api_key else '密钥不匹配'}, 来源 {request.remote_addr}")
                 return json.dumps({
                     'code': 401,
                     'msg': 'API密钥无效',
@@ -514,7 +517,7 @@ class RoadmapService:
 
             # 获取上次同步时间
             last_sync_time = int(request.headers.get('X-Sync-Time', 0))
-            print(f"[Sync] 收到同步请求，上次同步时间: {last_sync_time}")
+            logger.info(f"[Sync] 收到同步请求，上次同步时间: {last_sync_time}")
             
             # 获取数据库连接
             conn = self.get_db()
@@ -556,7 +559,7 @@ class RoadmapService:
                 conn.close()
                 
         except Exception as e:
-            print(f"[Sync] Error providing sync data: {str(e)}")
+            logger.error(f"[Sync] Error providing sync data: {str(e)}")
             return json.dumps({
                 'code': 500,
                 'msg': f'获取同步数据失败: {str(e)}',
@@ -571,7 +574,7 @@ class RoadmapService:
         2. 距离上次同步超过5分钟
         """
         if ENV == 'local' and time.time() - self.last_sync_time > Roadmap_SYNC_TIME:  # 5分钟同步一次
-            print("[Sync] 自动同步触发")
+            logger.info("[Sync] 自动同步触发")
             return self.sync_from_prod()
         return None
 
@@ -15,7 +15,7 @@ import os
 import hashlib
 from flask import Blueprint, render_template, request, jsonify, send_from_directory, session, redirect, url_for
 import json
-import sqlite3
+from utils import db_connection
 import datetime
 
 def create_route_blueprint():
@@ -60,7 +60,7 @@ route_bp = create_route_blueprint()
 def get_db_connection():
     """获取数据库连接"""
     db_path = os.path.join(os.path.dirname(__file__), 'data.sqlite3')
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn = db_connection.connect(db_path, check_same_thread=False)
     return conn
 
 def get_cursor():
@@ -4,6 +4,7 @@
 from flask import Blueprint, request, render_template, session, redirect, url_for, flash, current_app, jsonify
 from functools import wraps
 import sqlite3
+from utils import db_connection
 import os
 from api import api_registry
 import json
@@ -59,7 +60,7 @@ def admin_required(f):
 
 def get_db_connection():
     """创建数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = db_connection.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -280,7 +281,8 @@ def get_tasks():
     try:
         page = request.args.get('page', type=int)
         limit = request.args.get('limit', type=int)
-        return task_service.get_tasks(page=page, limit=limit)
+        fields = request.args.get('fields')
+        return task_service.get_tasks(page=page, limit=limit, fields=fields)
     except Exception as e:
         logger.error(f"获取任务列表失败: {str(e)}")
         return ResponseHandler.error(
@@ -343,10 +345,11 @@ def player_task_manage():
 @admin_service.admin_required
 @api_response
 def get_player_tasks():
-    """获取玩家任务列表"""
+    """获取玩家任务列表，传入 cursor（上一页的 next_cursor）时按游标翻页"""
     page = request.args.get('page', 1, type=int)
     limit = request.args.get('limit', 20, type=int)
-    return task_service.get_player_tasks(page=page, limit=limit)
+    cursor = request.args.get('cursor', type=int)
+    return task_service.get_player_tasks(page=page, limit=limit, cursor_id=cursor)
 
 @admin_bp.route('/api/player_tasks/<int:task_id>', methods=['GET'])
 @admin_service.admin_required
@@ -635,26 +638,47 @@ def admin_cleanup_notifications():
 @admin_service.admin_required
 @api_response
 def get_check_tasks():
-    """获取待审核任务列表"""
+    """获取待审核任务列表，传入 cursor（上一页的 next_cursor）时按游标翻页，fields 为逗号分隔的返回字段"""
     page = request.args.get('page', 1, type=int)
     limit = request.args.get('limit', 20, type=int)
-    return task_service.get_check_tasks(page=page, limit=limit)
+    cursor = request.args.get('cursor', type=int)
+    fields = request.args.get('fields')
+    return task_service.get_check_tasks(page=page, limit=limit, cursor=cursor, fields=fields)
 
 @admin_bp.route('/api/tasks/history', methods=['GET'])
 @admin_service.admin_required
 @api_response
 def get_task_history():
-    """获取任务历史记录"""
+    """获取任务历史记录，传入 cursor（上一页的 next_cursor）时按游标翻页，fields 为逗号分隔的返回字段"""
     task_id = request.args.get('task_id', type=int)
     player_id = request.args.get('player_id', type=int)
     status = request.args.get('status')
     page = request.args.get('page', 1, type=int)
     limit = request.args.get('limit', 20, type=int)
+    cursor = request.args.get('cursor', type=int)
     return task_service.get_task_history(
         task_id=task_id,
         player_id=player_id,
         status=status,
         page=page,
+        limit=limit,
+        cursor=cursor,
+        fields=request.args.get('fields')
+    )
+
+@admin_bp.route('/api/task_events', methods=['GET'])
+@admin_service.admin_required
+@api_response
+def get_task_events():
+    """获取任务事件历史，传入 cursor（上一页的 next_cursor）继续读取"""
+    player_task_id = request.args.get('player_task_id', type=int)
+    player_id = request.args.get('player_id', type=int)
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', 100, type=int)
+    return task_service.get_task_events(
+        player_task_id=player_task_id,
+        player_id=player_id,
+        after_id=cursor,
         limit=limit
     )
 
@@ -713,6 +737,55 @@ def reject_player_task(player_task_id):
             msg=f"任务驳回失败: {str(e)}"
         )
 
+@admin_bp.route('/api/player_tasks/review', methods=['POST'])
+@admin_service.admin_required
+@api_response
+def review_player_tasks():
+    """批量审核任务
+
+    请求体: {"approve_ids": [...], "reject_ids": [...], "reject_reason": "..."}
+    每个玩家只发送一条通知和一次任务更新事件
+    """
+    data = request.get_json() or {}
+    result = task_service.review_player_tasks(
+        approve_ids=data.get('approve_ids'),
+        reject_ids=data.get('reject_ids'),
+        reject_reason=data.get('reject_reason')
+    )
+    if result.get('code') != 0:
+        return result
+
+    from function.SSEService import sse_service
+    review = result['data']
+    reviewed_ids = {player_id: {'approved': [], 'rejected': []} for player_id in review['players']}
+    for action in ('approved', 'rejected'):
+        for item in review[action]:
+            reviewed_ids[item['player_id']][action].append(item['player_task_id'])
+
+    for player_id, counts in review['players'].items():
+        parts = []
+        if counts['approved']:
+            parts.append(f"{counts['approved']} 个任务已通过审核")
+        if counts['rejected']:
+            parts.append(f"{counts['rejected']} 个任务被驳回")
+        try:
+            notification_service.add_notification({
+                'title': '任务审核结果',
+                'content': f"您有{'，'.join(parts)}",
+                'type': 'task',
+                'target_type': 'player',
+                'target_id': player_id,
+                'extra_data': json.dumps(reviewed_ids[player_id])
+            })
+            sse_service.broadcast_to_room(f'user_{player_id}', 'task_update', {
+                'type': 'TASK_REVIEWED',
+                'approved': counts['approved'],
+                'rejected': counts['rejected']
+            })
+        except Exception as e:
+            logger.error(f"发送批量审核通知失败: player_id={player_id}, {str(e)}")
+    return result
+
 # 添加任务审核页面路由
 @admin_bp.route('/task_check')
 @admin_service.admin_required
@@ -53,6 +53,9 @@ from config.config import (
 # 首先导入服务器管理服务
 from function.ServerService import server_service  # 导入服务器管理服务
 from utils.LogService import log_service  # 导入日志服务
+from utils.MetricsService import metrics_service  # 导入请求指标服务
+from utils.QueryProfiler import query_profiler  # 导入数据库查询分析服务
+from utils.response_handler import FastJSONProvider  # 导入JSON序列化
 
 # 创建 Flask 应用实例
 import os
@@ -62,6 +65,8 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 app = Flask(__name__, static_folder='static', template_folder=os.path.join(BASE_DIR, 'templates'))
 # 设置全局路由配置，不严格要求URL末尾的斜杠
 app.url_map.strict_slashes = False
+# jsonify 使用统一的 JSON 序列化（有 orjson 时使用 orjson）
+app.json = FastJSONProvider(app)
 
 # 立即应用服务器配置
 # app = server_service.configure_app(app)
@@ -78,13 +83,17 @@ from function.GPSService import gps_service
 # RoadmapService现在通过模块集成方式导入
 from function.WeChatService import wechat_service
 from function.SchedulerService import scheduler_service  # 导入调度器服务
+from function.TaskEventService import task_event_service  # 导入任务事件服务
+from function.LeaderboardService import leaderboard_service  # 导入排行榜服务
+from function.RecordRollupService import record_rollup_service  # 导入流水汇总服务
+from function.BootstrapService import bootstrap_service  # 导入首屏数据服务
 from function.SSEService import sse_service  # 替换WebSocketService为SSEService
 from config.private import AMAP_SECURITY_JS_CODE, WECHAT_TOKEN, WECHAT_ENCODING_AES_KEY, WECHAT_APP_ID
 import requests
 from function.NotificationService import notification_service
 from function.MedalService import medal_service
 from function.GameCardService import game_card_service
-from utils.response_handler import ResponseHandler, StatusCode, api_response
+from utils.response_handler import ResponseHandler, StatusCode, api_response, json_response
 from wechat import wechat_bp  # 导入微信蓝图
 if ENV == 'prod':
     from car_park import car_park_bp  # 导入车场蓝图
@@ -159,6 +168,7 @@ except Exception as e:
     traceback.print_exc()
 from function.SecurityService import security_service
 from function.RateLimitService import rate_limit_service
+from function.IdempotencyService import idempotency_service
 from lxml import etree
 
 # 初始化 Flask 应用设置
@@ -179,6 +189,7 @@ sse_service.init_app(app)  # 初始化SSE服务
 
 # 初始化日志服务的WebSocket
 log_service.init_sse(sse_service)  # 初始化日志服务的SSE支持
+log_service.init_access_log(app)  # 注册结构化访问日志钩子
 
 # 为所有现有路由添加日志装饰器，但排除SSE相关路由
 updated_view_functions = {}
@@ -200,6 +211,12 @@ for endpoint, func in app.view_functions.items():
 
 app.view_functions = updated_view_functions
 
+# 注册请求指标钩子和 /metrics 接口（不经过日志装饰器）
+metrics_service.init_sse(sse_service)
+metrics_service.init_app(app)
+metrics_service.add_cache('player', player_service.get_cache_stats)  # 玩家资料缓存命中统计
+query_profiler.init_app(app)  # 请求携带调试头时分析数据库语句
+
 # 添加模板目录配置
 TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
 app.template_folder = TEMPLATE_DIR  # 设置模板目录
@@ -251,18 +268,57 @@ def get_player_api(player_id):
     """获取角色信息"""
     return player_service.get_player(player_id)
 
+@app.route('/api/player/<int:player_id>/bootstrap', methods=['GET'])
+@api_response
+def get_player_bootstrap(player_id):
+    """获取首屏数据，include: 逗号分隔的 player / current_tasks / available_tasks / unread_notifications / wordcloud / medals，默认全部"""
+    return bootstrap_service.get_bootstrap(player_id, request.args.get('include'))
+
+@app.route('/api/player/<int:player_id>/history', methods=['GET'])
+@api_response
+def get_player_history(player_id):
+    """获取玩家积分/经验变化曲线，kind: exp / points，period: day / week，start/end: 时间戳或 YYYY-MM-DD"""
+    return player_service.get_record_history(
+        player_id,
+        request.args.get('kind', 'exp'),
+        request.args.get('period', 'day'),
+        request.args.get('start'),
+        request.args.get('end')
+    )
+
 @app.route('/api/get_players', methods=['GET'])
 @api_response
 def get_players():
     """获取所有玩家"""
     return player_service.get_players()
 
+@app.route('/api/leaderboard/<board>', methods=['GET'])
+@api_response
+def get_leaderboard(board):
+    """获取排行榜前N名，board: points / experience / medals"""
+    limit = request.args.get('limit', 10, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    return leaderboard_service.get_top(board, limit, offset)
+
+@app.route('/api/leaderboard/<board>/player/<int:player_id>', methods=['GET'])
+@api_response
+def get_player_rank(board, player_id):
+    """获取玩家名次及前后玩家"""
+    radius = request.args.get('radius', 2, type=int)
+    return leaderboard_service.get_player_rank(board, player_id, radius)
+
 @app.route('/api/tasks/available/<int:player_id>', methods=['GET'])
 @api_response
 def get_available_tasks(player_id):
     """获取可用任务列表"""
     return task_service.get_available_tasks(player_id)
 
+@app.route('/api/tasks/summary/<int:player_id>', methods=['GET'])
+@api_response
+def get_task_summary(player_id):
+    """获取玩家任务状态汇总"""
+    return task_service.get_task_summary(player_id)
+
 @app.route('/api/tasks/<int:task_id>', methods=['GET'])
 @api_response
 def get_task_by_id(task_id):
@@ -283,6 +339,7 @@ def get_current_tasks(player_id):
 
 @app.route('/api/tasks/accept', methods=['POST'])
 @player_service.player_required
+@idempotency_service.idempotent
 @api_response
 def accept_task():
     """接受任务接口"""
@@ -361,6 +418,7 @@ def abandon_task():
 
 @app.route('/api/tasks/submit', methods=['POST'])
 @player_service.player_required
+@idempotency_service.idempotent
 @api_response
 def submit_task_api():
     """提交任务接口"""
@@ -392,6 +450,7 @@ def submit_task_api():
 
 @app.route('/api/tasks/complete', methods=['POST'])
 @player_service.player_required
+@idempotency_service.idempotent
 @api_response
 def complete_task_api():
     data = request.get_json()
@@ -463,19 +522,20 @@ def clear_logs():
 
 @app.route('/api/logs')
 def get_logs():
-    """获取初始日志数据"""
+    """获取初始日志数据，支持 cursor/limit 游标分页，下一页游标通过 X-Next-Cursor 响应头返回"""
     method_filter = request.args.get('method', '').upper()
     path_filter = request.args.get('path', '')
+    status_filter = request.args.get('status', type=int)
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', log_service.MAX_LOGS, type=int)
 
-    filtered_logs = request_logs
-    if method_filter:
-        filtered_logs = [
-            log for log in filtered_logs if log['method'] == method_filter]
-    if path_filter:
-        filtered_logs = [
-            log for log in filtered_logs if path_filter in log['path']]
-
-    return json.dumps(filtered_logs)
+    page = log_service.get_request_logs_page(
+        method_filter, path_filter, status_filter, cursor=cursor, limit=limit
+    )
+    response = json_response(page['logs'])
+    if page['next_cursor'] is not None:
+        response.headers['X-Next-Cursor'] = str(page['next_cursor'])
+    return response
     
 # 如果需要自定义静态文件路由
 @app.route('/static/<path:path>')
@@ -495,17 +555,18 @@ def send_static(path):
         ))
 
 @app.route('/api/nfc_post', methods=['POST'])
+@idempotency_service.idempotent
 def handle_nfc_card():
     try:
-        print("\n[NFC API] ====== 开始处理NFC卡片请求 ======")
+        logger.debug("[NFC API] ====== 开始处理NFC卡片请求 ======")
         
         # 获取请求数据（支持 JSON 和 Form 格式）
         if request.is_json:
             data = request.json
-            print(f"[NFC API Debug] 接收到JSON数据: {json.dumps(data, ensure_ascii=False)}")
+            logger.debug(f"[NFC API Debug] 接收到JSON数据: {json.dumps(data, ensure_ascii=False)}")
         else:
             data = request.form.to_dict()
-            print(f"[NFC API Debug] 接收到Form数据: {json.dumps(data, ensure_ascii=False)}")
+            logger.debug(f"[NFC API Debug] 接收到Form数据: {json.dumps(data, ensure_ascii=False)}")
         
         # 获取必要参数（不区分大小写）
         card_id = data.get('CARD_ID') or data.get('card_id')
@@ -518,34 +579,34 @@ def handle_nfc_card():
         # 参数验证
         if not card_id or not player_id:
             error_msg = '缺少必要参数: CARD_ID 或 PLAYER_ID'
-            print(f"[NFC API Debug] 错误: {error_msg}")
-            print(f"[NFC API Debug] 收到的数据: card_id={card_id}, player_id={player_id}")
+            logger.error(f"[NFC API Debug] 错误: {error_msg}")
+            logger.debug(f"[NFC API Debug] 收到的数据: card_id={card_id}, player_id={player_id}")
             return json.dumps({
                 'code': 400,
                 'msg': error_msg,
                 'data': None
             }), 400
 
-        print(f"[NFC API Debug] 卡片ID: {card_id}")
-        print(f"[NFC API Debug] 玩家ID: {player_id}")
-        print(f"[NFC API Debug] 设备: {device}")
-        print(f"[NFC API Debug] 时间戳: {timestamp}")
-        print(f"[NFC API Debug] 值: {value}")
-        print(f"[NFC API Debug] 类型: {card_type}")
+        logger.debug(f"[NFC API Debug] 卡片ID: {card_id}")
+        logger.debug(f"[NFC API Debug] 玩家ID: {player_id}")
+        logger.debug(f"[NFC API Debug] 设备: {device}")
+        logger.debug(f"[NFC API Debug] 时间戳: {timestamp}")
+        logger.debug(f"[NFC API Debug] 值: {value}")
+        logger.debug(f"[NFC API Debug] 类型: {card_type}")
 
         # 调用 NFC 服务处理
         from function.NFCService import nfc_service
         response, status_code = nfc_service.handle_nfc_card(card_id, player_id)
 
-        print(f"[NFC API Debug] 处理结果: {json.dumps(response, ensure_ascii=False)}")
-        print("[NFC API] ====== NFC卡片请求处理完成 ======\n")
+        logger.debug(f"[NFC API Debug] 处理结果: {json.dumps(response, ensure_ascii=False)}")
+        logger.debug("[NFC API] ====== NFC卡片请求处理完成 ======")
         
         return response, status_code
 
     except Exception as e:
         error_msg = f'API处理失败: {str(e)}'
-        print(f"[NFC API] 错误: {error_msg}")
-        print(f"[NFC API] 详细错误信息: ", traceback.format_exc())
+        logger.error(f"[NFC API] 错误: {error_msg}")
+        logger.error(f"[NFC API] 详细错误信息", exc_info=True)
 
         if 'player_id' in locals():
             sse_service.broadcast_to_room(f'user_{player_id}', 'nfc_task_update', {
@@ -562,10 +623,10 @@ def handle_nfc_card():
 @app.route('/api/gps/sync', methods=['GET'])
 @api_response
 def sync_gps_records():
-    """提供GPS数据同步接口"""
+    """提供GPS数据同步接口，fields 为逗号分隔的返回字段（如 x,y,addtime）"""
     try:
         limit = request.args.get('limit', 1000, type=int)
-        return gps_service.get_latest_gps_records(limit)
+        return gps_service.get_latest_gps_records(limit, request.args.get('fields'))
     except Exception as e:
         logger.error(f"[GPS] 同步GPS记录失败: {str(e)}")
         return ResponseHandler.error(
@@ -579,7 +640,7 @@ def add_gps():
     """添加GPS记录,针对macroDroid"""
     try:
         data = json.loads(request.data)
-        print(f"[GPS] 获取到数据: {data}") 
+        logger.debug(f"[GPS] 获取到数据: {data}")
         location = data.get('location', '')
         player_id = data.get('player_id')
         
@@ -595,9 +656,9 @@ def add_gps():
         # 将WGS84坐标转换为GCJ02坐标（高德地图坐标系）
         try:
             longitude, latitude = gps_service.wgs84_to_gcj02(longitude, latitude)
-            print(f"[GPS] 坐标转换结果 - 经度: {longitude}, 纬度: {latitude}")
+            logger.debug(f"[GPS] 坐标转换结果 - 经度: {longitude}, 纬度: {latitude}")
         except Exception as e:
-            print(f"[GPS] 坐标转换失败: {str(e)}")
+            logger.error(f"[GPS] 坐标转换失败: {str(e)}")
             # 即使转换失败也继续使用原始坐标
             pass
 
@@ -624,11 +685,11 @@ def add_gps():
             'speed': float(data.get('speed', 0)),    # 速度
             'device_time': timestamp  # 设备采集时间
         }
-        print(f"[GPS] 添加GPS记录: {gps_data}")
+        logger.debug(f"[GPS] 添加GPS记录: {gps_data}")
 
         # 调用 GPS 服务添加记录
         response_data = gps_service.add_gps(gps_data)
-        print(f"[GPS] 添加GPS记录结果: {response_data}")
+        logger.debug(f"[GPS] 添加GPS记录结果: {response_data}")
         
         # 只有在新增GPS记录时才发送 WebSocket 通知
         if (response_data['code'] == 0 and 
@@ -648,7 +709,7 @@ def add_gps():
                 'id': response_data['data']['id']  # 添加记录ID
             }
             
-            print(f"[GPS] 发送新GPS点位更新通知: {socket_data}")
+            logger.debug(f"[GPS] 发送新GPS点位更新通知: {socket_data}")
             sse_service.broadcast_to_room(f'user_{player_id}', 'gps_update', socket_data)
         else:
             # 更新时间的情况
@@ -659,7 +720,7 @@ def add_gps():
                 'accuracy': gps_data['accuracy'],
                 'id': response_data['data']['id']  # 添加记录ID
             }
-            print(f"[GPS] 仅更新时间，发送电量、速度、更新时间：{socket_data}")
+            logger.debug(f"[GPS] 仅更新时间，发送电量、速度、更新时间：{socket_data}")
             sse_service.broadcast_to_room(f'user_{player_id}', 'gps_update', socket_data)
         return response_data
 
@@ -715,9 +776,9 @@ def sync_to_prod(methods=['POST', 'PUT', 'DELETE']):
                         'timeout': PROD_SERVER['TIMEOUT']
                     }
                     
-                    print(f"[Sync] Syncing {request.method} {request.path} to production")
-                    print(f"[Sync] Target URL: {prod_url}")
-                    print(f"[Sync] Headers: {prod_headers}")
+                    logger.debug(f"[Sync] Syncing {request.method} {request.path} to production")
+                    logger.debug(f"[Sync] Target URL: {prod_url}")
+                    logger.debug(f"[Sync] Headers: {prod_headers}")
                     
                     # 发送同步请求
                     sync_response = None
@@ -742,11 +803,11 @@ def sync_to_prod(methods=['POST', 'PUT', 'DELETE']):
                             **ssl_config
                         )
                     
-                    print(f"[Sync] Sync completed with status code: {sync_response.status_code}")
+                    logger.info(f"[Sync] Sync completed with status code: {sync_response.status_code}")
                     if sync_response.status_code != 200:
-                        print(f"[Sync] Error response: {sync_response.text}")
+                        logger.error(f"[Sync] Error response: {sync_response.text}")
                 except Exception as e:
-                    print(f"[Sync] Error syncing to production: {str(e)}")
+                    logger.error(f"[Sync] Error syncing to production: {str(e)}")
                     # 同步失败不影响本地操作
                     pass
             
@@ -762,7 +823,7 @@ def sync_to_prod(methods=['POST', 'PUT', 'DELETE']):
 @app.route('/api/notifications', methods=['GET'])
 @api_response
 def get_notifications():
-    """获取通知列表"""
+    """获取通知列表，fields 为逗号分隔的返回字段"""
     try:
         target_type = request.args.get('target_type', 'all')
         target_id = request.args.get('target_id', type=int)
@@ -773,10 +834,16 @@ def get_notifications():
             target_type=target_type,
             target_id=target_id,
             limit=limit,
-            offset=offset
+            offset=offset,
+            fields=request.args.get('fields')
         )
             
         return ResponseHandler.success(data=notifications)
+    except ValueError as e:
+        return ResponseHandler.error(
+            code=StatusCode.PARAM_ERROR,
+            msg=str(e)
+        )
     except Exception as e:
         return ResponseHandler.error(
             code=StatusCode.NOTIFICATION_NOT_FOUND,
@@ -1085,6 +1152,8 @@ def after_request(response):
     """响应后处理"""
     # 添加安全响应头
     response = security_service.add_security_headers(response)
+    # 添加速率限制响应头
+    response = rate_limit_service.add_rate_limit_headers(response)
     return response
 
 @app.route('/test/nfc')
@@ -1108,6 +1177,24 @@ if __name__ == '__main__':
     except Exception as e:
         logger.error(f"调度器服务启动失败: {str(e)}", exc_info=True)
         sys.exit(1)
+
+    try:
+        # 启动任务事件分发
+        task_event_service.start(task_service.db_path)
+    except Exception as e:
+        logger.error(f"任务事件分发启动失败: {str(e)}", exc_info=True)
+
+    try:
+        # 加载排行榜并启动定期重建
+        leaderboard_service.start(task_service.db_path)
+    except Exception as e:
+        logger.error(f"排行榜服务启动失败: {str(e)}", exc_info=True)
+
+    try:
+        # 创建积分/经验流水汇总，首次启动时回填全部流水
+        record_rollup_service.start(task_service.db_path)
+    except Exception as e:
+        logger.error(f"流水汇总初始化失败: {str(e)}", exc_info=True)
     
     logger.info(f"服务器配置 - IP: {SERVER_IP}, 端口: {'%d(HTTPS)' % HTTPS_PORT if HTTPS_ENABLED else '%d(HTTP)' % PORT}, 调试模式: {DEBUG}")
     
@@ -1125,6 +1212,8 @@ if __name__ == '__main__':
         try:
             # 停止服务
             scheduler_service.stop()
+            task_event_service.stop()
+            leaderboard_service.stop()
             server_service.stop()
             logger.info("服务器关闭完成")
         except Exception as e:
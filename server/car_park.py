@@ -13,7 +13,7 @@ import logging
 from utils.response_handler import ResponseHandler, StatusCode, api_response
 import xml.etree.ElementTree as ET
 from lxml import etree  # 添加此导入
-import sqlite3
+from utils import db_connection
 import hashlib
 import time
 import requests
@@ -397,7 +397,7 @@ class QYWeChatService:
                     return "车牌号不能为空"
                 
                 # 检查原车牌是否存在并获取车主姓名
-                conn = sqlite3.connect(DB_PATH)
+                conn = db_connection.connect(DB_PATH)
                 cursor = conn.cursor()
                 
                 # 检查原车牌是否存在
@@ -535,7 +535,7 @@ class QYWeChatService:
         :return: 查询结果
         """
         try:
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
 
             if is_name:
@@ -649,7 +649,7 @@ class QYWeChatService:
             car_number = parts[1].strip().upper()  # 车牌号转大写
 
             # 连接数据库
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
 
             try:
@@ -719,7 +719,7 @@ class QYWeChatService:
         """
         # 更新Sys_Park_Plate表的pRemark字段 将content中的车牌号和备注内容分开
         try:
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
 
             # 解析内容
@@ -826,7 +826,7 @@ class QYWeChatService:
                 from_user = "ShengTieXiaJiuJingGuoMinBan"
                 
             # 从数据库查询车辆信息
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
             try:
                 # 查询车主信息，先查询车辆
@@ -1120,7 +1120,7 @@ class QYWeChatService:
         """
         try:
             # 连接sqlite数据库
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
             
             try:
@@ -1206,7 +1206,7 @@ class QYWeChatService:
             str: 格式化的记录信息
         """
         try:
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
             
             # 查询最近的续期和修改记录
@@ -1492,7 +1492,7 @@ def save_car_park_info(car_info: dict) -> bool:
     :return: 是否保存成功
     """
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = db_connection.connect(DB_PATH)
         cursor = conn.cursor()
         
         # 检查审批单号是否已经存在
@@ -1576,7 +1576,7 @@ def update_car_park_status(car_number: str, status: str, comment: str = None) ->
     conn = None
     cursor = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = db_connection.connect(DB_PATH)
         cursor = conn.cursor()
 
         # 先获取车主信息
@@ -1650,7 +1650,7 @@ def update_car_park_status(car_number: str, status: str, comment: str = None) ->
 def get_car_park_statistics():
     """获取停车场统计信息"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = db_connection.connect(DB_PATH)
         cursor = conn.cursor()
         current_time = datetime.now()
 
@@ -1912,7 +1912,7 @@ def car_park_review():
     try:
         if request.method == 'GET':
             # 获取待处理的续期请求
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -1993,7 +1993,7 @@ def car_park_info():
             car_number = request.args.get('car_number')
             owner_name = request.args.get('owner_name')
 
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
 
             if car_number or owner_name:
@@ -2087,7 +2087,7 @@ def car_park_info():
             persons = data.get('persons', [])
             plates = data.get('plates', [])
 
-            conn = sqlite3.connect(DB_PATH)
+            conn = db_connection.connect(DB_PATH)
             cursor = conn.cursor()
 
             try:
@@ -2288,7 +2288,7 @@ def client_alive():
 def check_expiring_vehicles():
     """检查即将过期和已过期的车辆并发送提醒"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = db_connection.connect(DB_PATH)
         cursor = conn.cursor()
         logger.info("[Car_Park] 开始检查即将过期和已过期的车辆")
         current_time = datetime.now()
@@ -64,6 +64,46 @@ GPS_CONFIG = {
     'MAX_OPTIMIZATION_LEVEL': 5      # 最大优化级别
 }
 
+# 请求日志采集配置（LogService.log_request）
+REQUEST_LOG = {
+    # 采集级别: off 不记录 / metadata 仅元数据 / sampled 按比例完整采集 / errors 仅错误完整采集 / full 全部完整采集
+    'level': 'errors',
+    'sample_rate': 0.1,   # sampled 级别下完整采集的比例
+    # 按路径前缀覆盖采集级别，最长前缀优先
+    'routes': {
+        '/static/': 'metadata',
+        '/api/gps': 'metadata',
+    }
+}
+
+# 结构化访问日志配置（JSONL，后台线程写入）
+ACCESS_LOG = {
+    'enabled': True,
+    'filename': 'access.jsonl',      # 位于 logs 目录下
+    'max_bytes': 20 * 1024 * 1024,   # 单个文件超过该大小时轮转
+    'rotate_daily': True,            # 每天零点轮转
+    'backup_count': 30,              # 保留的压缩归档数量
+    'exclude_prefixes': ['/static/', '/api/sse']
+}
+
+# 请求指标配置（Prometheus 文本格式）
+METRICS = {
+    'enabled': True,
+    'path': '/metrics',
+    'allowed_ips': ['127.0.0.1'],   # 允许抓取指标的IP，为空时不限制
+}
+
+# 数据库查询分析配置
+DB_PROFILER = {
+    'enabled': True,
+    'header': 'X-Debug-DB-Profile',  # 请求头值为 1 时分析该请求
+    'always_on': False,              # 分析所有请求
+    'background_jobs': False,        # 分析定时任务
+    'slow_ms': 100,                  # 慢语句阈值（毫秒），超过时记录查询计划
+    'n_plus_one_threshold': 5,       # 同形语句在一次请求内执行次数达到该值视为N+1
+    'explain_slow': True
+}
+
 WAITRESS_CONFIG = {
     'THREADS': 4,               # 处理请求的线程数
     'CONNECTION_LIMIT': 1000,   # 最大并发连接数
@@ -123,7 +163,22 @@ SECURITY = {
     'rate_limit': {
         'enabled': True if ENV == 'prod' else False,  # 生产环境启用速率限制
         'limit': 500,  # 每个IP每分钟最大请求数
-        'window': 60   # 时间窗口（秒）
+        'window': 60,  # 时间窗口（秒）
+        'max_keys': 100000,  # 最多跟踪的 (策略, IP) 数量，超出时淘汰最久未访问的
+        # 计数存储: memory 进程内 / shared 同一主机多进程共享（database 目录下的 SQLite WAL 文件）
+        'storage': 'memory',
+        'shared_db': 'rate_limit.db',
+        # 按路由前缀单独限制，最长前缀优先，未指定 window 时使用默认窗口
+        'policies': {
+            '/api/player/login': {'limit': 20, 'window': 60},
+            '/admin/login': {'limit': 20, 'window': 60},
+        }
+    },
+    'idempotency': {
+        'enabled': True,  # 带 Idempotency-Key 请求头的写接口重试时直接返回首次响应
+        'ttl': 86400,  # 已完成请求的响应保留时间（秒）
+        'pending_ttl': 60,  # 处理中标记的最长保留时间（秒），进程异常退出后键可重新使用
+        'db': 'idempotency.db',  # database 目录下的 SQLite WAL 文件，多进程共享
     },
     'headers': {
         'X-Frame-Options': 'SAMEORIGIN',
@@ -132,7 +187,7 @@ SECURITY = {
         'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Requested-With'
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Requested-With, Idempotency-Key'
     },
     'blocked_ips': [
         '0.0.0.0/8',          # 本地网络
@@ -161,6 +216,23 @@ SECURITY = {
         "117.185.253.167",
         "81.69.54.213", "81.69.87.29", "43.135.106.227", "43.135.106.8"  # 企业微信API
     ],
+    # 请求筛查：以下子串会被编译为单个正则，判定结果按路径/User-Agent缓存
+    'screening': {
+        'suspicious_paths': [
+            'wp-', 'wordpress', 'admin', 'setup', 'install',
+            'phpmy', 'mysql', 'sql', 'database',
+            '.env', '.git', '.svn',
+            'shell', 'cmd', 'cgi',
+            'config', 'conf', 'cfg',
+            'php', 'asp', 'aspx', 'jsp'
+        ],
+        'blocked_agents': ['zgrab', 'python-requests', 'curl', 'wget', 'postman'],
+        'cache_size': 4096,        # 判定结果缓存条数
+        'block_threshold': 5,      # block_window 秒内违规达到该次数后屏蔽
+        'block_window': 300,
+        'block_ttl': 3600,         # 屏蔽时长（秒）
+        'max_tracked_ips': 10000   # 违规记录和屏蔽名单的最大IP数
+    },
     'allowed_file_types': [
         '.jpg', '.jpeg', '.png', '.gif', '.ico',
         '.css', '.js', '.map',
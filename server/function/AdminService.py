@@ -3,6 +3,7 @@
 处理管理员相关的业务逻辑
 """
 import sqlite3
+from utils import db_connection
 import hashlib
 import os
 import logging
@@ -33,7 +34,7 @@ class AdminService:
     def get_db_connection(self):
         """创建数据库连接"""
         try:
-            conn = sqlite3.connect(self.DB_PATH)
+            conn = db_connection.connect(self.DB_PATH)
             conn.row_factory = sqlite3.Row
             return conn
         except sqlite3.Error as e:
@@ -0,0 +1,129 @@
+"""
+玩家首屏数据服务
+页面加载时一次请求返回首屏需要的全部数据，代替分别请求玩家信息、当前任务、可用任务、未读通知数、
+词云和勋章列表的多个接口（每个请求都要经过会话检查、安全检查、限流和请求日志，并各自打开数据库连接）。
+
+    player                玩家信息（同 /api/player/<id>）
+    current_tasks         当前任务（同 /api/tasks/current/<id>）
+    available_tasks       可用任务（同 /api/tasks/available/<id>）
+    unread_notifications  未读通知数
+    wordcloud             词云勋章（同 /api/player/<id>/wordcloud）
+    medals                勋章列表第一页（同 /api/medals）
+
+所有部分在同一个连接的同一个读事务中查询，看到的是同一时刻的数据；include 参数可以只取其中几部分。
+玩家信息优先读取玩家缓存，任务定义读取任务目录缓存，这两部分不受读事务约束。
+"""
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Union
+from utils import db_connection
+from utils.response_handler import ResponseHandler, StatusCode
+from function.PlayerService import player_service
+from function.TaskService import task_service
+from function.PlayerTaskStateService import player_task_state_service
+from function.NotificationService import notification_service
+from function.MedalService import medal_service
+
+logger = logging.getLogger(__name__)
+
+SECTIONS = ('player', 'current_tasks', 'available_tasks', 'unread_notifications', 'wordcloud', 'medals')
+
+
+class BootstrapService:
+    _instance = None
+
+    MEDAL_PAGE_SIZE = 20  # 勋章列表返回的数量，与 /api/medals 默认分页一致
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(BootstrapService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.db_path = os.path.join(
+                os.path.dirname(os.path.dirname(__file__)),
+                'database',
+                'game.db'
+            )
+            self.loaders = {
+                'current_tasks': task_service.query_current_tasks,
+                'available_tasks': task_service.query_available_tasks,
+                'unread_notifications': lambda cursor, player_id: notification_service.get_unread_count(
+                    'player', player_id, cursor=cursor
+                ),
+                'wordcloud': medal_service.query_wordcloud_medals,
+                'medals': lambda cursor, player_id: medal_service.query_medals(cursor, 1, self.MEDAL_PAGE_SIZE),
+            }
+            self.initialized = True
+
+    @staticmethod
+    def parse_sections(include: Union[str, Iterable[str], None]) -> List[str]:
+        """解析 include 参数（逗号分隔），为空时返回全部部分；有不支持的部分时抛出 ValueError"""
+        if not include:
+            return list(SECTIONS)
+        if isinstance(include, str):
+            include = include.split(',')
+        sections = []
+        for name in include:
+            name = name.strip()
+            if not name:
+                continue
+            if name not in SECTIONS:
+                raise ValueError(name)
+            if name not in sections:
+                sections.append(name)
+        return sections or list(SECTIONS)
+
+    def get_bootstrap(self, player_id: int, include: Union[str, Iterable[str], None] = None) -> Dict:
+        """获取玩家首屏数据"""
+        try:
+            sections = self.parse_sections(include)
+        except ValueError as e:
+            return ResponseHandler.error(
+                code=StatusCode.PARAM_ERROR,
+                msg=f"不支持的数据: {str(e)}，可选 {', '.join(SECTIONS)}"
+            )
+
+        conn = None
+        try:
+            conn = db_connection.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            if 'available_tasks' in sections:
+                # 首次使用时建表需要写事务，放在读事务之前完成
+                player_task_state_service.ensure_schema(cursor)
+
+            cursor.execute('BEGIN')
+            try:
+                player = player_service.query_player(cursor, player_id)
+                if not player:
+                    return ResponseHandler.error(
+                        code=StatusCode.USER_NOT_FOUND,
+                        msg="玩家不存在"
+                    )
+                data = {}
+                for name in sections:
+                    data[name] = player if name == 'player' else self.loaders[name](cursor, player_id)
+            finally:
+                conn.rollback()  # 只读事务，结束即可
+
+            return ResponseHandler.success(
+                data=data,
+                msg="获取首屏数据成功"
+            )
+
+        except sqlite3.Error as e:
+            logger.error(f"获取首屏数据失败: {str(e)}")
+            return ResponseHandler.error(
+                code=StatusCode.SERVER_ERROR,
+                msg=f"获取首屏数据失败: {str(e)}"
+            )
+        finally:
+            if conn:
+                conn.close()
+
+
+# 创建首屏数据服务实例
+bootstrap_service = BootstrapService()
@@ -3,6 +3,7 @@ GPS服务模块
 处理GPS相关的业务逻辑
 """
 import sqlite3
+from utils import db_connection
 import os
 import logging
 import time
@@ -14,6 +15,7 @@ from flask import request
 import json
 from typing import Dict, List, Optional, Tuple
 from utils.response_handler import ResponseHandler, StatusCode
+from utils.field_projection import parse_fields, select_columns, table_columns
 
 logger = logging.getLogger(__name__)
 
@@ -108,7 +110,7 @@ class GPSService:
 
     def get_db(self):
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
@@ -697,19 +699,27 @@ class GPSService:
             if conn:
                 conn.close()
 
-    def get_latest_gps_records(self, limit=1000) -> Dict:
+    def get_latest_gps_records(self, limit=1000, fields=None) -> Dict:
         """获取最新的GPS记录
         
         Args:
             limit: 限制返回的记录数量，默认1000条
+            fields: 返回的字段（逗号分隔），默认全部；只查询需要的列
         """
+        conn = None
         try:
             conn = self.get_db()
             cursor = conn.cursor()
             
+            try:
+                fields = parse_fields(fields)
+                select_list = select_columns(fields, table_columns(cursor, 'GPS')) if fields else '*'
+            except ValueError as e:
+                return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=str(e))
+
             # 获取最新的GPS记录
-            cursor.execute('''
-                SELECT * FROM GPS 
+            cursor.execute(f'''
+                SELECT {select_list} FROM GPS 
                 ORDER BY addtime DESC 
                 LIMIT ?
             ''', (limit,))
@@ -11,6 +11,7 @@
 import os
 import time
 import sqlite3
+from utils import db_connection
 from typing import Dict, List, Optional, Union
 from utils.response_handler import ResponseHandler, StatusCode
 
@@ -25,7 +26,7 @@ class GameCardService:
     
     def get_db_connection(self) -> sqlite3.Connection:
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
     
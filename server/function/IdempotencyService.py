@@ -0,0 +1,258 @@
+"""
+幂等请求服务模块
+客户端在写接口请求头中携带 Idempotency-Key 时，首次请求的响应按 (接口, 玩家, 键) 保存一段时间，
+网络不稳定导致的重试直接返回保存的响应，不再重复执行任务奖励、扣积分、SSE 推送等操作。
+
+    首次请求     写入“处理中”标记后执行接口，完成后保存响应
+    并发重试     首次请求尚未完成，返回 409，客户端稍后重试
+    完成后重试   直接返回保存的响应，附加 Idempotent-Replayed 响应头
+    键被复用     同一个键对应的请求内容不同，返回 422
+
+服务器错误（HTTP 5xx 或 code 为服务器错误/系统繁忙）不保存，释放键后客户端可以用同一个键重试。
+记录保存在 database 目录下单独的 SQLite WAL 文件中，与业务数据库的写锁互不影响，多进程共享。
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from typing import Optional
+from flask import Response, make_response, request, session
+from config.config import SECURITY
+from utils.response_handler import ResponseHandler, StatusCode
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+# 记录状态
+STATE_PENDING = 0
+STATE_DONE = 1
+
+
+class IdempotencyService:
+    """幂等请求服务类"""
+    _instance = None
+
+    MAX_KEY_LENGTH = 128  # 幂等键最大长度
+    MAX_BODY_SIZE = 64 * 1024  # 超过该大小的响应不保存
+    PRUNE_INTERVAL = 60  # 清理过期记录的间隔（秒）
+    RETRY_AFTER = 1  # 首次请求处理中时建议客户端等待的秒数
+    # 这些业务码表示请求未生效，不保存响应
+    RETRYABLE_CODES = frozenset((StatusCode.SERVER_ERROR, StatusCode.SYSTEM_BUSY))
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(IdempotencyService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """初始化幂等请求服务"""
+        if not hasattr(self, 'initialized'):
+            config = SECURITY.get('idempotency', {})
+            self.enabled = config.get('enabled', True)
+            self.ttl = config.get('ttl', 86400)
+            self.pending_ttl = config.get('pending_ttl', 60)
+            self.db_path = os.path.join(
+                os.path.dirname(os.path.dirname(__file__)),
+                'database',
+                config.get('db', 'idempotency.db')
+            )
+            self._conn = None
+            self._lock = threading.Lock()
+            self._next_prune = 0
+            self.initialized = True
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """首次使用时打开数据库连接并建表"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS idempotency_key (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    state INTEGER NOT NULL,
+                    status_code INTEGER,
+                    mimetype TEXT,
+                    body BLOB,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (scope, key)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_key_expires ON idempotency_key(expires_at)')
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _scope() -> str:
+        """幂等键的作用范围：接口 + 当前登录玩家"""
+        return f"{request.endpoint}:{session.get('player_id', '')}"
+
+    @staticmethod
+    def _fingerprint() -> str:
+        """请求内容摘要，用于发现同一个键被用于不同的请求"""
+        digest = hashlib.sha256()
+        digest.update(request.method.encode())
+        digest.update(b' ')
+        digest.update(request.full_path.encode())
+        digest.update(b'\n')
+        digest.update(request.get_data(cache=True))
+        return digest.hexdigest()
+
+    def _reserve(self, scope: str, key: str, fingerprint: str, now: float) -> Optional[tuple]:
+        """写入处理中标记
+
+        Returns:
+            None 表示标记写入成功，由本次请求执行接口；否则返回已有记录
+            (fingerprint, state, status_code, mimetype, body)
+        """
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'DELETE FROM idempotency_key WHERE scope = ? AND key = ? AND expires_at <= ?',
+                    (scope, key, now)
+                )
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO idempotency_key
+                        (scope, key, fingerprint, state, created_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (scope, key, fingerprint, STATE_PENDING, now, now + self.pending_ttl))
+                existing = None
+                if cursor.rowcount == 0:
+                    existing = conn.execute('''
+                        SELECT fingerprint, state, status_code, mimetype, body
+                        FROM idempotency_key WHERE scope = ? AND key = ?
+                    ''', (scope, key)).fetchone()
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+            if now >= self._next_prune:
+                self._next_prune = now + self.PRUNE_INTERVAL
+                self._prune(now)
+        return existing
+
+    def _complete(self, scope: str, key: str, response: Response, now: float) -> None:
+        """保存首次请求的响应"""
+        with self._lock:
+            self._get_conn().execute('''
+                UPDATE idempotency_key
+                SET state = ?, status_code = ?, mimetype = ?, body = ?, expires_at = ?
+                WHERE scope = ? AND key = ?
+            ''', (
+                STATE_DONE, response.status_code, response.mimetype, response.get_data(),
+                now + self.ttl, scope, key
+            ))
+
+    def _release(self, scope: str, key: str) -> None:
+        """删除处理中标记，客户端可以用同一个键重试"""
+        try:
+            with self._lock:
+                self._get_conn().execute(
+                    'DELETE FROM idempotency_key WHERE scope = ? AND key = ? AND state = ?',
+                    (scope, key, STATE_PENDING)
+                )
+        except sqlite3.Error as e:
+            # 未删除的标记在 pending_ttl 后过期
+            logger.warning(f"释放幂等请求记录失败: {str(e)}")
+
+    def _prune(self, now: float) -> None:
+        """删除过期记录"""
+        try:
+            self._conn.execute('DELETE FROM idempotency_key WHERE expires_at <= ?', (now,))
+        except sqlite3.Error as e:
+            logger.warning(f"清理幂等请求记录失败: {str(e)}")
+
+    def _should_store(self, response: Response) -> bool:
+        """请求已生效的响应才保存，服务器错误允许用同一个键重试"""
+        if response.status_code >= 500 or response.is_streamed:
+            return False
+        if response.content_length is not None and response.content_length > self.MAX_BODY_SIZE:
+            return False
+        if response.is_json:
+            payload = getattr(response, 'json_payload', None) or response.get_json(silent=True)
+            if isinstance(payload, dict) and payload.get('code') in self.RETRYABLE_CODES:
+                return False
+        return True
+
+    @staticmethod
+    def _error(http_status: int, code: int, msg: str, headers: dict = None) -> Response:
+        response = make_response(json.dumps(ResponseHandler.error(code=code, msg=msg), ensure_ascii=False))
+        response.mimetype = 'application/json'
+        response.status_code = http_status
+        if headers:
+            response.headers.update(headers)
+        return response
+
+    def idempotent(self, f):
+        """幂等接口装饰器
+
+        放在认证装饰器之后（内层），未携带 Idempotency-Key 的请求按原逻辑处理。
+        """
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not self.enabled or not key:
+                return f(*args, **kwargs)
+            if len(key) > self.MAX_KEY_LENGTH:
+                return self._error(400, StatusCode.PARAM_ERROR, f'{IDEMPOTENCY_HEADER} 长度不能超过 {self.MAX_KEY_LENGTH}')
+
+            scope = self._scope()
+            fingerprint = self._fingerprint()
+            try:
+                existing = self._reserve(scope, key, fingerprint, time.time())
+            except sqlite3.Error as e:
+                # 幂等存储不可用时按普通请求处理，不影响接口本身
+                logger.warning(f"写入幂等请求记录失败: {str(e)}")
+                return f(*args, **kwargs)
+
+            if existing is not None:
+                stored_fingerprint, state, status_code, mimetype, body = existing
+                if stored_fingerprint != fingerprint:
+                    return self._error(422, StatusCode.PARAM_ERROR, f'{IDEMPOTENCY_HEADER} 已用于其他请求')
+                if state == STATE_PENDING:
+                    return self._error(
+                        409, StatusCode.SYSTEM_BUSY, '相同请求正在处理中，请稍后重试',
+                        {'Retry-After': str(self.RETRY_AFTER)}
+                    )
+                logger.info(f"[Idempotency] 重复请求直接返回已保存的响应: {scope} {key}")
+                response = Response(body, status=status_code, mimetype=mimetype)
+                response.headers[REPLAYED_HEADER] = 'true'
+                return response
+
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                self._release(scope, key)
+                raise
+
+            if not self._should_store(response):
+                self._release(scope, key)
+                return response
+            try:
+                self._complete(scope, key, response, time.time())
+            except sqlite3.Error as e:
+                logger.warning(f"保存幂等请求响应失败: {str(e)}")
+                self._release(scope, key)
+            return response
+        return decorated_function
+
+    def clear(self) -> None:
+        """清空所有记录"""
+        with self._lock:
+            self._get_conn().execute('DELETE FROM idempotency_key')
+
+
+# 创建幂等请求服务实例
+idempotency_service = IdempotencyService()
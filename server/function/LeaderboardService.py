@@ -0,0 +1,451 @@
+"""
+排行榜服务模块
+在内存中按积分、经验、勋章数维护有序榜单，查询前 N 名和“我的名次及前后玩家”不再扫描 player_data。
+
+    points      player_data.points
+    experience  player_data.experience
+    medals      player_medal 中每个玩家的勋章数
+
+每个榜单保存按 (-分数, 玩家ID) 排序的有序表（sortedcontainers.SortedList）和 玩家ID -> 分数 的字典，
+更新分数、名次和位置查询都是 O(log n)；未安装 sortedcontainers 时退化为列表加二分查找（更新 O(n)）。
+奖励发放、商店购买、NFC 积分卡/勋章卡等写入路径在事务提交后从数据库读取玩家的当前分数更新榜单
+（回滚时丢弃；不累加增量，避免与同时进行的重建重复计算），后台线程定期从数据库重建榜单以纠正遗漏的
+写入（如其他进程、直接修改数据库），并把榜单和玩家名持久化到 leaderboard_snapshot 表，启动时数据库
+暂时不可读则先从快照恢复。
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+from utils import db_connection
+from utils.response_handler import ResponseHandler, StatusCode
+
+try:
+    from sortedcontainers import SortedList
+except ImportError:  # 未安装 sortedcontainers 时使用列表加二分查找
+    SortedList = None
+
+logger = logging.getLogger(__name__)
+
+BOARDS = ('points', 'experience', 'medals')
+
+# 榜单 -> 读取单个玩家当前分数的语句，玩家不存在时没有结果
+SCORE_QUERIES = {
+    'points': 'SELECT IFNULL(points, 0) FROM player_data WHERE player_id = ?',
+    'experience': 'SELECT IFNULL(experience, 0) FROM player_data WHERE player_id = ?',
+    'medals': '''
+        SELECT COUNT(pm.medal_id)
+        FROM player_data pd
+        LEFT JOIN player_medal pm ON pm.player_id = pd.player_id
+        WHERE pd.player_id = ?
+        GROUP BY pd.player_id
+    ''',
+}
+
+
+class _BisectList:
+    """SortedList 的替代实现：有序列表加二分查找，插入和删除 O(n)"""
+    __slots__ = ('_items',)
+
+    def __init__(self, iterable: Iterable = ()):
+        self._items = sorted(iterable)
+
+    def add(self, value) -> None:
+        insort(self._items, value)
+
+    def remove(self, value) -> None:
+        del self._items[bisect_left(self._items, value)]
+
+    def bisect_left(self, value) -> int:
+        return bisect_left(self._items, value)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class Leaderboard:
+    """单个有序榜单，非线程安全，由 LeaderboardService 加锁访问"""
+    __slots__ = ('entries', 'scores')
+
+    def __init__(self, scores: Optional[Dict[int, int]] = None):
+        self.scores: Dict[int, int] = dict(scores or {})
+        entries = ((-score, player_id) for player_id, score in self.scores.items())
+        self.entries = SortedList(entries) if SortedList is not None else _BisectList(entries)
+
+    def set(self, player_id: int, score: int) -> None:
+        old = self.scores.get(player_id)
+        if old == score:
+            return
+        if old is not None:
+            self.entries.remove((-old, player_id))
+        self.scores[player_id] = score
+        self.entries.add((-score, player_id))
+
+    def remove(self, player_id: int) -> None:
+        old = self.scores.pop(player_id, None)
+        if old is not None:
+            self.entries.remove((-old, player_id))
+
+    def position_of(self, player_id: int, score: int) -> int:
+        """玩家在榜单中的位置（从 0 开始）"""
+        return self.entries.bisect_left((-score, player_id))
+
+    def rank_of(self, score: int) -> int:
+        """分数对应的名次，同分同名次"""
+        return self.entries.bisect_left((-score, -1)) + 1
+
+    def slice(self, start: int, stop: int) -> List[Tuple[int, int, int]]:
+        """按位置取 [start, stop) 的 (名次, 玩家ID, 分数)"""
+        result = []
+        for neg_score, player_id in self.entries[max(start, 0):stop]:
+            result.append((self.rank_of(-neg_score), player_id, -neg_score))
+        return result
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class LeaderboardService:
+    _instance = None
+
+    REBUILD_INTERVAL = 300  # 从数据库重建榜单的间隔（秒）
+    PERSIST_INTERVAL = 60  # 榜单有变化时持久化的间隔（秒）
+    MAX_LIMIT = 100  # 单次查询的最大条数
+    MAX_RADIUS = 20  # “我的名次”前后最多返回的玩家数
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LeaderboardService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.db_path = os.path.join(
+                os.path.dirname(os.path.dirname(__file__)),
+                'database',
+                'game.db'
+            )
+            self._lock = threading.Lock()
+            self._boards: Optional[Dict[str, Leaderboard]] = None
+            self._names: Dict[int, str] = {}
+            self._dirty = False
+            self._stop_event = threading.Event()
+            self._thread = None
+            self.is_running = False
+            self.initialized = True
+
+    # ---- 加载与持久化 ----
+
+    @staticmethod
+    def _ensure_snapshot_table(cursor) -> None:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leaderboard_snapshot (
+                board TEXT NOT NULL,
+                player_id INTEGER NOT NULL,
+                score INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL,
+                player_name TEXT,
+                PRIMARY KEY (board, player_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('PRAGMA table_info(leaderboard_snapshot)')
+        if 'player_name' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE leaderboard_snapshot ADD COLUMN player_name TEXT')
+
+    def rebuild(self) -> None:
+        """从数据库重建全部榜单
+
+        读取和替换在同一把锁内完成。期间提交的写入在重建完成后由 _refresh 重新读取分数，
+        读到的已提交值与重建结果一致或更新，不会重复计算。
+        """
+        conn = db_connection.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            with self._lock:
+                cursor.execute('SELECT player_id, player_name, IFNULL(points, 0), IFNULL(experience, 0) FROM player_data')
+                points, experience, names = {}, {}, {}
+                for player_id, player_name, player_points, player_exp in cursor.fetchall():
+                    points[player_id] = player_points
+                    experience[player_id] = player_exp
+                    names[player_id] = player_name
+                cursor.execute('''
+                    SELECT pd.player_id, COUNT(pm.medal_id)
+                    FROM player_data pd
+                    LEFT JOIN player_medal pm ON pm.player_id = pd.player_id
+                    GROUP BY pd.player_id
+                ''')
+                medals = dict(cursor.fetchall())
+                self._boards = {
+                    'points': Leaderboard(points),
+                    'experience': Leaderboard(experience),
+                    'medals': Leaderboard(medals),
+                }
+                self._names = names
+                self._dirty = True
+        finally:
+            conn.close()
+        logger.debug(f"排行榜已重建: {len(points)} 名玩家")
+
+    def load_snapshot(self) -> bool:
+        """从持久化快照恢复榜单，没有快照时返回 False"""
+        conn = db_connection.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            self._ensure_snapshot_table(cursor)
+            conn.commit()
+            cursor.execute('SELECT board, player_id, score, player_name FROM leaderboard_snapshot')
+            scores = {board: {} for board in BOARDS}
+            names = {}
+            for board, player_id, score, player_name in cursor.fetchall():
+                if board in scores:
+                    scores[board][player_id] = score
+                    if player_name is not None:
+                        names[player_id] = player_name
+        finally:
+            conn.close()
+        if not any(scores.values()):
+            return False
+        with self._lock:
+            self._boards = {board: Leaderboard(board_scores) for board, board_scores in scores.items()}
+            self._names = names
+        return True
+
+    def persist(self) -> None:
+        """榜单有变化时写入 leaderboard_snapshot"""
+        with self._lock:
+            if not self._dirty or self._boards is None:
+                return
+            rows = [
+                (board, player_id, score, self._names.get(player_id))
+                for board, leaderboard in self._boards.items()
+                for player_id, score in leaderboard.scores.items()
+            ]
+            self._dirty = False
+
+        now = int(time.time())
+
+        def write(cursor):
+            self._ensure_snapshot_table(cursor)
+            cursor.execute('DELETE FROM leaderboard_snapshot')
+            cursor.executemany(
+                '''
+                INSERT INTO leaderboard_snapshot (board, player_id, score, player_name, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ''',
+                [row + (now,) for row in rows]
+            )
+
+        conn = db_connection.connect(self.db_path)
+        try:
+            db_connection.run_immediate(conn, write)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            raise
+        finally:
+            conn.close()
+
+    def _ensure_loaded(self) -> Dict[str, Leaderboard]:
+        boards = self._boards
+        if boards is None:
+            self.rebuild()
+            boards = self._boards
+        return boards
+
+    # ---- 后台线程 ----
+
+    def start(self, db_path: str) -> None:
+        """加载榜单并启动定期重建/持久化线程"""
+        if self.is_running:
+            return
+        self.db_path = db_path
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.error(f"排行榜重建失败，尝试从快照恢复: {str(e)}")
+            if not self.load_snapshot():
+                raise
+        self.is_running = True
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info("排行榜服务已启动")
+
+    def stop(self) -> None:
+        self.is_running = False
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.persist()
+        except Exception as e:
+            logger.error(f"排行榜持久化失败: {str(e)}")
+
+    def _run(self) -> None:
+        next_rebuild = time.monotonic() + self.REBUILD_INTERVAL
+        while not self._stop_event.wait(self.PERSIST_INTERVAL):
+            try:
+                if time.monotonic() >= next_rebuild:
+                    next_rebuild = time.monotonic() + self.REBUILD_INTERVAL
+                    self.rebuild()
+                self.persist()
+            except Exception as e:
+                logger.error(f"排行榜维护失败: {str(e)}")
+
+    # ---- 增量更新 ----
+
+    def _apply(self, changes: List[Tuple[str, str, int, int]]) -> None:
+        with self._lock:
+            boards = self._boards
+            if boards is None:
+                # 尚未加载时不维护，首次查询时整体加载
+                return
+            for op, board, player_id, value in changes:
+                leaderboard = boards[board]
+                if op == 'add':
+                    if player_id not in leaderboard.scores:
+                        # 榜单里没有的玩家等待下次重建，避免凭增量凭空生成分数
+                        continue
+                    leaderboard.set(player_id, leaderboard.scores[player_id] + value)
+                else:
+                    leaderboard.set(player_id, value)
+            self._dirty = True
+
+    def _refresh(self, conn, keys: List[Tuple[str, int]]) -> None:
+        """事务提交后从数据库读取玩家的当前分数更新榜单
+
+        读取和更新与 rebuild 在同一把锁内互斥进行，榜单得到的总是读取时已提交的值：提交早于重建读取时
+        两者读到同一个值，晚于重建时覆盖重建结果，不会像在提交后累加增量那样被重建重复计算。
+        """
+        with self._lock:
+            boards = self._boards
+            if boards is None:
+                # 尚未加载时不维护，首次查询时整体加载
+                return
+            cursor = conn.cursor()
+            for board, player_id in keys:
+                cursor.execute(SCORE_QUERIES[board], (player_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    # 玩家不存在（已删除），由 remove_player 或下次重建处理
+                    continue
+                boards[board].set(player_id, row[0])
+            self._dirty = True
+
+    def _submit(self, changes: List[Tuple[str, str, int, int]], cursor=None) -> None:
+        # NFC 等接口传入的玩家ID可能是字符串
+        changes = [(op, board, int(player_id), value) for op, board, player_id, value in changes]
+        if cursor is not None:
+            conn = cursor.connection
+            keys = [(board, player_id) for _, board, player_id, _ in changes]
+            db_connection.after_commit(conn, lambda: self._refresh(conn, keys))
+        else:
+            self._apply(changes)
+
+    def set_score(self, board: str, player_id: int, score: int, cursor=None) -> None:
+        """设置玩家在榜单上的分数；传入 cursor 时在事务提交后改为读取数据库中的当前分数"""
+        self._submit([('set', board, player_id, int(score))], cursor)
+
+    def add_score(self, board: str, player_id: int, delta: int, cursor=None) -> None:
+        """增减玩家在榜单上的分数；传入 cursor 时在事务提交后改为读取数据库中的当前分数"""
+        if delta:
+            self._submit([('add', board, player_id, int(delta))], cursor)
+
+    def add_player(self, player_id: int, player_name: str, points: int = 0, cursor=None) -> None:
+        """新玩家加入所有榜单"""
+        def apply():
+            with self._lock:
+                self._names[player_id] = player_name
+            self._apply([('set', 'points', player_id, int(points or 0)),
+                         ('set', 'experience', player_id, 0),
+                         ('set', 'medals', player_id, 0)])
+        if cursor is not None:
+            db_connection.after_commit(cursor.connection, apply)
+        else:
+            apply()
+
+    def rename_player(self, player_id: int, player_name: str) -> None:
+        with self._lock:
+            if player_id in self._names:
+                self._names[player_id] = player_name
+
+    def remove_player(self, player_id: int) -> None:
+        """从所有榜单移除玩家"""
+        player_id = int(player_id)
+        with self._lock:
+            self._names.pop(player_id, None)
+            if self._boards is None:
+                return
+            for leaderboard in self._boards.values():
+                leaderboard.remove(player_id)
+            self._dirty = True
+
+    # ---- 查询 ----
+
+    def _format(self, rows: List[Tuple[int, int, int]]) -> List[Dict]:
+        return [
+            {'rank': rank, 'player_id': player_id, 'player_name': self._names.get(player_id), 'score': score}
+            for rank, player_id, score in rows
+        ]
+
+    def get_top(self, board: str, limit: int = 10, offset: int = 0) -> Dict:
+        """获取榜单前 N 名"""
+        if board not in BOARDS:
+            return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=f"不支持的排行榜: {board}")
+        limit = max(1, min(int(limit), self.MAX_LIMIT))
+        offset = max(0, int(offset))
+        try:
+            boards = self._ensure_loaded()
+            with self._lock:
+                leaderboard = boards[board]
+                items = self._format(leaderboard.slice(offset, offset + limit))
+                total = len(leaderboard)
+        except Exception as e:
+            logger.error(f"获取排行榜失败: {str(e)}")
+            return ResponseHandler.error(code=StatusCode.SERVER_ERROR, msg=f"获取排行榜失败: {str(e)}")
+        return ResponseHandler.success(
+            data={'board': board, 'total': total, 'items': items},
+            msg="获取排行榜成功"
+        )
+
+    def get_player_rank(self, board: str, player_id: int, radius: int = 2) -> Dict:
+        """获取玩家的名次及前后各 radius 名玩家"""
+        if board not in BOARDS:
+            return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=f"不支持的排行榜: {board}")
+        radius = max(0, min(int(radius), self.MAX_RADIUS))
+        player_id = int(player_id)
+        try:
+            boards = self._ensure_loaded()
+            with self._lock:
+                leaderboard = boards[board]
+                score = leaderboard.scores.get(player_id)
+                if score is None:
+                    return ResponseHandler.error(code=StatusCode.PLAYER_NOT_FOUND, msg="玩家不存在")
+                position = leaderboard.position_of(player_id, score)
+                neighbors = self._format(leaderboard.slice(position - radius, position + radius + 1))
+                total = len(leaderboard)
+                rank = leaderboard.rank_of(score)
+        except Exception as e:
+            logger.error(f"获取玩家排名失败: {str(e)}")
+            return ResponseHandler.error(code=StatusCode.SERVER_ERROR, msg=f"获取玩家排名失败: {str(e)}")
+        return ResponseHandler.success(
+            data={
+                'board': board,
+                'player_id': player_id,
+                'rank': rank,
+                'score': score,
+                'total': total,
+                'neighbors': neighbors
+            },
+            msg="获取玩家排名成功"
+        )
+
+
+# 创建排行榜服务实例
+leaderboard_service = LeaderboardService()
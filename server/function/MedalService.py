@@ -11,6 +11,7 @@
 import os
 import time
 import sqlite3
+from utils import db_connection
 from typing import Dict, List, Optional, Union
 from utils.response_handler import ResponseHandler, StatusCode
 
@@ -25,10 +26,35 @@ class MedalService:
     
     def get_db_connection(self) -> sqlite3.Connection:
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
     
+    def query_medals(self, cursor, page: int = 1, limit: int = 20) -> Dict:
+        """
+        在调用方的连接上查询勋章列表
+        :return: {'items': 勋章列表, 'total': 总数}
+        """
+        # 计算偏移量
+        offset = (page - 1) * limit
+        
+        # 获取总数
+        cursor.execute('SELECT COUNT(*) FROM medal')
+        total = cursor.fetchone()[0]
+        
+        # 获取分页数据
+        cursor.execute('''
+            SELECT id, name, description, addtime, icon, conditions
+            FROM medal 
+            ORDER BY id DESC 
+            LIMIT ? OFFSET ?
+        ''', (limit, offset))
+        
+        return {
+            'items': [dict(row) for row in cursor.fetchall()],
+            'total': total
+        }
+
     def get_medals(self, page: int = 1, limit: int = 20) -> Dict:
         """
         获取勋章列表
@@ -38,30 +64,8 @@ class MedalService:
         """
         try:
             conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # 计算偏移量
-            offset = (page - 1) * limit
-            
-            # 获取总数
-            cursor.execute('SELECT COUNT(*) FROM medal')
-            total = cursor.fetchone()[0]
-            
-            # 获取分页数据
-            cursor.execute('''
-                SELECT id, name, description, addtime, icon, conditions
-                FROM medal 
-                ORDER BY id DESC 
-                LIMIT ? OFFSET ?
-            ''', (limit, offset))
-            
-            medals = [dict(row) for row in cursor.fetchall()]
-            
             return ResponseHandler.success(
-                data={
-                    'items': medals,
-                    'total': total
-                },
+                data=self.query_medals(conn.cursor(), page, limit),
                 msg='获取勋章列表成功'
             )
         except Exception as e:
@@ -255,6 +259,20 @@ class MedalService:
                 msg=f'获取图标列表失败: {str(e)}'
             )
 
+    def query_wordcloud_medals(self, cursor, player_id: int) -> List[tuple]:
+        """
+        在调用方的连接上查询玩家正在展示的勋章
+        :return: [(勋章名称, 等级)]
+        """
+        # 联合查询获取正在展示的勋章名称
+        cursor.execute('''
+            SELECT m.name, pm.level
+            FROM player_medal pm
+            JOIN medal m ON pm.medal_id = m.id
+            WHERE pm.show = 1 AND pm.player_id = ?
+        ''', (player_id,))
+        return [(row['name'], row['level']) for row in cursor.fetchall()]
+
     def get_wordcloud_medals(self, player_id: int) -> Dict:
         """
         获取用于词云显示的勋章数据
@@ -263,21 +281,8 @@ class MedalService:
         """
         try:
             conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # 联合查询获取正在展示的勋章名称
-            cursor.execute('''
-                SELECT m.name, pm.level
-                FROM player_medal pm
-                JOIN medal m ON pm.medal_id = m.id
-                WHERE pm.show = 1 AND pm.player_id = ?
-            ''', (player_id,))
-            
-            # 获取所有勋章名称
-            medals = [(row['name'], row['level']) for row in cursor.fetchall()]
-            
             return ResponseHandler.success(
-                data=medals,
+                data=self.query_wordcloud_medals(conn.cursor(), player_id),
                 msg='获取词云勋章数据成功'
             )
         except Exception as e:
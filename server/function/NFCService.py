@@ -1,9 +1,9 @@
 import sqlite3
+from utils import db_connection
 import os
 import logging
 import time
 import json
-import traceback
 from datetime import datetime
 import serial
 import serial.tools.list_ports
@@ -12,6 +12,8 @@ from utils.response_handler import ResponseHandler, StatusCode
 from config.config import ENV
 # 导入SSE服务
 from function.SSEService import sse_service
+from function.PlayerService import player_service
+from function.LeaderboardService import leaderboard_service
 if ENV == 'local':
     from ndef import message, record
     from function.NFC_Device import NFC_Device
@@ -38,7 +40,7 @@ class NFCService:
             
     def get_db(self):
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
@@ -46,34 +48,34 @@ class NFCService:
         """获取或创建NFC设备实例"""
         try:
             if self._nfc_device is None and ENV == 'local':
-                print("[NFC] 创建新的NFC设备实例")
+                logger.debug("[NFC] 创建新的NFC设备实例")
                 self._nfc_device = NFC_Device()
             
             # 确保设备已初始化
             if self._nfc_device and not self._nfc_device.initialized:
-                print("[NFC] 尝试初始化设备")
+                logger.debug("[NFC] 尝试初始化设备")
                 if not self._nfc_device.auto_detect_device():
-                    print("[NFC] 设备初始化失败")
+                    logger.error("[NFC] 设备初始化失败")
                     return None
             else:
-                print("[NFC] 设备已初始化") 
+                logger.debug("[NFC] 设备已初始化")
             return self._nfc_device
             
         except Exception as e:
-            print(f"[NFC] 获取设备实例失败: {str(e)}")
+            logger.error(f"[NFC] 获取设备实例失败: {str(e)}")
             return None
 
     def get_nfc_cards(self):
         """获取NFC卡片列表"""
         try:
-            print("[NFC] 获取NFC卡片列表")
+            logger.debug("[NFC] 获取NFC卡片列表")
             conn = self.get_db()
             cursor = conn.cursor()
             
             # 获取最大的card_id
             cursor.execute('SELECT MAX(card_id) FROM NFC_card')
             max_id = cursor.fetchone()[0] or 0
-            print(f"[NFC] 当前最大card_id: {max_id}")
+            logger.debug(f"[NFC] 当前最大card_id: {max_id}")
             
             # 获取所有卡片数据
             cursor.execute('''
@@ -96,10 +98,10 @@ class NFCService:
                     'description': row[6],
                     'device': row[7]
                 }
-                print(f"[NFC] 获取到卡片: {card}")
+                logger.debug(f"[NFC] 获取到卡片: {card}")
                 cards.append(card)
                 
-            print(f"[NFC] 成功获取 {len(cards)} 张卡片")
+            logger.debug(f"[NFC] 成功获取 {len(cards)} 张卡片")
             
             return ResponseHandler.success(
                 data={
@@ -110,7 +112,7 @@ class NFCService:
             )
             
         except Exception as e:
-            print(f"[NFC] 获取卡片列表失败: {str(e)}")
+            logger.error(f"[NFC] 获取卡片列表失败: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
                 msg=f"获取卡片列表失败: {str(e)}"
@@ -121,14 +123,14 @@ class NFCService:
     def create_nfc_card(self, data):
         """创建新NFC卡片"""
         try:
-            print(f"接收到的NFC卡片创建数据: {data}")
+            logger.debug(f"接收到的NFC卡片创建数据: {data}")
             current_time = int(time.time())
             
             # 验证必填字段
             required_fields = ['type', 'id', 'value']
             for field in required_fields:
                 if field not in data:
-                    print(f"缺少必填字段: {field}")
+                    logger.warning(f"缺少必填字段: {field}")
                     return ResponseHandler.error(
                         code=StatusCode.PARAM_ERROR,
                         msg=f"缺少必填字段: {field}"
@@ -141,7 +143,7 @@ class NFCService:
             cursor.execute('SELECT MAX(card_id) FROM NFC_card')
             result = cursor.fetchone()
             next_card_id = 1 if result[0] is None else result[0] + 1
-            print(f"生成的新card_id: {next_card_id}")
+            logger.debug(f"生成的新card_id: {next_card_id}")
             
             # 准备插入数据
             insert_data = {
@@ -154,7 +156,7 @@ class NFCService:
                 'description': data.get('description', ''),
                 'device': data.get('device', '')
             }
-            print(f"准备插入的数据: {insert_data}")
+            logger.debug(f"准备插入的数据: {insert_data}")
             
             cursor.execute('''
                 INSERT INTO NFC_card (
@@ -177,7 +179,7 @@ class NFCService:
             # 验证插入是否成功
             cursor.execute('SELECT * FROM NFC_card WHERE card_id = ?', (next_card_id,))
             inserted_data = cursor.fetchone()
-            print(f"插入后的数据验证: {dict(inserted_data) if inserted_data else None}")
+            logger.debug(f"插入后的数据验证: {dict(inserted_data) if inserted_data else None}")
             
             return ResponseHandler.success(
                 data={'card_id': next_card_id},
@@ -185,7 +187,7 @@ class NFCService:
             )
             
         except Exception as e:
-            print(f"创建NFC卡片失败: {str(e)}")
+            logger.error(f"创建NFC卡片失败: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
                 msg=f"创建NFC卡片失败: {str(e)}"
@@ -275,7 +277,7 @@ class NFCService:
     def get_next_card_id(self):
         """获取下一个可用的NFC卡片ID"""
         try:
-            print("[NFC] 获取下一个可用卡片ID")
+            logger.debug("[NFC] 获取下一个可用卡片ID")
             conn = self.get_db()
             cursor = conn.cursor()
             
@@ -284,14 +286,14 @@ class NFCService:
             result = cursor.fetchone()
             next_id = 1 if result[0] is None else result[0] + 1
             
-            print(f"[NFC] 下一个可用ID: {next_id}")
+            logger.debug(f"[NFC] 下一个可用ID: {next_id}")
             return ResponseHandler.success(
                 data={'next_id': next_id},
                 msg="获取下一个可用卡片ID成功"
             )
             
         except Exception as e:
-            print(f"[NFC] 获取下一个卡片ID失败: {str(e)}")
+            logger.error(f"[NFC] 获取下一个卡片ID失败: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
                 msg=f"获取下一个卡片ID失败: {str(e)}"
@@ -302,7 +304,7 @@ class NFCService:
     def get_card_status(self, card_id):
         """获取指定NFC卡片的状态"""
         try:
-            print(f"[NFC] 获取卡片状态: {card_id}")
+            logger.debug(f"[NFC] 获取卡片状态: {card_id}")
             conn = self.get_db()
             cursor = conn.cursor()
             
@@ -310,20 +312,20 @@ class NFCService:
             result = cursor.fetchone()
             
             if result:
-                print(f"[NFC] 卡片状态: {result['status']}")
+                logger.debug(f"[NFC] 卡片状态: {result['status']}")
                 return ResponseHandler.success(
                     data={'status': result['status']},
                     msg="获取卡片状态成功"
                 )
             else:
-                print(f"[NFC] 卡片不存在: {card_id}")
+                logger.debug(f"[NFC] 卡片不存在: {card_id}")
                 return ResponseHandler.error(
                     code=StatusCode.NOT_FOUND,
                     msg="卡片不存在"
                 )
                 
         except Exception as e:
-            print(f"[NFC] 获取卡片状态失败: {str(e)}")
+            logger.error(f"[NFC] 获取卡片状态失败: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
                 msg=f"获取卡片状态失败: {str(e)}"
@@ -339,18 +341,18 @@ class NFCService:
                 data=None
             )
         try:
-            print("[NFC] 检查设备状态")
+            logger.debug("[NFC] 检查设备状态")
             nfc_device = self.get_nfc_device()
             
             # 自动检测设备
             is_connected = nfc_device.auto_detect_device()
-            print(f"[NFC Hardware] 设备连接状态: {'已连接' if is_connected else '未连接'}")
+            logger.debug(f"[NFC Hardware] 设备连接状态: {'已连接' if is_connected else '未连接'}")
             
             # 获取端口信息
             port_info = ""
             if is_connected and nfc_device.serial_port:
                 port_info = nfc_device.serial_port.port
-                print(f"[NFC Hardware] 当前使用端口: {port_info}")
+                logger.debug(f"[NFC Hardware] 当前使用端口: {port_info}")
             
             # 构建状态信息
             status = {
@@ -364,15 +366,15 @@ class NFCService:
             if is_connected:
                 try:
                     card_id = nfc_device.read_card_id()
-                    print(f"[NFC Hardware] 读取到卡片ID: {card_id}")
+                    logger.debug(f"[NFC Hardware] 读取到卡片ID: {card_id}")
                     if card_id and isinstance(card_id, str):  # 确保card_id是有效的字符串
                         status['card_present'] = True
                         status['card_id'] = card_id
-                        print(f"[NFC Hardware] 卡片状态: 已检测到卡片 (ID: {card_id})")
+                        logger.debug(f"[NFC Hardware] 卡片状态: 已检测到卡片 (ID: {card_id})")
                     else:
-                        print("[NFC Hardware] 卡片状态: 未检测到卡片")
+                        logger.debug("[NFC Hardware] 卡片状态: 未检测到卡片")
                 except Exception as e:
-                    print(f"[NFC Hardware] 读取卡片ID失败: {str(e)}")
+                    logger.error(f"[NFC Hardware] 读取卡片ID失败: {str(e)}")
                     status['card_present'] = False
                     status['card_id'] = None
                 
@@ -382,7 +384,7 @@ class NFCService:
             )
             
         except Exception as e:
-            print(f"[NFC Hardware] 获取设备状态失败: {str(e)}")
+            logger.error(f"[NFC Hardware] 获取设备状态失败: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
                 msg=f"获取设备状态失败: {str(e)}"
@@ -395,7 +397,7 @@ class NFCService:
                 msg='NFC功能已关闭',
                 data=None
             )
-        print("[NFC] 开始读取卡片数据")
+        logger.debug("[NFC] 开始读取卡片数据")
         
         nfc_device = self.get_nfc_device()
         if nfc_device is None:
@@ -413,11 +415,11 @@ class NFCService:
                     msg='未检测到卡片或读取失败'
                 )
                 
-            print(f"[NFC] 读取到数据: {card_data}")
+            logger.debug(f"[NFC] 读取到数据: {card_data}")
             
             # 解析数据
             parsed_data = nfc_device.parse_nfc_data(card_data)
-            print(f"[NFC] 解析数据: {parsed_data}")
+            logger.debug(f"[NFC] 解析数据: {parsed_data}")
             if not parsed_data:
                 return ResponseHandler.error(
                     code=StatusCode.DEVICE_ERROR,
@@ -435,7 +437,7 @@ class NFCService:
             )
             
         except Exception as e:
-            print(f"[NFC] 读取错误: {str(e)}")
+            logger.error(f"[NFC] 读取错误: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.DEVICE_ERROR,
                 msg=f'读卡错误: {str(e)}'
@@ -448,11 +450,11 @@ class NFCService:
                 msg='NFC功能已关闭',
                 data=None
             )
-        print("[NFC] 开始写入卡片数据")
+        logger.debug("[NFC] 开始写入卡片数据")
         
         nfc_device = self.get_nfc_device()
         if nfc_device is None:
-            print("[NFC Write] 无法获取设备实例")
+            logger.error("[NFC Write] 无法获取设备实例")
             return ResponseHandler.error(
                 code=StatusCode.DEVICE_ERROR,
                 msg='NFC设备未初始化'
@@ -473,12 +475,12 @@ class NFCService:
                     msg='未检测到卡片'
                 )
 
-            print(f"[NFC] 写入数据: {data}")
+            logger.debug(f"[NFC] 写入数据: {data}")
             hex_data = nfc_device.format_ascii_to_hex(data['data'])
             
             # 写入数据
             if nfc_device._write_ntag_data(hex_data):
-                print(f"[NFC] 写入成功: {hex_data}")
+                logger.info(f"[NFC] 写入成功: {hex_data}")
                 
                 # 写入后立即读取验证
                 read_data = nfc_device.read_card_data_by_page()
@@ -503,13 +505,13 @@ class NFCService:
                         msg='写入验证失败：数据不匹配'
                     )
             else:
-                print("[NFC] 写入失败")
+                logger.error("[NFC] 写入失败")
                 return ResponseHandler.error(
                     code=StatusCode.DEVICE_ERROR,
                     msg='写入失败'
                 )
         except Exception as e:
-            print(f"[NFC] 写入错误: {str(e)}")
+            logger.error(f"[NFC] 写入错误: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
                 msg=f'写入异常: {str(e)}'
@@ -519,8 +521,8 @@ class NFCService:
         """处理NFC卡片扫描"""
         # 导入SSE服务
         from function.SSEService import sse_service
-        print("[NFC] ====== 开始处理NFC卡片 ======")
-        print(f"[NFC] 卡片ID: {card_id}, 玩家ID: {player_id}")
+        logger.info("[NFC] ====== 开始处理NFC卡片 ======")
+        logger.debug(f"[NFC] 卡片ID: {card_id}, 玩家ID: {player_id}")
         
         conn = None
         response = {'code': 0, 'msg': '处理成功', 'data': None}
@@ -533,11 +535,11 @@ class NFCService:
             # 查询卡片信息
             cursor.execute('SELECT * FROM NFC_card WHERE card_id = ?', (card_id,))
             card = cursor.fetchone()
-            print(f"[NFC] 查询到的卡片信息: {json.dumps(dict(card) if card else None, ensure_ascii=False)}")
+            logger.debug(f"[NFC] 查询到的卡片信息: {json.dumps(dict(card) if card else None, ensure_ascii=False)}")
             
             if not card:
                 error_msg = '无效的NFC卡片'
-                print(f"[NFC] 错误: {error_msg}")
+                logger.error(f"[NFC] 错误: {error_msg}")
                 return {
                     'code': 404,
                     'msg': error_msg,
@@ -546,7 +548,7 @@ class NFCService:
                 
             card_type = card['type']
             value = card['value']
-            print(f"[NFC] 卡片类型: {card_type}, 值: {value}")
+            logger.debug(f"[NFC] 卡片类型: {card_type}, 值: {value}")
 
             # 任务卡片处理
             if card_type == 'TASK':
@@ -566,7 +568,7 @@ class NFCService:
                 
             else:
                 error_msg = f'未知的卡片类型: {card_type}'
-                print(f"[NFC] 错误: {error_msg}")
+                logger.error(f"[NFC] 错误: {error_msg}")
                 return json.dumps({
                     'code': 400,
                     'msg': error_msg,
@@ -575,12 +577,11 @@ class NFCService:
 
         except Exception as e:
             error_msg = f'处理失败: {str(e)}'
-            print(f"[NFC] 错误: {error_msg}")
-            print(f"[NFC] 详细错误信息: ", traceback.format_exc())
+            logger.exception(f"[NFC] 错误: {error_msg}")
 
             if conn:
                 conn.rollback()
-                print("[NFC] 数据库事务已回滚")
+                logger.debug("[NFC] 数据库事务已回滚")
 
             self._send_sse_message(room, 'ERROR', error_msg)
 
@@ -593,7 +594,7 @@ class NFCService:
         finally:
             if conn:
                 conn.close()
-                print("[NFC] 数据库连接已关闭")
+                logger.debug("[NFC] 数据库连接已关闭")
 
     def _send_sse_message(self, room, msg_type, message, task=None, task_id=None, rewards=None, timestamp=None):
         """统一的SSE消息发送函数
@@ -606,8 +607,8 @@ class NFCService:
             rewards: 奖励信息（可选）
             timestamp: 时间戳（可选）
         """
-        print(f"[NFC] 发送SSE消息 - 类型: {msg_type}")
-        print(f"[NFC] 消息内容: {message}")
+        logger.debug(f"[NFC] 发送SSE消息 - 类型: {msg_type}")
+        logger.debug(f"[NFC] 消息内容: {message}")
         
         sse_data = {
             'type': msg_type,
@@ -650,7 +651,7 @@ class NFCService:
         """处理任务卡片"""
         from function.TaskService import task_service  # 导入任务服务
         
-        print(f"[NFC] 开始处理任务卡片 - 任务ID: {task_id}")
+        logger.debug(f"[NFC] 开始处理任务卡片 - 任务ID: {task_id}")
         
         try:
             # 验证玩家和任务
@@ -676,7 +677,7 @@ class NFCService:
             
         except Exception as e:
             error_msg = f"处理任务卡片失败: {str(e)}"
-            print(f"[NFC] 错误: {error_msg}")
+            logger.error(f"[NFC] 错误: {error_msg}")
             self._send_sse_message(room, 'ERROR', error_msg)
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
@@ -709,6 +710,8 @@ class NFCService:
                 SET points = points + ? 
                 WHERE player_id = ?
             ''', (points, player_id))
+            player_service.invalidate_player(player_id, cursor)
+            leaderboard_service.add_score('points', player_id, points, cursor)
 
             # 记录积分变动
             cursor.execute('''
@@ -831,6 +834,7 @@ class NFCService:
                     player_id, medal_id, addtime
                 ) VALUES (?, ?, ?)
             ''', (player_id, value, current_time))
+            leaderboard_service.add_score('medals', player_id, 1, cursor)
 
             conn.commit()
             return json.dumps({
@@ -9,6 +9,7 @@
 # Copyright 2025 迷舍
 
 import sqlite3
+from utils import db_connection
 import os
 import logging
 import time
@@ -392,7 +393,7 @@ class NFC_Device:
 
     def get_db(self):
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
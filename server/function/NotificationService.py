@@ -7,6 +7,8 @@
 @Description: 通知服务
 """
 import sqlite3
+from utils import db_connection
+from utils.field_projection import parse_fields, select_columns, table_columns
 import os
 import logging
 import time
@@ -43,7 +45,7 @@ class NotificationService:
             os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
             
             # 创建连接
-            self.conn = sqlite3.connect(self.db_path)
+            self.conn = db_connection.connect(self.db_path)
             self.conn.row_factory = sqlite3.Row
             
             # 创建通知表
@@ -91,23 +93,26 @@ class NotificationService:
             self.init_db()
         return self.conn
 
-    def get_notifications(self, target_type='all', target_id=None, limit=50, offset=0):
-        """获取通知列表"""
+    @staticmethod
+    def _target_filter(target_type='all', target_id=None):
+        """有效通知中发给指定对象的查询条件"""
+        conditions = "status = 'active' AND (target_type = ? OR target_type = 'all')"
+        params = [target_type]
+        if target_id:
+            conditions += ' AND (target_id = ? OR target_id IS NULL)'
+            params.append(target_id)
+        return conditions, params
+
+    def get_notifications(self, target_type='all', target_id=None, limit=50, offset=0, fields=None):
+        """获取通知列表，fields 为返回的字段（逗号分隔），不支持的字段抛出 ValueError"""
         try:
             conn = self.get_db_connection()
             cursor = conn.cursor()
             
-            query = '''
-                SELECT * FROM notification 
-                WHERE status = 'active' 
-                AND (target_type = ? OR target_type = 'all')
-            '''
-            params = [target_type]
-            
-            if target_id:
-                query += ' AND (target_id = ? OR target_id IS NULL)'
-                params.append(target_id)
-                
+            fields = parse_fields(fields)
+            select_list = select_columns(fields, table_columns(cursor, 'notification')) if fields else '*'
+            conditions, params = self._target_filter(target_type, target_id)
+            query = f'SELECT {select_list} FROM notification WHERE {conditions}'
             query += ' ORDER BY create_time DESC LIMIT ? OFFSET ?'
             params.extend([limit, offset])
             
@@ -120,6 +125,19 @@ class NotificationService:
             logger.error(f'获取通知列表失败: {str(e)}')
             raise
 
+    def get_unread_count(self, target_type='all', target_id=None, cursor=None):
+        """获取未读通知数量，传入 cursor 时在调用方的连接上查询"""
+        try:
+            if cursor is None:
+                cursor = self.get_db_connection().cursor()
+            conditions, params = self._target_filter(target_type, target_id)
+            cursor.execute(f'SELECT COUNT(*) FROM notification WHERE {conditions} AND is_read = 0', params)
+            return cursor.fetchone()[0]
+            
+        except Exception as e:
+            logger.error(f'获取未读通知数量失败: {str(e)}')
+            raise
+
     def get_notification(self, notification_id):
         """获取单个通知"""
         try:
@@ -9,21 +9,142 @@
 # Copyright 2025 迷舍
 
 import sqlite3
+from utils import db_connection
 import os
 import logging
 import json
 import time
 import hashlib
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Optional
 from flask import session, request
 from utils.response_handler import ResponseHandler, StatusCode
 from config.config import DEBUG
+from function.LeaderboardService import leaderboard_service
+from function.RecordRollupService import record_rollup_service
 from functools import wraps
 
 logger = logging.getLogger(__name__)
 
+class PlayerCache:
+    """玩家资料读穿缓存
+
+    by_id 保存 player_id -> (过期时间, 玩家资料)，by_wechat 保存 wechat_userid -> (过期时间, player_id)，
+    企业微信用户未绑定玩家时缓存 None，避免未绑定用户的每条消息都查库。
+    写入路径在事务提交后调用 invalidate()；读取在查库前记录代数，期间发生过失效则不写入缓存，
+    避免并发读把提交前的旧数据放回缓存。
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_size: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._by_id: 'OrderedDict[int, tuple]' = OrderedDict()
+        self._by_wechat: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @staticmethod
+    def _lookup(entries: OrderedDict, key, now: float):
+        entry = entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= now:
+            del entries[key]
+            return False, None
+        entries.move_to_end(key)
+        return True, entry[1]
+
+    def _store(self, entries: OrderedDict, key, value, ttl: float, now: float) -> None:
+        entries[key] = (now + ttl, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    def get(self, player_id: int):
+        """按 player_id 读取，返回 (是否命中, 玩家资料副本)"""
+        now = time.monotonic()
+        with self._lock:
+            found, player = self._lookup(self._by_id, player_id, now)
+            if found:
+                self.hits += 1
+                return True, dict(player)
+            self.misses += 1
+        return False, None
+
+    def get_by_wechat(self, wechat_userid: str):
+        """按 wechat_userid 读取，返回 (是否命中, 玩家资料副本或 None)"""
+        now = time.monotonic()
+        with self._lock:
+            found, player_id = self._lookup(self._by_wechat, wechat_userid, now)
+            if found:
+                if player_id is None:
+                    self.hits += 1
+                    return True, None
+                found, player = self._lookup(self._by_id, player_id, now)
+                if found:
+                    self.hits += 1
+                    return True, dict(player)
+            self.misses += 1
+        return False, None
+
+    def put(self, player: Dict, generation: int) -> None:
+        """写入查库结果，查库期间发生过失效时丢弃"""
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._store(self._by_id, player['player_id'], dict(player), self.ttl, now)
+            if player.get('wechat_userid'):
+                self._store(self._by_wechat, player['wechat_userid'], player['player_id'], self.ttl, now)
+
+    def put_missing_wechat(self, wechat_userid: str, generation: int) -> None:
+        """记录未绑定玩家的企业微信用户"""
+        now = time.monotonic()
+        with self._lock:
+            if generation == self._generation:
+                self._store(self._by_wechat, wechat_userid, None, self.negative_ttl, now)
+
+    def invalidate(self, player_id: Optional[int] = None) -> None:
+        """清除某个玩家（为 None 时清除全部）的缓存"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if player_id is None:
+                self._by_id.clear()
+                self._by_wechat.clear()
+                return
+            entry = self._by_id.pop(player_id, None)
+            if entry is not None and entry[1].get('wechat_userid'):
+                self._by_wechat.pop(entry[1]['wechat_userid'], None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self._by_id),
+                'wechat_entries': len(self._by_wechat)
+            }
+
+
 class PlayerService:
     _instance = None
+
+    PLAYER_CACHE_TTL = 60  # 玩家资料缓存秒数，写入路径未清除时的兜底
+    PLAYER_CACHE_NEGATIVE_TTL = 10  # 未绑定玩家的企业微信用户的缓存秒数
+    PLAYER_CACHE_SIZE = 4096  # 缓存的最大玩家数
     
     def __new__(cls):
         if cls._instance is None:
@@ -37,11 +158,30 @@ class PlayerService:
                 'database', 
                 'game.db'
             )
+            self.player_cache = PlayerCache(
+                self.PLAYER_CACHE_TTL, self.PLAYER_CACHE_NEGATIVE_TTL, self.PLAYER_CACHE_SIZE
+            )
             self.initialized = True
             
     def get_db(self):
         """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        return db_connection.connect(self.db_path)
+
+    def invalidate_player(self, player_id: Optional[int] = None, cursor=None) -> None:
+        """清除玩家资料缓存
+
+        传入 cursor 时在其所在事务提交后清除，事务回滚则不清除。
+        """
+        if player_id is not None:
+            player_id = int(player_id)
+        if cursor is not None:
+            db_connection.after_commit(cursor.connection, lambda: self.player_cache.invalidate(player_id))
+        else:
+            self.player_cache.invalidate(player_id)
+
+    def get_cache_stats(self) -> Dict:
+        """玩家资料缓存命中统计"""
+        return self.player_cache.stats()
 
     def encrypt_password(self, password):
         """使用MD5加密密码"""
@@ -177,9 +317,17 @@ class PlayerService:
 
     def get_player_by_wechat_userid(self, wechat_userid):
         """根据企业微信用户ID获取玩家信息"""
+        if DEBUG:
+            wechat_userid = 'duyucheng'
+        found, player = self.player_cache.get_by_wechat(wechat_userid)
+        if found:
+            if player is None:
+                return ResponseHandler.error(code=StatusCode.PLAYER_NOT_FOUND, msg="玩家不存在")
+            return ResponseHandler.success(data=player, msg="获取玩家信息成功")
+
+        conn = None
         try:
-            if DEBUG:
-                wechat_userid = 'duyucheng'
+            generation = self.player_cache.generation
             conn = self.get_db()
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM player_data WHERE wechat_userid = ?', (wechat_userid,))
@@ -188,38 +336,64 @@ class PlayerService:
                 # 获取列名并将查询结果转换为字典
                 columns = [col[0] for col in cursor.description]
                 player_dict = dict(zip(columns, player))
+                self.player_cache.put(player_dict, generation)
                 return ResponseHandler.success(data=player_dict, msg="获取玩家信息成功")
             else:
+                self.player_cache.put_missing_wechat(wechat_userid, generation)
                 return ResponseHandler.error(code=StatusCode.PLAYER_NOT_FOUND, msg="玩家不存在")
         except sqlite3.Error as e:
             logger.error(f"获取玩家信息失败: {str(e)}")
             return ResponseHandler.error(code=StatusCode.SERVER_ERROR, msg="获取玩家信息失败")
         finally:
-            conn.close()
+            if conn:
+                conn.close()
+
+    def query_player(self, cursor, player_id: int) -> Optional[Dict]:
+        """读取玩家信息，优先使用缓存，未命中时在调用方的连接上查询；玩家不存在返回 None"""
+        found, player_dict = self.player_cache.get(player_id)
+        if found:
+            return player_dict
+        return self._load_player(cursor, player_id)
+
+    def _load_player(self, cursor, player_id: int) -> Optional[Dict]:
+        """查询玩家信息并写入缓存"""
+        generation = self.player_cache.generation
+        cursor.execute('''
+            SELECT *
+            FROM player_data 
+            WHERE player_id = ?
+        ''', (player_id,))
+
+        player = cursor.fetchone()
+        if not player:
+            return None
+
+        # 将查询结果转换为字典
+        columns = [col[0] for col in cursor.description]
+        player_dict = dict(zip(columns, player))
+        self.player_cache.put(player_dict, generation)
+        return player_dict
+
     def get_player(self, player_id: int) -> Dict:
         """获取玩家信息"""
         logger.debug(f"获取角色信息: player_id={player_id}")
+        found, player_dict = self.player_cache.get(player_id)
+        if found:
+            return ResponseHandler.success(
+                data=player_dict,
+                msg="获取玩家信息成功"
+            )
+
+        conn = None
         try:
             conn = self.get_db()
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                SELECT *
-                FROM player_data 
-                WHERE player_id = ?
-            ''', (player_id,))
-
-            player = cursor.fetchone()
-            if not player:
+            player_dict = self._load_player(conn.cursor(), player_id)
+            if not player_dict:
                 return ResponseHandler.error(
                     code=StatusCode.USER_NOT_FOUND,
                     msg="玩家不存在"
                 )
 
-            # 将查询结果转换为字典
-            columns = [col[0] for col in cursor.description]
-            player_dict = dict(zip(columns, player))
-
             return ResponseHandler.success(
                 data=player_dict,
                 msg="获取玩家信息成功"
@@ -234,6 +408,23 @@ class PlayerService:
             if conn:
                 conn.close()
 
+    def get_record_history(self, player_id: int, kind: str = 'exp', period: str = 'day',
+                           start=None, end=None) -> Dict:
+        """获取玩家积分/经验按天或按周的变化曲线"""
+        conn = None
+        try:
+            conn = self.get_db()
+            return record_rollup_service.get_history(conn.cursor(), player_id, kind, period, start, end)
+        except sqlite3.Error as e:
+            logger.error(f"获取成长记录失败: {str(e)}")
+            return ResponseHandler.error(
+                code=StatusCode.SERVER_ERROR,
+                msg=f"获取成长记录失败: {str(e)}"
+            )
+        finally:
+            if conn:
+                conn.close()
+
     def get_players(self) -> Dict:
         """获取所有玩家"""
         try:
@@ -287,6 +478,9 @@ class PlayerService:
             ''', (data['player_name'], data['points'], data['level'], player_id))
 
             conn.commit()
+            self.invalidate_player(player_id)
+            leaderboard_service.set_score('points', player_id, data['points'])
+            leaderboard_service.rename_player(player_id, data['player_name'])
 
             return ResponseHandler.success(
                 msg="更新玩家信息成功"
@@ -313,6 +507,8 @@ class PlayerService:
             cursor.execute('DELETE FROM player_data WHERE player_id = ?', (player_id,))
 
             conn.commit()
+            self.invalidate_player(player_id)
+            leaderboard_service.remove_player(player_id)
             return ResponseHandler.success(
                 msg="删除玩家成功"
             )
@@ -337,6 +533,9 @@ class PlayerService:
 
             player_id = cursor.lastrowid
             conn.commit()
+            # 新玩家可能对应此前缓存为未绑定的企业微信用户
+            self.invalidate_player()
+            leaderboard_service.add_player(player_id, data['player_name'], data['points'])
 
             return ResponseHandler.success(
                 data={"id": player_id},
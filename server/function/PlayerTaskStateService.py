@@ -0,0 +1,370 @@
+"""
+玩家任务状态汇总服务
+player_task 表上的触发器在同一事务内维护两张汇总表，任何写入路径（接受、提交、完成、放弃、审核、
+定时分配、过期清理、后台编辑）都会同步更新：
+
+    player_task_summary  每个玩家一行，各状态的任务数
+    player_task_stat     每个 (玩家, 任务) 一行，进行中/已完成次数、最早的进行中记录ID、最近一天的接受次数
+
+可用任务和任务面板只需读取这两张小表，不再扫描玩家的全部任务历史。
+批量插入（每日任务分配）期间暂停逐行的插入触发器，插入后由 apply_inserted() 按批次一次更新汇总表。
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 汇总表中单独计数的任务状态 -> 列名
+SUMMARY_STATUS_COLUMNS = {
+    'IN_PROGRESS': 'in_progress',
+    'CHECK': 'checking',
+    'COMPLETED': 'completed',
+    'REJECT': 'rejected',
+    'UNFINISH': 'unfinished',
+    'ABANDONED': 'abandoned',
+}
+
+# 批量插入标记表：批量插入的事务内写入一行、提交前删除，其他连接看不到。
+# player_task 的插入触发器（本模块和 TaskEventService）在该表有记录时不执行，由批量插入按批次统一维护。
+BULK_INSERT_TABLE = 'player_task_bulk_insert'
+INSERT_TRIGGER_WHEN = f'NOT EXISTS (SELECT 1 FROM {BULK_INSERT_TABLE})'
+
+
+def _summary_delta(row: str, sign: str) -> str:
+    """生成按 row(NEW/OLD) 的状态增减汇总计数的语句"""
+    assignments = ', '.join(
+        f"{column} = {column} {sign} (IFNULL({row}.status, '') = '{status}')"
+        for status, column in SUMMARY_STATUS_COLUMNS.items()
+    )
+    return f'''
+        INSERT OR IGNORE INTO player_task_summary (player_id)
+        SELECT {row}.player_id WHERE {row}.player_id IS NOT NULL;
+        UPDATE player_task_summary
+        SET total = total {sign} 1, {assignments}
+        WHERE player_id = {row}.player_id;
+    '''
+
+
+def _stat_refresh(row: str) -> str:
+    """生成重新计算 row(NEW/OLD) 对应 (玩家, 任务) 统计行的语句，只读取该玩家该任务的记录"""
+    player, task = f'{row}.player_id', f'{row}.task_id'
+    return f'''
+        DELETE FROM player_task_stat WHERE player_id = {player} AND task_id = {task};
+        INSERT INTO player_task_stat (
+            player_id, task_id, active_count, active_min_id, completed_count, day_start, day_count
+        )
+        SELECT {player}, {task}, a.active_count, a.active_min_id, a.completed_count, a.day_start,
+            (SELECT COUNT(*) FROM player_task x
+             WHERE x.player_id = {player} AND x.task_id = {task}
+             AND typeof(x.starttime) = 'integer' AND x.starttime >= a.day_start)
+        FROM (
+            SELECT COUNT(*) AS n,
+                IFNULL(SUM(status IN ('IN_PROGRESS', 'CHECK')), 0) AS active_count,
+                MIN(CASE WHEN status IN ('IN_PROGRESS', 'CHECK') THEN id END) AS active_min_id,
+                IFNULL(SUM(status = 'COMPLETED'), 0) AS completed_count,
+                MAX(CASE WHEN typeof(starttime) = 'integer'
+                    THEN CAST(strftime('%s', date(starttime, 'unixepoch', 'localtime'), 'utc') AS INTEGER)
+                END) AS day_start
+            FROM player_task
+            WHERE player_id = {player} AND task_id = {task}
+        ) a
+        WHERE a.n > 0 AND {player} IS NOT NULL AND {task} IS NOT NULL;
+    '''
+
+
+class PlayerTaskState:
+    """某个玩家的任务状态汇总（只读）"""
+    __slots__ = ('player_id', 'counts', 'active_ids', 'completed_ids', 'daily_counts')
+
+    def __init__(self, player_id: int, counts: Dict[str, int], active_ids: List[int],
+                 completed_ids: set, daily_counts: Dict[int, int]):
+        self.player_id = player_id
+        self.counts = counts                # 状态 -> 任务数，另含 total
+        self.active_ids = active_ids        # 进行中/待审核的任务ID，按最早记录排序
+        self.completed_ids = completed_ids  # 完成过的任务ID
+        self.daily_counts = daily_counts    # 任务ID -> 今日接受次数
+
+    @property
+    def excluded_ids(self) -> set:
+        """进行中、待审核或已完成的任务，不再出现在可用列表"""
+        return self.completed_ids.union(self.active_ids)
+
+    def to_dict(self) -> Dict:
+        return {
+            'player_id': self.player_id,
+            'counts': self.counts,
+            'active_task_ids': self.active_ids,
+            'completed_task_ids': sorted(self.completed_ids),
+            'daily_counts': self.daily_counts
+        }
+
+
+class PlayerTaskStateService:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(PlayerTaskStateService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self._schema_ready = False
+            self._lock = threading.Lock()
+            self.initialized = True
+
+    def ensure_schema(self, cursor) -> None:
+        """创建汇总表和触发器，首次创建时根据现有 player_task 回填
+
+        不在事务中时单独开启写事务并提交（每个进程一次）；在调用方事务中时随调用方事务提交。
+        """
+        if self._schema_ready:
+            return
+        with self._lock:
+            if self._schema_ready:
+                return
+            conn = cursor.connection
+            standalone = not conn.in_transaction
+            if standalone:
+                cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_player_task_state_delete'"
+                )
+                if not cursor.fetchone():
+                    self._create_schema(cursor)
+                else:
+                    # 早期版本的插入触发器没有批量插入条件，重建
+                    self._create_insert_trigger(cursor)
+                # 按状态分页（待审核、任务历史）时沿状态索引按ID倒序取数
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_player_task_status ON player_task (status)')
+                if standalone:
+                    conn.commit()
+                    self._schema_ready = True
+            except Exception:
+                if standalone:
+                    conn.rollback()
+                raise
+
+    def _create_schema(self, cursor) -> None:
+        status_columns = ',\n'.join(
+            f'{column} INTEGER NOT NULL DEFAULT 0' for column in SUMMARY_STATUS_COLUMNS.values()
+        )
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS player_task_summary (
+                player_id INTEGER PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                {status_columns}
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS player_task_stat (
+                player_id INTEGER NOT NULL,
+                task_id INTEGER NOT NULL,
+                active_count INTEGER NOT NULL,
+                active_min_id INTEGER,
+                completed_count INTEGER NOT NULL,
+                day_start INTEGER,
+                day_count INTEGER NOT NULL,
+                PRIMARY KEY (player_id, task_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_player_task_player_task_start
+            ON player_task (player_id, task_id, starttime)
+        ''')
+
+        self._create_insert_trigger(cursor)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_player_task_state_update
+            AFTER UPDATE OF player_id, task_id, status, starttime ON player_task
+            BEGIN
+                {_summary_delta('OLD', '-')}
+                {_summary_delta('NEW', '+')}
+                {_stat_refresh('OLD')}
+                {_stat_refresh('NEW')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_player_task_state_delete AFTER DELETE ON player_task
+            BEGIN
+                {_summary_delta('OLD', '-')}
+                {_stat_refresh('OLD')}
+            END
+        ''')
+        self.rebuild(cursor)
+        logger.info("玩家任务状态汇总表已创建")
+
+    @staticmethod
+    def create_bulk_insert_table(cursor) -> None:
+        """创建批量插入标记表（插入触发器的条件引用该表）"""
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {BULK_INSERT_TABLE} (
+                started_at INTEGER NOT NULL
+            )
+        ''')
+
+    def _create_insert_trigger(self, cursor) -> None:
+        """创建插入触发器，已有触发器不同时重建"""
+        self.create_bulk_insert_table(cursor)
+        sql = f'''CREATE TRIGGER trg_player_task_state_insert AFTER INSERT ON player_task
+WHEN {INSERT_TRIGGER_WHEN}
+BEGIN
+    {_summary_delta('NEW', '+')}
+    {_stat_refresh('NEW')}
+END'''
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_player_task_state_insert'")
+        existing = cursor.fetchone()
+        if existing and existing[0] == sql:
+            return
+        cursor.execute('DROP TRIGGER IF EXISTS trg_player_task_state_insert')
+        cursor.execute(sql)
+
+    def rebuild(self, cursor) -> None:
+        """根据 player_task 全量重建汇总表"""
+        cursor.execute('DELETE FROM player_task_summary')
+        self._insert_summaries(cursor, 'player_id IS NOT NULL')
+        cursor.execute('DELETE FROM player_task_stat')
+        self._insert_stats(cursor, 'player_id IS NOT NULL AND task_id IS NOT NULL')
+
+    def apply_inserted(self, cursor, after_id: int) -> None:
+        """按批次更新 ID 大于 after_id 的新插入记录的汇总（批量插入期间插入触发器不执行）
+
+        新记录按玩家、按 (玩家, 任务) 聚合后累加到已有的汇总行，只读取新记录，不重新读取历史记录。
+        新记录的ID大于所有已有记录（同一写事务内插入），进行中记录的最小ID保留已有值。
+        """
+        self._insert_summaries(cursor, 'id > ?', (after_id,), accumulate=True)
+        self._insert_stats(cursor, 'id > ?', (after_id,), accumulate=True)
+
+    @staticmethod
+    def _insert_summaries(cursor, where: str, params: tuple = (), accumulate: bool = False) -> None:
+        """按玩家聚合 where 条件内的记录写入玩家汇总，accumulate 时累加到已有行"""
+        columns = list(SUMMARY_STATUS_COLUMNS.values())
+        status_sums = ', '.join(
+            f"IFNULL(SUM(status = '{status}'), 0)" for status in SUMMARY_STATUS_COLUMNS
+        )
+        source, upsert = 'player_task', ''
+        if accumulate:
+            # 新记录按主键范围读取；不用索引，否则为了按玩家分组会沿 player_id 索引扫描全部记录
+            source = 'player_task NOT INDEXED'
+            upsert = 'ON CONFLICT (player_id) DO UPDATE SET ' + ', '.join(
+                f'{column} = {column} + excluded.{column}' for column in ['total'] + columns
+            )
+        cursor.execute(f'''
+            INSERT INTO player_task_summary (player_id, total, {', '.join(columns)})
+            SELECT player_id, COUNT(*), {status_sums}
+            FROM {source}
+            WHERE {where}
+            GROUP BY player_id
+            HAVING player_id IS NOT NULL
+            {upsert}
+        ''', params)
+
+    @staticmethod
+    def _insert_stats(cursor, where: str, params: tuple = (), accumulate: bool = False) -> None:
+        """按 (玩家, 任务) 聚合 where 条件内的记录写入统计
+
+        不累加时调用方先删除对应的旧行；累加时 where 只包含新记录，与已有行合并：
+        次数相加，最近一天取较晚的一天，当天次数在同一天时相加、新的一天更晚时取新记录的次数。
+        最近一天按最晚的开始时间计算（日期随时间单调，与逐条取日期后求最大值相同）。
+        """
+        source, upsert = 'player_task', ''
+        if accumulate:
+            source = 'player_task NOT INDEXED'  # 同 _insert_summaries，按主键范围读取新记录
+            upsert = '''
+                ON CONFLICT (player_id, task_id) DO UPDATE SET
+                    active_count = active_count + excluded.active_count,
+                    active_min_id = IFNULL(active_min_id, excluded.active_min_id),
+                    completed_count = completed_count + excluded.completed_count,
+                    day_start = CASE
+                        WHEN excluded.day_start IS NULL THEN day_start
+                        WHEN day_start IS NULL OR excluded.day_start > day_start THEN excluded.day_start
+                        ELSE day_start END,
+                    day_count = CASE
+                        WHEN excluded.day_start IS NULL THEN day_count
+                        WHEN day_start IS NULL OR excluded.day_start > day_start THEN excluded.day_count
+                        WHEN excluded.day_start = day_start THEN day_count + excluded.day_count
+                        ELSE day_count END
+            '''
+        cursor.execute(f'''
+            INSERT INTO player_task_stat (
+                player_id, task_id, active_count, active_min_id, completed_count, day_start, day_count
+            )
+            SELECT a.player_id, a.task_id, a.active_count, a.active_min_id, a.completed_count, a.day_start,
+                (SELECT COUNT(*) FROM player_task x
+                 WHERE x.player_id = a.player_id AND x.task_id = a.task_id
+                 AND typeof(x.starttime) = 'integer' AND x.starttime >= a.day_start
+                 AND x.id >= a.min_id)
+            FROM (
+                SELECT player_id, task_id, MIN(id) AS min_id,
+                    IFNULL(SUM(status IN ('IN_PROGRESS', 'CHECK')), 0) AS active_count,
+                    MIN(CASE WHEN status IN ('IN_PROGRESS', 'CHECK') THEN id END) AS active_min_id,
+                    IFNULL(SUM(status = 'COMPLETED'), 0) AS completed_count,
+                    CAST(strftime('%s', date(
+                        MAX(CASE WHEN typeof(starttime) = 'integer' THEN starttime END), 'unixepoch', 'localtime'
+                    ), 'utc') AS INTEGER) AS day_start
+                FROM {source}
+                WHERE {where}
+                GROUP BY player_id, task_id
+                HAVING player_id IS NOT NULL AND task_id IS NOT NULL
+            ) a
+            WHERE true
+            {upsert}
+        ''', params)
+
+    def count_player_tasks(self, cursor, player_id: Optional[int] = None,
+                           status: Optional[str] = None) -> Optional[int]:
+        """从汇总表读取玩家任务数，可按玩家和状态过滤
+
+        Returns:
+            Optional[int]: 任务数；状态不在汇总表单独计数的状态中时返回 None，由调用方自行统计
+        """
+        if status:
+            column = SUMMARY_STATUS_COLUMNS.get(status)
+            if not column:
+                return None
+        else:
+            column = 'total'
+        self.ensure_schema(cursor)
+        if player_id is not None:
+            cursor.execute(f'SELECT {column} FROM player_task_summary WHERE player_id = ?', (player_id,))
+        else:
+            cursor.execute(f'SELECT IFNULL(SUM({column}), 0) FROM player_task_summary')
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def get_state(self, cursor, player_id: int) -> PlayerTaskState:
+        """读取玩家的任务状态汇总"""
+        self.ensure_schema(cursor)
+        cursor.execute('SELECT * FROM player_task_summary WHERE player_id = ?', (player_id,))
+        row = cursor.fetchone()
+        counts = {'total': row['total'] if row else 0}
+        for status, column in SUMMARY_STATUS_COLUMNS.items():
+            counts[status] = row[column] if row else 0
+
+        today_start = int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+        cursor.execute('''
+            SELECT task_id, active_count, active_min_id, completed_count, day_start, day_count
+            FROM player_task_stat
+            WHERE player_id = ?
+        ''', (player_id,))
+        active = []
+        completed_ids = set()
+        daily_counts = {}
+        for stat in cursor.fetchall():
+            task_id = stat['task_id']
+            if stat['active_count']:
+                active.append((stat['active_min_id'], task_id))
+            if stat['completed_count']:
+                completed_ids.add(task_id)
+            if stat['day_start'] is not None and stat['day_start'] >= today_start:
+                daily_counts[task_id] = stat['day_count']
+        active.sort()
+
+        return PlayerTaskState(player_id, counts, [task_id for _, task_id in active], completed_ids, daily_counts)
+
+
+# 创建玩家任务状态汇总服务实例
+player_task_state_service = PlayerTaskStateService()
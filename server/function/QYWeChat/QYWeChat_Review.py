@@ -14,6 +14,7 @@ import requests
 import time
 import json
 import sqlite3
+from utils import db_connection
 import os
 from typing import Dict, Any, List, Optional, Tuple
 
@@ -508,7 +509,7 @@ class QYWeChatReview:
             logger.info(f"[QYWeChat] 收到审批状态变更事件: 单号={sp_no}, 状态={sp_status}")
             
             # 查询数据库，找到对应的任务
-            conn = sqlite3.connect(GAME_DB_PATH)
+            conn = db_connection.connect(GAME_DB_PATH)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
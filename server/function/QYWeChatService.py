@@ -15,6 +15,7 @@ from function.GPSService import gps_service
 from function.QYWeChat.QYWeChat_Auth import qywechat_auth
 from function.QYWeChat.QYWeChat_Send import qywechat_send
 import sqlite3
+from utils import db_connection
 import os
 
 # 数据库路径常量
@@ -341,7 +342,7 @@ class QYWeChatService:
                     logger.info(f"[QYWeChat] 收到审批状态变更 - 单号: {sp_no}, 状态: {sp_status}")
                     
                     # 查询数据库，找到对应的任务
-                    conn = sqlite3.connect(GAME_DB_PATH)
+                    conn = db_connection.connect(GAME_DB_PATH)
                     conn.row_factory = sqlite3.Row
                     cursor = conn.cursor()
                     
@@ -1,137 +1,388 @@
 """
 速率限制服务模块
 处理应用程序的请求速率限制
+
+采用滑动窗口计数器：每个 (策略, IP) 只保存上一窗口和当前窗口的计数，
+按当前窗口已过去的比例加权估算最近 window 秒内的请求数，单次判断为 O(1)。
+长时间未访问的键按 LRU 顺序淘汰，内存占用有上限。
 """
 import logging
+import os
+import sqlite3
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from config.config import SECURITY, PROD_SERVER
-from flask import request, jsonify
-from utils.response_handler import ResponseHandler, StatusCode
+from flask import g, jsonify
 
 logger = logging.getLogger(__name__)
 
+
+class RateLimitPolicy:
+    """速率限制策略"""
+    __slots__ = ('name', 'limit', 'window')
+
+    def __init__(self, name: str, limit: int, window: int):
+        self.name = name
+        self.limit = limit
+        self.window = window
+
+
+class MemoryRateLimitStore:
+    """进程内滑动窗口计数存储
+
+    条目结构: [当前窗口起点, 上一窗口计数, 当前窗口计数, 最后访问时间]
+    """
+
+    def __init__(self, max_keys: int = 100000, idle_ttl: int = 120):
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self._entries: 'OrderedDict[Tuple[str, str], list]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: Tuple[str, str], policy: RateLimitPolicy, now: float) -> Tuple[bool, float, float]:
+        """记录一次请求
+
+        Returns:
+            (是否允许, 本次之后的估算请求数, 当前窗口结束时间)
+        """
+        window = policy.window
+        window_start = now - now % window
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [window_start, 0, 0, now]
+                self._entries[key] = entry
+            else:
+                self._entries.move_to_end(key)
+                if entry[0] != window_start:
+                    # 进入新窗口：紧邻的上一窗口计数保留用于加权，更早的直接丢弃
+                    entry[1] = entry[2] if window_start - entry[0] == window else 0
+                    entry[2] = 0
+                    entry[0] = window_start
+            entry[3] = now
+
+            estimated = entry[1] * (window - (now - window_start)) / window + entry[2]
+            allowed = estimated < policy.limit
+            if allowed:
+                entry[2] += 1
+                estimated += 1
+
+            self._evict(now)
+        return allowed, estimated, window_start + window
+
+    def peek(self, key: Tuple[str, str], policy: RateLimitPolicy, now: float) -> float:
+        """读取估算请求数，不计入本次"""
+        window = policy.window
+        window_start = now - now % window
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0
+            if entry[0] == window_start:
+                previous, current = entry[1], entry[2]
+            elif window_start - entry[0] == window:
+                previous, current = entry[2], 0
+            else:
+                return 0
+        return previous * (window - (now - window_start)) / window + current
+
+    def _evict(self, now: float) -> None:
+        """淘汰超出容量或空闲超时的键，每次最多检查少量队首条目"""
+        entries = self._entries
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+        for _ in range(2):
+            if not entries:
+                return
+            oldest_key = next(iter(entries))
+            if now - entries[oldest_key][3] < self.idle_ttl:
+                return
+            del entries[oldest_key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteRateLimitStore:
+    """多进程共享的滑动窗口计数存储（WAL 模式 SQLite）
+
+    同一主机上的多个工作进程共用一个数据库文件，每次计数在 BEGIN IMMEDIATE
+    事务内完成读取-判断-写入，保证跨进程原子性。过期键定期批量删除。
+    """
+
+    PRUNE_INTERVAL = 30  # 清理过期键的间隔（秒）
+
+    def __init__(self, db_path: str, max_keys: int = 100000, idle_ttl: int = 120):
+        self.db_path = db_path
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._next_prune = 0
+        self._conn = sqlite3.connect(db_path, timeout=1, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=OFF')  # 计数丢失可接受，不需要落盘保证
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit (
+                key TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                prev INTEGER NOT NULL,
+                curr INTEGER NOT NULL,
+                last_seen REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limit_last_seen ON rate_limit(last_seen)')
+
+    @staticmethod
+    def _key(key: Tuple[str, str]) -> str:
+        return f'{key[0]}|{key[1]}'
+
+    def hit(self, key: Tuple[str, str], policy: RateLimitPolicy, now: float) -> Tuple[bool, float, float]:
+        """记录一次请求，返回值与 MemoryRateLimitStore.hit 相同"""
+        window = policy.window
+        window_start = now - now % window
+        db_key = self._key(key)
+        with self._lock:
+            conn = self._conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT window_start, prev, curr FROM rate_limit WHERE key = ?', (db_key,)
+                ).fetchone()
+                previous, current = 0, 0
+                if row is not None:
+                    if row[0] == window_start:
+                        previous, current = row[1], row[2]
+                    elif window_start - row[0] == window:
+                        previous = row[2]
+
+                estimated = previous * (window - (now - window_start)) / window + current
+                allowed = estimated < policy.limit
+                if allowed:
+                    current += 1
+                    estimated += 1
+
+                conn.execute(
+                    'INSERT OR REPLACE INTO rate_limit (key, window_start, prev, curr, last_seen) VALUES (?, ?, ?, ?, ?)',
+                    (db_key, window_start, previous, current, now)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+            if now >= self._next_prune:
+                self._next_prune = now + self.PRUNE_INTERVAL
+                self._prune(now)
+        return allowed, estimated, window_start + window
+
+    def peek(self, key: Tuple[str, str], policy: RateLimitPolicy, now: float) -> float:
+        """读取估算请求数，不计入本次"""
+        window = policy.window
+        window_start = now - now % window
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT window_start, prev, curr FROM rate_limit WHERE key = ?', (self._key(key),)
+            ).fetchone()
+        if row is None:
+            return 0
+        if row[0] == window_start:
+            previous, current = row[1], row[2]
+        elif window_start - row[0] == window:
+            previous, current = row[2], 0
+        else:
+            return 0
+        return previous * (window - (now - window_start)) / window + current
+
+    def _prune(self, now: float) -> None:
+        """删除空闲超时的键，超出容量时删除最久未访问的键"""
+        try:
+            self._conn.execute('DELETE FROM rate_limit WHERE last_seen < ?', (now - self.idle_ttl,))
+            self._conn.execute('''
+                DELETE FROM rate_limit WHERE key IN (
+                    SELECT key FROM rate_limit ORDER BY last_seen DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_keys,))
+        except sqlite3.Error as e:
+            logger.warning(f"清理速率限制记录失败: {str(e)}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM rate_limit').fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM rate_limit')
+
+
 class RateLimitService:
     """速率限制服务类"""
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(RateLimitService, cls).__new__(cls)
         return cls._instance
-        
+
     def __init__(self):
         """初始化速率限制服务"""
         if not hasattr(self, 'initialized'):
-            self.request_counts = defaultdict(list)  # IP -> [(timestamp, count), ...]
+            config = SECURITY['rate_limit']
+            self.default_policy = RateLimitPolicy('default', config['limit'], config['window'])
+            # 路由前缀 -> 策略，按前缀长度降序匹配
+            self.policies = sorted(
+                (
+                    (prefix, RateLimitPolicy(prefix, policy['limit'], policy.get('window', config['window'])))
+                    for prefix, policy in config.get('policies', {}).items()
+                ),
+                key=lambda item: len(item[0]),
+                reverse=True
+            )
+            self._route_policies: Dict[str, RateLimitPolicy] = {}  # 路由规则 -> 策略缓存
+            self.white_ips = frozenset(SECURITY.get('white_ips', []))
+            max_window = max([self.default_policy.window] + [p.window for _, p in self.policies])
+            self.store = self._create_store(config, idle_ttl=max_window * 2)
             self.initialized = True
-            
-    def _clean_old_requests(self, ip):
-        """清理过期的请求记录"""
-        if ip not in self.request_counts:
-            self.request_counts[ip] = []
-            return
-            
-        now = time.time()
-        window = SECURITY['rate_limit']['window']
-        cutoff = now - window
-        
-        # 保留最近 window 秒内的记录
-        self.request_counts[ip] = [t for t in self.request_counts[ip] if t > cutoff]
-        
+
+    @staticmethod
+    def _create_store(config, idle_ttl: int):
+        """按配置创建计数存储，多进程部署时使用共享存储"""
+        max_keys = config.get('max_keys', 100000)
+        if config.get('storage') == 'shared':
+            db_path = os.path.join(
+                os.path.dirname(os.path.dirname(__file__)),
+                'database',
+                config.get('shared_db', 'rate_limit.db')
+            )
+            try:
+                return SqliteRateLimitStore(db_path, max_keys=max_keys, idle_ttl=idle_ttl)
+            except sqlite3.Error as e:
+                logger.error(f"共享速率限制存储初始化失败，改用进程内存储: {str(e)}")
+        return MemoryRateLimitStore(max_keys=max_keys, idle_ttl=idle_ttl)
+
     def is_enabled(self):
         """检查速率限制是否启用"""
         return SECURITY['rate_limit']['enabled']
-        
+
+    def get_policy(self, request) -> RateLimitPolicy:
+        """获取请求对应的限制策略，按路由规则缓存匹配结果"""
+        rule = request.url_rule.rule if request.url_rule else None
+        if rule is not None:
+            policy = self._route_policies.get(rule)
+            if policy is not None:
+                return policy
+
+        path = rule or request.path
+        policy = self.default_policy
+        for prefix, candidate in self.policies:
+            if path.startswith(prefix):
+                policy = candidate
+                break
+
+        # 只缓存路由规则，未匹配路由的原始路径数量不可控
+        if rule is not None:
+            self._route_policies[rule] = policy
+        return policy
+
     def check_rate_limit(self, request):
         """
         检查请求是否超过速率限制
-        
+
         Args:
             request: Flask 请求对象
-        
+
         Returns:
             如果超过限制，返回 429 响应；否则返回 None
         """
         if not self.is_enabled() or request.method == 'OPTIONS':
             return None
-        
+
         # 获取客户端 IP
         client_ip = request.remote_addr
-        
+
         # 检查白名单
-        if client_ip in SECURITY.get('white_ips', []):
+        if client_ip in self.white_ips:
             return None
-            
+
         # 检查是否有效的API密钥
         api_key = request.headers.get('X-API-Key')
         if api_key and api_key == PROD_SERVER['API_KEY']:
             return None
-        
-        # 获取当前时间
-        current_time = int(time.time())
-        
-        # 获取该 IP 的请求记录
-        if client_ip not in self.request_counts:
-            self.request_counts[client_ip] = []
-        
-        # 清理过期的请求记录
-        window_start = current_time - SECURITY['rate_limit']['window']
-        self.request_counts[client_ip] = [t for t in self.request_counts[client_ip] if t >= window_start]
-        
-        # 检查是否超过限制
-        if len(self.request_counts[client_ip]) >= SECURITY['rate_limit']['limit']:
+
+        policy = self.get_policy(request)
+        now = time.time()
+        try:
+            allowed, estimated, reset_at = self.store.hit((policy.name, client_ip), policy, now)
+        except sqlite3.Error as e:
+            # 共享存储暂时不可用（如锁等待超时）时放行，不影响正常请求
+            logger.warning(f"速率限制计数失败: {str(e)}")
+            return None
+
+        # 保存本次判断结果，由 add_rate_limit_headers 写入响应头
+        g.rate_limit = (policy.limit, max(0, int(policy.limit - estimated)), max(1, int(reset_at - now + 0.999)))
+
+        if not allowed:
             # 超过限制，返回 429 响应
-            logger.warning(f"IP {client_ip} 请求过于频繁，已被限制")
-            return jsonify({
+            logger.warning(f"IP {client_ip} 请求过于频繁，已被限制 (策略: {policy.name})")
+            response = jsonify({
                 'code': 429,
                 'msg': '请求过于频繁，请稍后再试'
-            }), 429
-        
-        # 记录本次请求
-        self.request_counts[client_ip].append(current_time)
-        
+            })
+            response.status_code = 429
+            response.headers['Retry-After'] = str(g.rate_limit[2])
+            return response
+
         # 未超过限制，返回 None
         return None
-        
-    def get_remaining_requests(self, ip):
+
+    def add_rate_limit_headers(self, response):
+        """添加 X-RateLimit-* 响应头"""
+        rate_limit = g.get('rate_limit')
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response.headers['X-RateLimit-Limit'] = str(limit)
+            response.headers['X-RateLimit-Remaining'] = str(remaining)
+            response.headers['X-RateLimit-Reset'] = str(reset)
+        return response
+
+    def get_remaining_requests(self, ip, policy: RateLimitPolicy = None) -> Optional[int]:
         """获取剩余请求数量"""
         if not self.is_enabled():
             return None
-            
-        self._clean_old_requests(ip)
-        
-        now = time.time()
-        current_count = sum(1 for t in self.request_counts[ip] if t > now - SECURITY['rate_limit']['window'])
-        
-        return SECURITY['rate_limit']['limit'] - current_count
-        
+
+        policy = policy or self.default_policy
+        estimated = self.store.peek((policy.name, ip), policy, time.time())
+        return max(0, int(policy.limit - estimated))
+
     def handle_rate_limit(self, request):
         """处理速率限制
-        
+
         Returns:
             如果超过限制，返回错误响应；否则返回 None
         """
         if not self.is_enabled():
             return None
-            
+
         if request.path.startswith(('/static/', '/.well-known/')):
             return None
-            
-        client_ip = request.remote_addr
-        
+
         # 检查白名单
-        if client_ip in SECURITY.get('white_ips', []):
+        if request.remote_addr in self.white_ips:
             return None
-            
+
         # 检查是否超过速率限制
         limit_result = self.check_rate_limit(request)
         if limit_result is not None:
             # 已在 check_rate_limit 中返回了响应
             return limit_result
-            
+
         # 未超过限制
         return None
 
 # 创建速率限制服务实例
-rate_limit_service = RateLimitService() 
\ No newline at end of file
+rate_limit_service = RateLimitService()
@@ -0,0 +1,264 @@
+"""
+积分/经验流水汇总服务
+exp_record 和 points_record 每次变动一行，画玩家成长曲线不再扫描全部流水，而是读取按天、按周汇总的
+player_record_rollup 表：
+
+    kind           exp / points
+    period         day / week（周一开始，按服务器本地时间划分）
+    period_start   周期开始时间戳
+    delta          周期内变动合计
+    closing_total  周期内最后一条流水之后的总值（流水未记录 total 时按上一周期的总值累加）
+    event_count    周期内流水条数
+
+两张流水表上的插入触发器在同一事务内更新汇总。汇总表和触发器在服务启动时（start()）创建并根据现有流水
+回填，也可以执行 utils/tools/rebuild_record_rollups.py；请求中只检查是否已创建，不在请求中回填。
+流水只追加不修改；手工修改或删除流水后可调用 rebuild() 重新回填。
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Union
+from utils import db_connection
+from utils.response_handler import ResponseHandler, StatusCode
+
+logger = logging.getLogger(__name__)
+
+# 汇总类型 -> 流水表
+RECORD_TABLES = {
+    'exp': 'exp_record',
+    'points': 'points_record',
+}
+
+# 周期 -> 计算周期开始时间（本地时间零点）的表达式模板，{t} 为 unix 时间戳
+PERIOD_STARTS = {
+    'day': "CAST(strftime('%s', date({t}, 'unixepoch', 'localtime'), 'utc') AS INTEGER)",
+    'week': "CAST(strftime('%s', date({t}, 'unixepoch', 'localtime', 'weekday 0', '-6 days'), 'utc') AS INTEGER)",
+}
+
+
+def _trigger_body(kind: str) -> str:
+    """生成插入流水时按天、按周累加汇总的语句"""
+    statements = []
+    for period, start_template in PERIOD_STARTS.items():
+        start = start_template.format(t='CAST(NEW.addtime AS INTEGER)')
+        statements.append(f'''
+            INSERT INTO player_record_rollup (
+                kind, period, player_id, period_start, delta, closing_total, last_time, event_count
+            )
+            SELECT '{kind}', '{period}', NEW.player_id, {start}, IFNULL(NEW.number, 0),
+                COALESCE(
+                    NEW.total,
+                    (SELECT closing_total FROM player_record_rollup
+                     WHERE kind = '{kind}' AND period = '{period}' AND player_id = NEW.player_id
+                     AND period_start < {start}
+                     ORDER BY period_start DESC LIMIT 1) + IFNULL(NEW.number, 0),
+                    IFNULL(NEW.number, 0)
+                ),
+                CAST(NEW.addtime AS INTEGER), 1
+            WHERE NEW.player_id IS NOT NULL AND NEW.addtime IS NOT NULL
+            ON CONFLICT (kind, period, player_id, period_start) DO UPDATE SET
+                delta = delta + excluded.delta,
+                event_count = event_count + 1,
+                closing_total = CASE WHEN excluded.last_time >= last_time
+                    THEN COALESCE(NEW.total, closing_total + excluded.delta) ELSE closing_total END,
+                last_time = MAX(last_time, excluded.last_time);
+        ''')
+    return ''.join(statements)
+
+
+class RecordRollupService:
+    _instance = None
+
+    MAX_POINTS = 400  # 单次查询最多返回的周期数
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RecordRollupService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self._schema_ready = False
+            self._lock = threading.Lock()
+            self.initialized = True
+
+    def start(self, db_path: str) -> None:
+        """服务启动时创建汇总表和触发器，首次创建时回填全部流水"""
+        conn = db_connection.connect(db_path)
+        try:
+            started = time.perf_counter()
+            self.ensure_schema(conn.cursor())
+            logger.info(f"积分/经验流水汇总已就绪，耗时 {time.perf_counter() - started:.2f} 秒")
+        finally:
+            conn.close()
+
+    def is_ready(self, cursor) -> bool:
+        """汇总表和触发器是否已创建，只读取 sqlite_master，不建表、不回填"""
+        if not self._schema_ready:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_points_record_rollup'"
+            )
+            if cursor.fetchone():
+                self._schema_ready = True
+        return self._schema_ready
+
+    def ensure_schema(self, cursor) -> None:
+        """创建汇总表和触发器，首次创建时根据现有流水回填
+
+        不在事务中时单独开启写事务并提交（每个进程一次）；在调用方事务中时随调用方事务提交。
+        """
+        if self._schema_ready:
+            return
+        with self._lock:
+            if self._schema_ready:
+                return
+            conn = cursor.connection
+            standalone = not conn.in_transaction
+            if standalone:
+                cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_points_record_rollup'"
+                )
+                if not cursor.fetchone():
+                    self._create_schema(cursor)
+                if standalone:
+                    conn.commit()
+                    self._schema_ready = True
+            except Exception:
+                if standalone:
+                    conn.rollback()
+                raise
+
+    def _create_schema(self, cursor) -> None:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS player_record_rollup (
+                kind TEXT NOT NULL,
+                period TEXT NOT NULL,
+                player_id INTEGER NOT NULL,
+                period_start INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                closing_total INTEGER,
+                last_time INTEGER NOT NULL,
+                event_count INTEGER NOT NULL,
+                PRIMARY KEY (kind, period, player_id, period_start)
+            ) WITHOUT ROWID
+        ''')
+        for kind, table in RECORD_TABLES.items():
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup AFTER INSERT ON {table}
+                BEGIN
+                    {_trigger_body(kind)}
+                END
+            ''')
+        self.rebuild(cursor)
+        logger.info("积分/经验流水汇总表已创建")
+
+    def rebuild(self, cursor, kind: Optional[str] = None) -> None:
+        """根据流水全量重建汇总，kind 为空时重建全部类型
+
+        与触发器的累加方式一致：每条流水之后的总值为该流水的 total，未记录 total 时为上一条流水之后的
+        总值加本条变动（即最近一条有 total 的流水的 total 加之后各条的变动，之前没有时从 0 开始）。
+        """
+        for record_kind, table in RECORD_TABLES.items():
+            if kind and record_kind != kind:
+                continue
+            cursor.execute('DELETE FROM player_record_rollup WHERE kind = ?', (record_kind,))
+            for period, start_template in PERIOD_STARTS.items():
+                start = start_template.format(t='t')
+                cursor.execute(f'''
+                    INSERT INTO player_record_rollup (
+                        kind, period, player_id, period_start, delta, closing_total, last_time, event_count
+                    )
+                    SELECT ?, ?, player_id, period_start, SUM(number),
+                        MAX(CASE WHEN rn = 1 THEN carried_total END), MAX(t), COUNT(*)
+                    FROM (
+                        SELECT player_id, number, t, period_start, rn,
+                            IFNULL(FIRST_VALUE(total) OVER (
+                                PARTITION BY player_id, segment_id ORDER BY t, id
+                            ), 0) + SUM(CASE WHEN total IS NULL THEN number ELSE 0 END) OVER (
+                                PARTITION BY player_id, segment_id ORDER BY t, id
+                            ) AS carried_total
+                        FROM (
+                            -- segment_id: 到本条为止有 total 的流水数，同一段从一条有 total 的流水开始
+                            SELECT id, player_id, IFNULL(number, 0) AS number, total, t, {start} AS period_start,
+                                COUNT(total) OVER (PARTITION BY player_id ORDER BY t, id) AS segment_id,
+                                ROW_NUMBER() OVER (PARTITION BY player_id, {start} ORDER BY t DESC, id DESC) AS rn
+                            FROM (
+                                SELECT id, player_id, number, total, CAST(addtime AS INTEGER) AS t
+                                FROM {table}
+                                WHERE player_id IS NOT NULL AND addtime IS NOT NULL
+                            )
+                        )
+                    )
+                    GROUP BY player_id, period_start
+                ''', (record_kind, period))
+
+    @staticmethod
+    def _parse_time(value: Union[int, str, None]) -> Optional[int]:
+        """时间参数支持时间戳和 YYYY-MM-DD"""
+        if value in (None, ''):
+            return None
+        if isinstance(value, int) or str(value).isdigit():
+            return int(value)
+        return int(datetime.strptime(str(value), '%Y-%m-%d').timestamp())
+
+    def get_history(self, cursor, player_id: int, kind: str = 'exp', period: str = 'day',
+                    start=None, end=None) -> Dict:
+        """读取玩家在 [start, end] 内的按天/按周汇总，默认最近 MAX_POINTS 个周期"""
+        if kind not in RECORD_TABLES:
+            return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=f"不支持的类型: {kind}")
+        if period not in PERIOD_STARTS:
+            return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=f"不支持的周期: {period}")
+        try:
+            start_time = self._parse_time(start)
+            end_time = self._parse_time(end)
+        except ValueError:
+            return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg="时间格式应为时间戳或 YYYY-MM-DD")
+
+        if not self.is_ready(cursor):
+            # 回填会长时间持有写锁，只在服务启动时或由回填工具执行
+            return ResponseHandler.error(
+                code=StatusCode.SERVICE_UNAVAILABLE,
+                msg="成长记录汇总尚未生成，请重启服务或执行 utils/tools/rebuild_record_rollups.py"
+            )
+        conditions = ['kind = ?', 'period = ?', 'player_id = ?']
+        params = [kind, period, player_id]
+        if start_time is not None:
+            # 包含 start 所在的周期
+            conditions.append(f"period_start >= {PERIOD_STARTS[period].format(t='?')}")
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append('period_start <= ?')
+            params.append(end_time)
+        # 从最近的周期倒序取，再按时间顺序返回
+        cursor.execute(f'''
+            SELECT period_start, delta, closing_total, event_count
+            FROM player_record_rollup
+            WHERE {' AND '.join(conditions)}
+            ORDER BY period_start DESC
+            LIMIT ?
+        ''', params + [self.MAX_POINTS])
+        rows = cursor.fetchall()
+        rows.reverse()
+
+        items = [
+            {
+                'period_start': period_start,
+                'date': time.strftime('%Y-%m-%d', time.localtime(period_start)),
+                'delta': delta,
+                'opening_total': closing_total - delta if closing_total is not None else None,
+                'closing_total': closing_total,
+                'event_count': event_count
+            }
+            for period_start, delta, closing_total, event_count in rows
+        ]
+        return ResponseHandler.success(
+            data={'player_id': player_id, 'kind': kind, 'period': period, 'items': items},
+            msg="获取成长记录成功"
+        )
+
+
+# 创建流水汇总服务实例
+record_rollup_service = RecordRollupService()
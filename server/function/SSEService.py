@@ -9,6 +9,7 @@ from flask import Response, request, stream_with_context
 from typing import Dict, Any, Optional, Set, List
 from collections import defaultdict
 from config.config import  ENV, DOMAIN
+from utils.response_handler import json_dumps
 
 logger = logging.getLogger(__name__)
 
@@ -118,9 +119,8 @@ class SSEService:
             
     def _format_event(self, event_type: str, data: Dict[str, Any]) -> str:
         """格式化SSE事件"""
-        import json
         event_str = f"event: {event_type}\n"
-        event_str += f"data: {json.dumps(data)}\n\n"
+        event_str += f"data: {json_dumps(data).decode('utf-8')}\n\n"
         return event_str
         
     def _add_connection(self, player_id: str) -> str:
@@ -8,6 +8,10 @@ import time
 import logging
 from datetime import datetime, time as dt_time
 import sqlite3
+from utils import db_connection
+from utils.QueryProfiler import query_profiler
+from function.SSEService import sse_service
+from function.TaskEventService import task_event_service
 import os
 from typing import Optional
 
@@ -17,6 +21,10 @@ class SchedulerService:
     """调度器服务类"""
     _instance = None
     _lock = threading.Lock()
+
+    DAILY_ASSIGN_CHUNK_SIZE = 5000  # 每日任务分配每批处理的玩家数
+    EXPIRY_BATCH_SIZE = 500         # 过期任务每批更新的条数
+    EXPIRY_MAX_SLEEP = 300          # 过期任务清理最长等待时间（秒），兜底其他进程写入的任务
     
     def __new__(cls):
         if cls._instance is None:
@@ -35,74 +43,144 @@ class SchedulerService:
             )
             self.scheduler_thread = None
             self.is_running = False
+            self._daily_schema_ready = False
+            self.expiry_thread = None
+            self._expiry_event = threading.Event()
+            self._next_expiry = None  # 清理线程当前等待的到期时间
+            self._expiry_index_ready = False
             self.initialized = True
             
     def get_db_connection(self) -> sqlite3.Connection:
         """创建数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
+    def _ensure_daily_schema(self, conn: sqlite3.Connection) -> None:
+        """每日任务分配所需的列、唯一约束和进度表（每个进程检查一次）"""
+        if self._daily_schema_ready:
+            return
+        cursor = conn.cursor()
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(player_task)')]
+        if 'assign_date' not in columns:
+            # 由调度器分配的任务记录分配日期，手动接受的任务为 NULL
+            cursor.execute('ALTER TABLE player_task ADD COLUMN assign_date TEXT')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_player_task_daily_assign
+            ON player_task (player_id, task_id, assign_date)
+            WHERE assign_date IS NOT NULL
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_player_task_player_task_start
+            ON player_task (player_id, task_id, starttime)
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_task_assign_progress (
+                assign_date TEXT PRIMARY KEY,
+                last_player_id INTEGER NOT NULL DEFAULT 0,
+                finished INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER
+            )
+        ''')
+        conn.commit()
+        self._daily_schema_ready = True
+
+    @query_profiler.profiled('scheduler.assign_daily_tasks')
     def assign_daily_tasks(self) -> None:
-        """分配每日任务并处理过期任务"""
+        """分配每日任务并处理过期任务
+
+        按玩家ID分批执行 INSERT ... SELECT，每批一个短事务并记录进度；
+        中途中断后再次执行会从上次提交的批次继续，已分配的任务由唯一约束和今日记录检查跳过。
+        """
+        conn = None
         try:
             conn = self.get_db_connection()
+            self._ensure_daily_schema(conn)
             cursor = conn.cursor()
 
             # 获取当天的7点和22点时间戳
             today = datetime.now().date()
+            assign_date = today.isoformat()
             start_time = datetime.combine(today, dt_time(7, 0))  # 早上7点
             end_time = datetime.combine(today, dt_time(22, 0))   # 晚上10点
             start_timestamp = int(start_time.timestamp())
             end_timestamp = int(end_time.timestamp())
-            current_time = int(datetime.now().timestamp())
-            
+
             # 更新过期任务状态为UNFINISH
+            self.sweep_expired_tasks()
+
+            # 读取今日进度，未完成时从上次提交的位置继续，已完成时重新检查一遍（补充新玩家和新任务）
             cursor.execute('''
-                UPDATE player_task 
-                SET status = 'UNFINISH'
-                WHERE status = 'IN_PROGRESS' 
-                AND endtime < ? 
-                AND endtime != 0
-            ''', (current_time,))
-
-            # 获取所有启用的每日任务
-            cursor.execute('''
-                SELECT id, task_scope 
-                FROM task 
-                WHERE is_enabled = 1 AND task_type = 'DAILY'
-            ''')
-            daily_tasks = cursor.fetchall()
-
-            # 获取所有玩家ID
-            cursor.execute('SELECT player_id FROM player_data')
-            all_players = [row[0] for row in cursor.fetchall()]
-
-            # 为每个任务分配玩家
-            for task_id, task_scope in daily_tasks:
-                if task_scope == 0:  # 所有玩家都可见的任务
-                    players = all_players
-                else:  # 特定玩家的任务
-                    players = [task_scope]
-
-                # 为符合条件的玩家添加任务
-                for player_id in players:
-                    # 检查玩家是否已有该任务
-                    cursor.execute('''
-                        SELECT id FROM player_task 
-                        WHERE player_id = ? AND task_id = ? 
-                        AND starttime >= ? AND starttime < ?
-                    ''', (player_id, task_id, start_timestamp, end_timestamp))
-
-                    if not cursor.fetchone():  # 如果玩家在今天还没有这个任务
-                        cursor.execute('''
-                            INSERT INTO player_task 
-                            (player_id, task_id, starttime, endtime, status) 
-                            VALUES (?, ?, ?, ?, 'IN_PROGRESS')
-                        ''', (player_id, task_id, start_timestamp, end_timestamp))
+                SELECT last_player_id, finished FROM daily_task_assign_progress
+                WHERE assign_date = ?
+            ''', (assign_date,))
+            progress = cursor.fetchone()
+            last_player_id = progress['last_player_id'] if progress and not progress['finished'] else 0
+            if last_player_id:
+                logger.info(f"每日任务分配从玩家ID {last_player_id} 之后继续")
+
+            cursor.execute('SELECT COUNT(*) FROM player_data WHERE player_id > ?', (last_player_id,))
+            remaining = cursor.fetchone()[0]
+            processed = 0
+            inserted = 0
+
+            while True:
+                # 确定本批次的玩家ID上界
+                cursor.execute('''
+                    SELECT MAX(player_id) FROM (
+                        SELECT player_id FROM player_data
+                        WHERE player_id > ?
+                        ORDER BY player_id
+                        LIMIT ?
+                    )
+                ''', (last_player_id, self.DAILY_ASSIGN_CHUNK_SIZE))
+                upper_player_id = cursor.fetchone()[0]
+                if upper_player_id is None:
+                    break
+
+                # 逐行的插入触发器暂停，汇总表和事件日志按批次一次维护
+                inserted += task_event_service.bulk_insert(cursor, '''
+                    INSERT OR IGNORE INTO player_task
+                    (player_id, task_id, starttime, endtime, status, assign_date)
+                    SELECT p.player_id, t.id, ?, ?, 'IN_PROGRESS', ?
+                    FROM player_data p
+                    JOIN task t
+                        ON t.is_enabled = 1 AND t.task_type = 'DAILY'
+                        AND (t.task_scope = 0 OR t.task_scope = p.player_id)
+                    WHERE p.player_id > ? AND p.player_id <= ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM player_task pt
+                        WHERE pt.player_id = p.player_id AND pt.task_id = t.id
+                        AND pt.starttime >= ? AND pt.starttime < ?
+                    )
+                ''', (start_timestamp, end_timestamp, assign_date,
+                      last_player_id, upper_player_id,
+                      start_timestamp, end_timestamp))
 
+                cursor.execute('''
+                    SELECT COUNT(*) FROM player_data
+                    WHERE player_id > ? AND player_id <= ?
+                ''', (last_player_id, upper_player_id))
+                processed += cursor.fetchone()[0]
+                last_player_id = upper_player_id
+
+                # 进度与本批次的任务在同一事务中提交
+                cursor.execute('''
+                    INSERT OR REPLACE INTO daily_task_assign_progress
+                    (assign_date, last_player_id, finished, updated_at)
+                    VALUES (?, ?, 0, ?)
+                ''', (assign_date, last_player_id, int(time.time())))
+                conn.commit()
+                logger.info(f"每日任务分配进度: {processed}/{remaining} 玩家, 新增任务 {inserted}")
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO daily_task_assign_progress
+                (assign_date, last_player_id, finished, updated_at)
+                VALUES (?, ?, 1, ?)
+            ''', (assign_date, last_player_id, int(time.time())))
             conn.commit()
-            logger.info(f"每日任务分配成功 {datetime.now()}")
+            logger.info(f"每日任务分配成功 {datetime.now()}, 新增任务 {inserted}")
+            self.notify_task_expiry(end_timestamp)
 
         except sqlite3.Error as e:
             logger.error(f"数据库错误在assign_daily_tasks: {str(e)}")
@@ -112,6 +190,116 @@ class SchedulerService:
             if conn:
                 conn.close()
 
+    def _ensure_expiry_index(self, conn: sqlite3.Connection) -> None:
+        """进行中任务按到期时间的部分索引，最近到期时间和到期任务都只需索引查找"""
+        if self._expiry_index_ready:
+            return
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_player_task_in_progress_endtime
+            ON player_task (endtime)
+            WHERE status = 'IN_PROGRESS' AND endtime IS NOT NULL AND endtime != 0
+        ''')
+        conn.commit()
+        self._expiry_index_ready = True
+
+    def get_next_expiry(self) -> Optional[int]:
+        """获取进行中任务最近的到期时间，没有限时任务时返回 None"""
+        conn = None
+        try:
+            conn = self.get_db_connection()
+            self._ensure_expiry_index(conn)
+            row = conn.execute('''
+                SELECT MIN(endtime) FROM player_task
+                WHERE status = 'IN_PROGRESS' AND endtime IS NOT NULL AND endtime != 0
+            ''').fetchone()
+            return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"获取最近到期时间失败: {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def sweep_expired_tasks(self) -> int:
+        """将已过期的进行中任务更新为 UNFINISH，只处理到期的记录，并推送任务更新事件
+
+        Returns:
+            int: 本次更新的任务数
+        """
+        conn = None
+        expired = []
+        try:
+            conn = self.get_db_connection()
+            self._ensure_expiry_index(conn)
+            cursor = conn.cursor()
+            current_time = int(time.time())
+
+            while True:
+                cursor.execute('''
+                    SELECT id, player_id, task_id, endtime FROM player_task
+                    WHERE status = 'IN_PROGRESS' AND endtime IS NOT NULL AND endtime != 0
+                    AND endtime < ?
+                    ORDER BY endtime
+                    LIMIT ?
+                ''', (current_time, self.EXPIRY_BATCH_SIZE))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                # 每批一条条件更新，期间已被提交或放弃的任务不受影响
+                changed = task_event_service.transition_many(
+                    cursor, [row['id'] for row in rows], 'UNFINISH', ('IN_PROGRESS',)
+                )
+                conn.commit()
+                changed_ids = {row['id'] for row in changed}
+                expired.extend(dict(row) for row in rows if row['id'] in changed_ids)
+                if len(rows) < self.EXPIRY_BATCH_SIZE:
+                    break
+
+        except sqlite3.Error as e:
+            logger.error(f"数据库错误在sweep_expired_tasks: {str(e)}")
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
+
+        for row in expired:
+            sse_service.broadcast_to_room(f"user_{row['player_id']}", 'task_update', {
+                'type': 'TASK_EXPIRED',
+                'player_task_id': row['id'],
+                'task_id': row['task_id'],
+                'status': 'UNFINISH',
+                'endtime': row['endtime']
+            })
+        if expired:
+            logger.info(f"过期任务已更新为UNFINISH: {len(expired)} 条")
+        return len(expired)
+
+    def notify_task_expiry(self, endtime: Optional[int]) -> None:
+        """新的限时任务写入后调用，到期时间早于当前等待时间时唤醒清理线程"""
+        if not endtime:
+            return
+        next_expiry = self._next_expiry
+        if next_expiry is None or endtime < next_expiry:
+            self._expiry_event.set()
+
+    def run_expiry_sweeper(self) -> None:
+        """过期任务清理线程：等待到最近一个任务到期，只更新到期的任务"""
+        while self.is_running:
+            self._expiry_event.clear()
+            self.sweep_expired_tasks()
+
+            next_expiry = self.get_next_expiry()
+            self._next_expiry = next_expiry
+            if next_expiry is None:
+                timeout = self.EXPIRY_MAX_SLEEP
+            else:
+                # endtime < 当前时间 才视为过期，等到 endtime 的下一秒
+                timeout = min(max(next_expiry + 1 - time.time(), 0), self.EXPIRY_MAX_SLEEP)
+            self._expiry_event.wait(timeout)
+        self._next_expiry = None
+
     def check_daily_tasks(self) -> None:
         """在程序启动时检查今日任务分配情况"""
         current_hour = datetime.now().hour
@@ -135,12 +323,18 @@ class SchedulerService:
             self.scheduler_thread = threading.Thread(target=self.run_scheduler)
             self.scheduler_thread.daemon = True
             self.scheduler_thread.start()
+            self.expiry_thread = threading.Thread(target=self.run_expiry_sweeper)
+            self.expiry_thread.daemon = True
+            self.expiry_thread.start()
             logger.info("启动调度器")
 
     def stop(self) -> None:
         """停止调度器"""
         if self.is_running:
             self.is_running = False
+            self._expiry_event.set()
+            if self.expiry_thread:
+                self.expiry_thread.join()
             if self.scheduler_thread:
                 self.scheduler_thread.join()
             logger.info("停止调度器")
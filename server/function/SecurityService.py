@@ -13,12 +13,26 @@
 处理应用程序的安全相关功能
 """
 import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from flask import request, jsonify
 from config.config import SECURITY, PROD_SERVER
 from utils.response_handler import ResponseHandler, StatusCode
 
 logger = logging.getLogger(__name__)
 
+
+def _compile_patterns(patterns):
+    """将子串列表编译为单个正则，一次扫描完成全部匹配"""
+    if not patterns:
+        return None
+    ordered = sorted(set(p.lower() for p in patterns))
+    return re.compile('|'.join(re.escape(p) for p in ordered))
+
+
 class SecurityService:
     """安全服务类"""
     _instance = None
@@ -31,31 +45,79 @@ class SecurityService:
     def __init__(self):
         """初始化安全服务"""
         if not hasattr(self, 'initialized'):
+            screening = SECURITY.get('screening', {})
+            self._suspicious_pattern = _compile_patterns(screening.get('suspicious_paths', []))
+            self._agent_pattern = _compile_patterns(screening.get('blocked_agents', []))
+
+            # 判定结果按 path / User-Agent 缓存，正常流量只需一次字典查找
+            cache_size = screening.get('cache_size', 4096)
+            self._match_suspicious_path = lru_cache(maxsize=cache_size)(self._match_suspicious_path)
+            self._match_blocked_agent = lru_cache(maxsize=cache_size)(self._match_blocked_agent)
+
+            # 屏蔽名单: IP -> 解除时间；违规记录: IP -> [次数, 首次违规时间]
+            self.block_threshold = screening.get('block_threshold', 5)
+            self.block_window = screening.get('block_window', 300)
+            self.block_ttl = screening.get('block_ttl', 3600)
+            self.max_tracked_ips = screening.get('max_tracked_ips', 10000)
+            self._blocked_ips = {}
+            self._offenses = OrderedDict()
+            self._block_lock = threading.Lock()
             self.initialized = True
             
     def is_security_enabled(self):
         """检查安全配置是否启用"""
         return SECURITY.get('open', False)
-            
+
+    def _match_suspicious_path(self, path):
+        """路径是否包含可疑片段（结果经 LRU 缓存）"""
+        return self._suspicious_pattern is not None and self._suspicious_pattern.search(path.lower()) is not None
+
+    def _match_blocked_agent(self, user_agent):
+        """User-Agent 是否属于被拦截的客户端（结果经 LRU 缓存）"""
+        return self._agent_pattern is not None and self._agent_pattern.search(user_agent.lower()) is not None
+
+    def is_ip_blocked(self, ip):
+        """IP 是否在屏蔽名单中，过期条目在查询时移除"""
+        expires_at = self._blocked_ips.get(ip)
+        if expires_at is None:
+            return False
+        if expires_at > time.time():
+            return True
+        with self._block_lock:
+            self._blocked_ips.pop(ip, None)
+        return False
+
+    def record_offense(self, ip, reason):
+        """记录一次违规，时间窗口内达到阈值的 IP 加入屏蔽名单"""
+        if not ip or ip in SECURITY.get('white_ips', []):
+            return
+        now = time.time()
+        with self._block_lock:
+            record = self._offenses.get(ip)
+            if record is None or now - record[1] > self.block_window:
+                record = [0, now]
+                self._offenses[ip] = record
+            self._offenses.move_to_end(ip)
+            record[0] += 1
+
+            if record[0] >= self.block_threshold:
+                self._blocked_ips[ip] = now + self.block_ttl
+                del self._offenses[ip]
+                logger.warning(f"IP {ip} 多次触发安全检查({reason})，屏蔽 {self.block_ttl} 秒")
+
+            while len(self._offenses) > self.max_tracked_ips:
+                self._offenses.popitem(last=False)
+            if len(self._blocked_ips) > self.max_tracked_ips:
+                self._blocked_ips = {k: v for k, v in self._blocked_ips.items() if v > now}
+
     def check_suspicious_request(self, path):
         """检查可疑请求"""
         if not self.is_security_enabled():
             return False
-            
-        suspicious_paths = [
-            'wp-', 'wordpress', 'admin', 'setup', 'install',
-            'phpmy', 'mysql', 'sql', 'database',
-            '.env', '.git', '.svn',
-            'shell', 'cmd', 'cgi',
-            'config', 'conf', 'cfg',
-            'php', 'asp', 'aspx', 'jsp'
-        ]
         
-        path = path.lower()
-        is_suspicious = any(p in path for p in suspicious_paths)
-        
-        if is_suspicious:
+        if self._match_suspicious_path(path):
             logger.warning(f"检测到可疑请求: {request.path} 来自 {request.remote_addr}")
+            self.record_offense(request.remote_addr, 'suspicious_path')
             return True
         return False
         
@@ -71,14 +133,13 @@ class SecurityService:
         api_key = request.headers.get('X-API-KEY')
         if api_key and api_key == PROD_SERVER['API_KEY']:
             # API密钥有效，允许请求通过
-            print(f"[Security] 检测到有效的API密钥，跳过用户代理检查")
+            logger.debug("[Security] 检测到有效的API密钥，跳过用户代理检查")
             return True
         
-        user_agent = request.headers.get('User-Agent', '').lower()
-        blocked_agents = ['zgrab', 'python-requests', 'curl', 'wget', 'postman']
-        
-        if any(agent in user_agent for agent in blocked_agents):
-            logger.warning(f"检测到可疑User-Agent: {user_agent} 来自 {request.remote_addr}")
+        user_agent = request.headers.get('User-Agent', '')
+        if self._match_blocked_agent(user_agent):
+            logger.warning(f"检测到可疑User-Agent: {user_agent.lower()} 来自 {request.remote_addr}")
+            self.record_offense(request.remote_addr, 'user_agent')
             return False
         return True
         
@@ -87,7 +148,10 @@ class SecurityService:
         if not self.is_security_enabled():
             return True
             
-        return not ('..' in request.path or '//' in request.path)
+        if '..' in request.path or '//' in request.path:
+            self.record_offense(request.remote_addr, 'path_injection')
+            return False
+        return True
         
     def add_security_headers(self, response):
         """添加安全响应头"""
@@ -123,6 +187,13 @@ class SecurityService:
         """请求安全检查"""
         if not self.is_security_enabled():
             return None
+
+        # 屏蔽名单中的 IP 直接拒绝
+        if self._blocked_ips and self.is_ip_blocked(request.remote_addr):
+            return jsonify({
+                'code': 403,
+                'msg': 'Forbidden'
+            }), 403
             
         # 检查用户代理，如果不通过直接返回响应
         user_agent_check = self.check_user_agent()
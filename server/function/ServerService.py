@@ -145,7 +145,7 @@ class ServerService:
         CORS(app, 
             supports_credentials=True,   # 确保凭据支持
             origins="*",                # 允许所有来源
-            allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
+            allow_headers=["Content-Type", "Authorization", "X-Requested-With", "Idempotency-Key"],
             methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
             max_age=3600               # 预检请求缓存1小时
         )
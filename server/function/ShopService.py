@@ -10,10 +10,13 @@
 
 import os
 import sqlite3
+from utils import db_connection
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional, Union
 from utils.response_handler import ResponseHandler, StatusCode
+from function.PlayerService import player_service
+from function.LeaderboardService import leaderboard_service
 
 logger = logging.getLogger(__name__)
 
@@ -49,7 +52,7 @@ class ShopService:
     def get_db(self) -> sqlite3.Connection:
         """获取数据库连接"""
         try:
-            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db = db_connection.connect(self.db_path, check_same_thread=False)
             db.row_factory = sqlite3.Row
             return db
         except Exception as e:
@@ -290,108 +293,113 @@ class ShopService:
     def purchase_item(self, player_id: int, item_id: int, quantity: int = 1) -> Dict:
         """
         购买商品
+        库存和积分分别用一条带条件的 UPDATE 扣减（库存足够、积分足够时才生效），
+        整个购买在 BEGIN IMMEDIATE 写事务内完成，事务内的读取不会被并发购买改变，
+        数据库繁忙时有限次退避重试。
         :param player_id: 玩家ID
         :param item_id: 商品ID
         :param quantity: 购买数量
         :return: 购买结果
         """
+        conn = None
         try:
+            if quantity <= 0:
+                return ResponseHandler.error(
+                    code=StatusCode.PARAM_ERROR,
+                    msg="购买数量无效"
+                )
             current_timestamp = int(datetime.now().timestamp())
             conn = self.get_db()
-            cursor = conn.cursor()
-            cursor.execute("BEGIN TRANSACTION")
             
-            # 获取商品信息并检查是否可购买
-            cursor.execute("""
-                SELECT 
-                    product_id as id,
-                    product_name as name,
-                    product_price as price,
-                    product_stock as stock
-                FROM shop 
-                WHERE product_id = ? 
-                AND online_time <= ?
-                AND (offline_time IS NULL OR offline_time > ?)
-            """, (item_id, current_timestamp, current_timestamp))
+            def purchase(cursor):
+                # 扣减库存，商品不存在、已下架或库存不足时不更新
+                cursor.execute("""
+                    UPDATE shop 
+                    SET product_stock = product_stock - ? 
+                    WHERE product_id = ? 
+                    AND online_time <= ?
+                    AND (offline_time IS NULL OR offline_time > ?)
+                    AND product_stock >= ?
+                """, (quantity, item_id, current_timestamp, current_timestamp, quantity))
+                if cursor.rowcount == 0:
+                    return 'item'
+                cursor.execute("SELECT product_price FROM shop WHERE product_id = ?", (item_id,))
+                total_price = cursor.fetchone()['product_price'] * quantity
+                
+                # 扣除积分，积分不足时不更新
+                cursor.execute("""
+                    UPDATE player_data 
+                    SET points = points - ? 
+                    WHERE player_id = ? AND points >= ?
+                """, (total_price, player_id, total_price))
+                if cursor.rowcount == 0:
+                    # 撤销已扣减的库存
+                    cursor.connection.rollback()
+                    return 'points'
+                player_service.invalidate_player(player_id, cursor)
+                cursor.execute("SELECT points FROM player_data WHERE player_id = ?", (player_id,))
+                user = cursor.fetchone()
+                leaderboard_service.set_score('points', player_id, user['points'], cursor)
+                
+                # 记录积分变动
+                cursor.execute("""
+                    INSERT INTO points_record 
+                    (player_id, number, addtime, total)
+                    VALUES (?, ?, strftime('%s','now'), ?)
+                """, (player_id, -total_price, user['points']))
+                
+                # 记录购买记录
+                cursor.execute("""
+                    INSERT INTO shop_record 
+                    (user_id, product_id, exchange_quantity, exchange_time, status)
+                    VALUES (?, ?, ?, datetime('now'), '已完成')
+                """, (player_id, item_id, quantity))
+                return None
             
-            item = cursor.fetchone()
-            if not item:
-                return ResponseHandler.error(
-                    code=StatusCode.SHOP_ITEM_NOT_FOUND,
-                    msg="商品不存在或已下架"
-                )
+            failed = db_connection.run_immediate(conn, purchase)
+            if failed is None:
+                return ResponseHandler.success(msg="购买成功")
             
-            if item['stock'] < quantity:
+            # 未扣减时再读取一次，区分失败原因
+            cursor = conn.cursor()
+            if failed == 'item':
+                cursor.execute("""
+                    SELECT product_stock as stock
+                    FROM shop 
+                    WHERE product_id = ? 
+                    AND online_time <= ?
+                    AND (offline_time IS NULL OR offline_time > ?)
+                """, (item_id, current_timestamp, current_timestamp))
+                if not cursor.fetchone():
+                    return ResponseHandler.error(
+                        code=StatusCode.SHOP_ITEM_NOT_FOUND,
+                        msg="商品不存在或已下架"
+                    )
                 return ResponseHandler.error(
                     code=StatusCode.SHOP_ITEM_SOLD_OUT,
                     msg="库存不足"
                 )
-                
-            total_price = item['price'] * quantity
-            
-            # 检查并更新用户积分
-            cursor.execute(
-                "SELECT points FROM player_data WHERE player_id = ?", 
-                (player_id,)
-            )
-            user = cursor.fetchone()
             
-            if not user:
+            cursor.execute("SELECT 1 FROM player_data WHERE player_id = ?", (player_id,))
+            if not cursor.fetchone():
                 return ResponseHandler.error(
                     code=StatusCode.PLAYER_NOT_FOUND,
                     msg="用户不存在"
                 )
-                
-            if user['points'] < total_price:
-                return ResponseHandler.error(
-                    code=StatusCode.PLAYER_POINTS_NOT_ENOUGH,
-                    msg="积分不足"
-                )
-                
-            # 扣除积分
-            cursor.execute("""
-                UPDATE player_data 
-                SET points = points - ? 
-                WHERE player_id = ?
-            """, (total_price, player_id))
-            
-            # 记录积分变动
-            cursor.execute("""
-                INSERT INTO points_record 
-                (player_id, number, addtime, total)
-                VALUES (?, ?, strftime('%s','now'), (
-                    SELECT points FROM player_data WHERE player_id = ?
-                ))
-            """, (player_id, -total_price, player_id))
-            
-            # 更新库存
-            cursor.execute("""
-                UPDATE shop 
-                SET product_stock = product_stock - ? 
-                WHERE product_id = ?
-            """, (quantity, item_id))
-            
-            # 记录购买记录
-            cursor.execute("""
-                INSERT INTO shop_record 
-                (user_id, product_id, exchange_quantity, exchange_time, status)
-                VALUES (?, ?, ?, datetime('now'), '已完成')
-            """, (player_id, item_id, quantity))
-            
-            conn.commit()
-            return ResponseHandler.success(msg="购买成功")
+            return ResponseHandler.error(
+                code=StatusCode.PLAYER_POINTS_LOW,
+                msg="积分不足"
+            )
             
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"购买商品失败: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.SHOP_PURCHASE_FAILED,
                 msg=str(e)
             )
         finally:
-            if cursor:
-                cursor.close()
+            if conn:
+                conn.close()
 
 # 创建全局实例
 shop_service = ShopService() 
\ No newline at end of file
@@ -3,6 +3,7 @@
 处理技能相关的业务逻辑
 """
 import sqlite3
+from utils import db_connection
 import os
 import logging
 from utils.response_handler import ResponseHandler, StatusCode
@@ -28,7 +29,7 @@ class SkillService:
             
     def get_db(self):
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
@@ -0,0 +1,219 @@
+"""
+任务目录缓存服务
+在进程内缓存 task 表，按 id / 类型 / 可见范围 / 父任务建立索引，并预先解析 task_rewards。
+
+task 表只在管理后台增删改，写入后调用 invalidate() 立即失效本进程缓存；
+task 表上的触发器维护 task_catalog_version 版本号，其他进程读取时按间隔比对版本号后重新加载。
+"""
+import json
+import os
+import sqlite3
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class TaskCatalogSnapshot:
+    """某一版本的任务目录，构建完成后只读
+
+    同时构建已启用任务的任务链图：按任务类型划分的 父任务ID -> 子任务ID 列表，
+    根任务即 parent_task_id 为 0 的子任务列表。
+    """
+
+    def __init__(self, version, rows: List[Dict]):
+        self.version = version
+        self.tasks: Dict[int, Dict] = {}
+        self.by_type: Dict[str, List[int]] = defaultdict(list)
+        self.by_scope: Dict[int, List[int]] = defaultdict(list)
+        self.children: Dict[int, List[int]] = defaultdict(list)
+        self.rewards: Dict[str, Dict] = {}  # task_rewards 原始JSON -> 解析结果
+
+        # 任务链图（仅已启用任务）: 任务类型 -> 父任务ID -> 子任务ID列表
+        self.chain_children: Dict[str, Dict[int, List[int]]] = defaultdict(lambda: defaultdict(list))
+        self.enabled_by_type: Dict[str, List[int]] = defaultdict(list)
+        self._projections: Dict[tuple, Dict[int, Dict]] = {}  # 字段元组 -> 任务ID -> 仅含这些字段的任务
+
+        for task in rows:
+            task_id = task['id']
+            self.tasks[task_id] = task
+            self.by_type[task['task_type']].append(task_id)
+            self.by_scope[task['task_scope']].append(task_id)
+            self.children[task['parent_task_id']].append(task_id)
+            if task['is_enabled']:
+                self.enabled_by_type[task['task_type']].append(task_id)
+                self.chain_children[task['task_type']][task['parent_task_id']].append(task_id)
+
+            raw = task.get('task_rewards')
+            if isinstance(raw, str) and raw not in self.rewards:
+                try:
+                    self.rewards[raw] = json.loads(raw)
+                except ValueError:
+                    self.rewards[raw] = {}
+
+    def chain_roots(self, task_type: str) -> List[int]:
+        """某类型任务链的根任务（已启用）"""
+        return self.chain_children.get(task_type, {}).get(0, [])
+
+    def chain_next(self, task_type: str, parent_ids) -> List[int]:
+        """某类型中以 parent_ids 为前置任务的已启用任务"""
+        children = self.chain_children.get(task_type, {})
+        return [task_id for parent_id in parent_ids for task_id in children.get(parent_id, ())]
+
+    def projected(self, fields: tuple) -> Dict[int, Dict]:
+        """按字段投影后的全部任务，每个版本只构建一次（共享对象，调用方不要修改）"""
+        projection = self._projections.get(fields)
+        if projection is None:
+            projection = {
+                task_id: {field: task[field] for field in fields}
+                for task_id, task in self.tasks.items()
+            }
+            self._projections[fields] = projection
+        return projection
+
+
+class TaskCatalogService:
+    _instance = None
+
+    VERSION_CHECK_INTERVAL = 1.0  # 跨进程版本号检查间隔（秒）
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TaskCatalogService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.db_path = os.path.join(
+                os.path.dirname(os.path.dirname(__file__)),
+                'database',
+                'game.db'
+            )
+            self._snapshot: Optional[TaskCatalogSnapshot] = None
+            self._checked_at = 0.0
+            self._schema_ready = False
+            self._lock = threading.Lock()
+            self.initialized = True
+
+    def _ensure_schema(self, conn) -> None:
+        """创建版本号表和 task 表上的触发器，任何来源的写入都会递增版本号"""
+        if self._schema_ready:
+            return
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS task_catalog_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO task_catalog_version (id, version) VALUES (1, 0);
+            CREATE TRIGGER IF NOT EXISTS trg_task_catalog_insert AFTER INSERT ON task
+            BEGIN
+                UPDATE task_catalog_version SET version = version + 1 WHERE id = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_task_catalog_update AFTER UPDATE ON task
+            BEGIN
+                UPDATE task_catalog_version SET version = version + 1 WHERE id = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_task_catalog_delete AFTER DELETE ON task
+            BEGIN
+                UPDATE task_catalog_version SET version = version + 1 WHERE id = 1;
+            END;
+        ''')
+        self._schema_ready = True
+
+    def _read_version(self, conn):
+        try:
+            self._ensure_schema(conn)
+            row = conn.execute('SELECT version FROM task_catalog_version WHERE id = 1').fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            # 版本号不可用时每个检查间隔都重新加载
+            logger.warning(f"读取任务目录版本号失败: {str(e)}")
+            return None
+
+    def _snapshot_fresh(self) -> TaskCatalogSnapshot:
+        """返回最新的任务目录，必要时检查版本号并重新加载"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < self.VERSION_CHECK_INTERVAL:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - self._checked_at < self.VERSION_CHECK_INTERVAL:
+                return snapshot
+
+            conn = db_connection.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            try:
+                version = self._read_version(conn)
+                if snapshot is None or version is None or version != snapshot.version:
+                    rows = [dict(row) for row in conn.execute('SELECT * FROM task ORDER BY id')]
+                    snapshot = TaskCatalogSnapshot(version, rows)
+                    self._snapshot = snapshot
+                    logger.debug(f"任务目录已加载: version={version}, tasks={len(rows)}")
+                self._checked_at = time.monotonic()
+            finally:
+                conn.close()
+            return snapshot
+
+    def invalidate(self) -> None:
+        """任务写入后调用，下一次读取时立即检查版本号"""
+        self._checked_at = 0.0
+
+    @property
+    def version(self):
+        return self._snapshot_fresh().version
+
+    def snapshot(self) -> TaskCatalogSnapshot:
+        """获取当前任务目录（含任务链图），同一请求内多次使用时避免重复检查版本"""
+        return self._snapshot_fresh()
+
+    def get(self, task_id: int) -> Optional[Dict]:
+        """按ID获取任务（共享对象，调用方不要修改）"""
+        return self._snapshot_fresh().tasks.get(task_id)
+
+    def get_many(self, task_ids) -> Dict[int, Dict]:
+        """批量获取任务，忽略不存在的ID"""
+        tasks = self._snapshot_fresh().tasks
+        return {task_id: tasks[task_id] for task_id in task_ids if task_id in tasks}
+
+    def get_by_type(self, task_type: str) -> List[Dict]:
+        snapshot = self._snapshot_fresh()
+        return [snapshot.tasks[task_id] for task_id in snapshot.by_type.get(task_type, [])]
+
+    def get_children(self, parent_task_id: int) -> List[Dict]:
+        snapshot = self._snapshot_fresh()
+        return [snapshot.tasks[task_id] for task_id in snapshot.children.get(parent_task_id, [])]
+
+    def get_visible_tasks(self, player_id: int, enabled_only: bool = True) -> List[Dict]:
+        """获取玩家可见的任务（公共任务和指定给该玩家的任务），按ID排序"""
+        snapshot = self._snapshot_fresh()
+        task_ids = snapshot.by_scope.get(0, [])
+        if player_id and player_id in snapshot.by_scope:
+            task_ids = sorted(task_ids + snapshot.by_scope[player_id])
+        tasks = (snapshot.tasks[task_id] for task_id in task_ids)
+        if enabled_only:
+            return [task for task in tasks if task['is_enabled']]
+        return list(tasks)
+
+    def parse_rewards(self, task_rewards) -> Dict:
+        """解析 task_rewards，目录中已有的直接返回预解析结果（只读）"""
+        if isinstance(task_rewards, dict):
+            return task_rewards
+        if not task_rewards:
+            return {}
+        parsed = self._snapshot_fresh().rewards.get(task_rewards)
+        if parsed is not None:
+            return parsed
+        try:
+            return json.loads(task_rewards)
+        except ValueError:
+            return {}
+
+
+# 创建任务目录服务实例
+task_catalog_service = TaskCatalogService()
@@ -0,0 +1,469 @@
+"""
+任务事件服务
+player_task 的每次写入都会由触发器在同一事务内追加一条 task_event 记录（只追加，不修改），
+记录状态变化前后的状态和变化后的完整行快照：
+
+    task_event  事件日志，按自增ID顺序读取即为状态变化的先后顺序
+
+基于事件日志的投影：
+    player_task                       当前状态，可由每个玩家任务的最后一条事件重放得到
+    player_task_summary/stat          玩家任务统计（PlayerTaskStateService），重放后整体重建
+    SSE task_event                    事件分发线程按日志顺序、每批每个玩家合并一次推送到玩家房间（不含
+                                      CREATED/EXPIRED），客户端按事件ID续传
+
+状态变更统一通过 transition() 执行带前置状态条件的单条 UPDATE ... RETURNING。
+批量插入（每日任务分配）通过 bulk_insert() 执行：插入期间逐行的插入触发器不执行，插入后按批次一次写入
+CREATED 事件并更新玩家任务统计。
+"""
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from utils import db_connection
+from function.SSEService import sse_service
+from function.PlayerTaskStateService import player_task_state_service, BULK_INSERT_TABLE, INSERT_TRIGGER_WHEN
+
+logger = logging.getLogger(__name__)
+
+# 状态变化 -> 事件类型（按变化后的状态）
+STATUS_EVENT_TYPES = {
+    'IN_PROGRESS': 'REOPENED',
+    'CHECK': 'SUBMITTED',
+    'COMPLETED': 'COMPLETED',
+    'REJECT': 'REJECTED',
+    'ABANDONED': 'ABANDONED',
+    'UNFINISH': 'EXPIRED',
+}
+
+EVENT_TRIGGERS = ('trg_task_event_insert', 'trg_task_event_update', 'trg_task_event_delete')
+
+
+class TaskEventService:
+    _instance = None
+
+    DISPATCH_INTERVAL = 1  # 事件分发线程的轮询间隔（秒）
+    DISPATCH_BATCH_SIZE = 500  # 事件分发线程每次读取的事件数
+    # 批量产生的事件不推送：每日任务分配的 CREATED 一次数千条，过期清理的 EXPIRED 已由清理线程直接推送 TASK_EXPIRED
+    DISPATCH_SKIP_EVENT_TYPES = ('CREATED', 'EXPIRED')
+    HISTORY_LIMIT = 500  # 单次读取事件历史的最大条数
+    TRANSITION_CHUNK_SIZE = 500  # 批量变更时单条语句的最大ID数
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TaskEventService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self._schema_ready = False
+            self._lock = threading.Lock()
+            self._dispatch_event = threading.Event()
+            self._dispatch_thread = None
+            self._last_dispatched_id = None
+            self.is_running = False
+            self.db_path = None
+            self.initialized = True
+
+    def ensure_schema(self, cursor) -> None:
+        """创建事件表和触发器，player_task 的列变化后重建触发器，首次创建时为现有记录写入快照事件
+
+        不在事务中时单独开启写事务并提交（每个进程一次）；在调用方事务中时随调用方事务提交。
+        """
+        if self._schema_ready:
+            return
+        with self._lock:
+            if self._schema_ready:
+                return
+            conn = cursor.connection
+            standalone = not conn.in_transaction
+            if standalone:
+                cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_event'")
+                created = cursor.fetchone() is None
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS task_event (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        player_task_id INTEGER NOT NULL,
+                        player_id INTEGER,
+                        task_id INTEGER,
+                        event_type TEXT NOT NULL,
+                        from_status TEXT,
+                        to_status TEXT,
+                        state TEXT,
+                        created_at INTEGER NOT NULL
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_task_event_player_task
+                    ON task_event (player_task_id, id)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_task_event_player
+                    ON task_event (player_id, id)
+                ''')
+                player_task_state_service.create_bulk_insert_table(cursor)
+                self._create_triggers(cursor)
+                if created:
+                    self._snapshot_untracked(cursor)
+                    logger.info("任务事件表已创建")
+                if standalone:
+                    conn.commit()
+                    self._schema_ready = True
+            except Exception:
+                if standalone:
+                    conn.rollback()
+                raise
+
+    def _player_task_columns(self, cursor) -> List[str]:
+        cursor.execute('PRAGMA table_info(player_task)')
+        return [row[1] for row in cursor.fetchall()]
+
+    def _state_json(self, cursor, row: str) -> str:
+        """生成 row(NEW/OLD) 的完整行快照 JSON 表达式"""
+        return 'json_object({})'.format(', '.join(
+            f"'{column}', {row}.\"{column}\"" for column in self._player_task_columns(cursor)
+        ))
+
+    def _trigger_sql(self, cursor) -> Dict[str, str]:
+        status_case = ' '.join(
+            f"WHEN '{status}' THEN '{event_type}'" for status, event_type in STATUS_EVENT_TYPES.items()
+        )
+        changed = ' OR '.join(
+            f'OLD."{column}" IS NOT NEW."{column}"' for column in self._player_task_columns(cursor)
+        )
+        insert_columns = 'player_task_id, player_id, task_id, event_type, from_status, to_status, state, created_at'
+        return {
+            'trg_task_event_insert': f'''CREATE TRIGGER trg_task_event_insert AFTER INSERT ON player_task
+WHEN {INSERT_TRIGGER_WHEN}
+BEGIN
+    INSERT INTO task_event ({insert_columns})
+    VALUES (NEW.id, NEW.player_id, NEW.task_id, 'CREATED', NULL, NEW.status,
+            {self._state_json(cursor, 'NEW')}, CAST(strftime('%s', 'now') AS INTEGER));
+END''',
+            'trg_task_event_update': f'''CREATE TRIGGER trg_task_event_update AFTER UPDATE ON player_task
+WHEN {changed}
+BEGIN
+    INSERT INTO task_event ({insert_columns})
+    VALUES (NEW.id, NEW.player_id, NEW.task_id,
+            CASE WHEN OLD.status IS NEW.status THEN 'UPDATED'
+                 ELSE CASE NEW.status {status_case} ELSE 'STATUS_CHANGED' END END,
+            OLD.status, NEW.status,
+            {self._state_json(cursor, 'NEW')}, CAST(strftime('%s', 'now') AS INTEGER));
+END''',
+            'trg_task_event_delete': f'''CREATE TRIGGER trg_task_event_delete AFTER DELETE ON player_task
+BEGIN
+    INSERT INTO task_event ({insert_columns})
+    VALUES (OLD.id, OLD.player_id, OLD.task_id, 'DELETED', OLD.status, NULL,
+            NULL, CAST(strftime('%s', 'now') AS INTEGER));
+END''',
+        }
+
+    def _create_triggers(self, cursor) -> None:
+        """创建触发器；已有触发器与 player_task 当前的列不一致时重建"""
+        for name, sql in self._trigger_sql(cursor).items():
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,))
+            existing = cursor.fetchone()
+            if existing and existing[0] == sql:
+                continue
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(sql)
+
+    def _drop_triggers(self, cursor) -> None:
+        for name in EVENT_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+    def _insert_row_events(self, cursor, event_type: str, where: str, params: tuple = ()) -> int:
+        """为 where 条件内的玩家任务（别名 NEW）按ID顺序写入带完整行快照的事件"""
+        cursor.execute(f'''
+            INSERT INTO task_event (
+                player_task_id, player_id, task_id, event_type, from_status, to_status, state, created_at
+            )
+            SELECT NEW.id, NEW.player_id, NEW.task_id, '{event_type}', NULL, NEW.status,
+                   {self._state_json(cursor, 'NEW')}, CAST(strftime('%s', 'now') AS INTEGER)
+            FROM player_task AS NEW
+            WHERE {where}
+            ORDER BY NEW.id
+        ''', params)
+        return cursor.rowcount
+
+    def _snapshot_untracked(self, cursor) -> int:
+        """为没有任何事件的玩家任务写入快照事件，使事件日志覆盖全部现有记录"""
+        return self._insert_row_events(
+            cursor, 'SNAPSHOT', 'NOT EXISTS (SELECT 1 FROM task_event e WHERE e.player_task_id = NEW.id)'
+        )
+
+    def bulk_insert(self, cursor, sql: str, params: Sequence = ()) -> int:
+        """批量插入 player_task，返回插入的记录数
+
+        插入期间在标记表写入一行，player_task 的插入触发器不执行；插入后按批次一次写入 CREATED 事件、
+        更新玩家任务统计，结果与逐行触发相同。标记行在同一事务内删除，其他连接看不到。
+        不提交事务，调用方负责提交。
+
+        Args:
+            cursor: 数据库游标
+            sql: INSERT ... SELECT 语句
+            params: 语句参数
+        """
+        self.ensure_schema(cursor)
+        player_task_state_service.ensure_schema(cursor)
+        if not cursor.connection.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'INSERT INTO {BULK_INSERT_TABLE} (started_at) VALUES (?)', (int(time.time()),))
+        cursor.execute('SELECT IFNULL(MAX(id), 0) FROM player_task')
+        after_id = cursor.fetchone()[0]
+        try:
+            cursor.execute(sql, params)
+            inserted = cursor.rowcount
+        finally:
+            cursor.execute(f'DELETE FROM {BULK_INSERT_TABLE}')
+        if inserted > 0:
+            self._insert_row_events(cursor, 'CREATED', 'NEW.id > ?', (after_id,))
+            player_task_state_service.apply_inserted(cursor, after_id)
+        return inserted
+
+    def _update_returning(self, cursor, player_task_ids: Sequence[int], to_status: str,
+                          from_statuses: Optional[Sequence[str]], player_id: Optional[int],
+                          fields: Dict) -> List[Dict]:
+        """执行带状态条件的 UPDATE，返回实际变更后的行
+
+        SQLite 3.35 以下不支持 RETURNING，改为先查出满足条件的记录再更新，此时调用方须持有写锁。
+        """
+        conditions = [f"id IN ({','.join('?' * len(player_task_ids))})"]
+        params = list(player_task_ids)
+        if player_id is not None:
+            conditions.append('player_id = ?')
+            params.append(player_id)
+        if from_statuses:
+            conditions.append(f"status IN ({','.join('?' * len(from_statuses))})")
+            params.extend(from_statuses)
+        where_clause = ' AND '.join(conditions)
+        assignments = ', '.join(['status = ?'] + [f'{column} = ?' for column in fields])
+        values = [to_status, *fields.values()]
+
+        if db_connection.SUPPORTS_RETURNING:
+            cursor.execute(f'UPDATE player_task SET {assignments} WHERE {where_clause} RETURNING *',
+                           values + params)
+            rows = cursor.fetchall()
+        else:
+            cursor.execute(f'SELECT id FROM player_task WHERE {where_clause}', params)
+            matched = [row[0] for row in cursor.fetchall()]
+            if not matched:
+                return []
+            id_list = ','.join('?' * len(matched))
+            cursor.execute(f'UPDATE player_task SET {assignments} WHERE id IN ({id_list})', values + matched)
+            cursor.execute(f'SELECT * FROM player_task WHERE id IN ({id_list})', matched)
+            rows = cursor.fetchall()
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def transition(self, cursor, player_task_id: int, to_status: str,
+                   from_statuses: Optional[Sequence[str]] = None, player_id: Optional[int] = None,
+                   **fields) -> Optional[Dict]:
+        """将玩家任务从 from_statuses 之一变更为 to_status，并同时更新 fields 中的字段
+
+        状态条件与更新在同一条语句中完成，不需要先读取再判断；事件由触发器在同一事务内追加。
+        不提交事务，调用方通常在 db_connection.run_immediate 中调用。
+
+        Args:
+            cursor: 数据库游标
+            player_task_id: 玩家任务ID
+            to_status: 目标状态
+            from_statuses: 允许的当前状态，为空时不限制
+            player_id: 玩家ID，提供时同时校验任务归属
+            **fields: 同时更新的其他字段
+
+        Returns:
+            Optional[Dict]: 变更后的玩家任务；记录不存在、不属于该玩家或当前状态不符时为 None
+        """
+        self.ensure_schema(cursor)
+        rows = self._update_returning(cursor, [player_task_id], to_status, from_statuses, player_id, fields)
+        return rows[0] if rows else None
+
+    def transition_many(self, cursor, player_task_ids: Sequence[int], to_status: str,
+                        from_statuses: Optional[Sequence[str]] = None, **fields) -> List[Dict]:
+        """批量变更多个玩家任务的状态（同一目标状态和字段值），返回实际变更后的行"""
+        self.ensure_schema(cursor)
+        player_task_ids = list(player_task_ids)
+        rows = []
+        for i in range(0, len(player_task_ids), self.TRANSITION_CHUNK_SIZE):
+            rows.extend(self._update_returning(
+                cursor, player_task_ids[i:i + self.TRANSITION_CHUNK_SIZE], to_status, from_statuses, None, fields
+            ))
+        return rows
+
+    def get_events(self, cursor, player_task_id: Optional[int] = None, player_id: Optional[int] = None,
+                   after_id: Optional[int] = None, limit: int = 100) -> List[Dict]:
+        """按事件ID顺序读取事件，可按玩家任务或玩家过滤，after_id 为上次读取的最后一个事件ID"""
+        self.ensure_schema(cursor)
+        conditions = []
+        params = []
+        if player_task_id is not None:
+            conditions.append('player_task_id = ?')
+            params.append(player_task_id)
+        if player_id is not None:
+            conditions.append('player_id = ?')
+            params.append(player_id)
+        if after_id is not None:
+            conditions.append('id > ?')
+            params.append(after_id)
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        params.append(min(limit, self.HISTORY_LIMIT))
+        cursor.execute(f'SELECT * FROM task_event {where_clause} ORDER BY id LIMIT ?', params)
+        columns = [column[0] for column in cursor.description]
+        events = []
+        for row in cursor.fetchall():
+            event = dict(zip(columns, row))
+            event['state'] = json.loads(event['state']) if event['state'] else None
+            events.append(event)
+        return events
+
+    def replay(self, cursor, apply: bool = True) -> Dict[str, int]:
+        """根据事件日志重建投影：player_task 取每个玩家任务最后一条事件的快照，之后重建玩家任务统计
+
+        调用方负责开启写事务和提交。apply 为 False 时只比较差异，不修改数据。
+
+        Returns:
+            Dict[str, int]: inserted/updated/deleted 为需要修正的记录数，untracked 为没有事件的记录数
+        """
+        self.ensure_schema(cursor)
+        columns = self._player_task_columns(cursor)
+        cursor.execute('''
+            SELECT e.player_task_id, e.event_type, e.state
+            FROM task_event e
+            JOIN (
+                SELECT player_task_id, MAX(id) AS id FROM task_event GROUP BY player_task_id
+            ) last ON last.id = e.id
+        ''')
+        projected = {
+            row[0]: (None if row[1] == 'DELETED' else json.loads(row[2]))
+            for row in cursor.fetchall()
+        }
+        cursor.execute(f'SELECT {", ".join(columns)} FROM player_task')
+        current = {}
+        for row in cursor.fetchall():
+            row = dict(zip(columns, row))
+            current[row['id']] = row
+
+        # 快照只包含写入事件时 player_task 已有的列，比较和修正都只针对这些列
+        inserts, updates, deletes = [], [], []
+        for player_task_id, state in projected.items():
+            row = current.get(player_task_id)
+            if state is None:
+                if row is not None:
+                    deletes.append(player_task_id)
+                continue
+            state = {column: value for column, value in state.items() if column in columns}
+            if row is None:
+                inserts.append(state)
+            elif any(row[column] != value for column, value in state.items()):
+                updates.append(state)
+        untracked = [player_task_id for player_task_id in current if player_task_id not in projected]
+        result = {
+            'inserted': len(inserts),
+            'updated': len(updates),
+            'deleted': len(deletes),
+            'untracked': len(untracked)
+        }
+        if not apply:
+            return result
+
+        # 修正期间停用事件触发器，避免把重放本身写回日志
+        self._drop_triggers(cursor)
+        for state in inserts:
+            cursor.execute(
+                f'INSERT INTO player_task ({", ".join(state)}) VALUES ({", ".join("?" * len(state))})',
+                tuple(state.values())
+            )
+        for state in updates:
+            assignments = ', '.join(f'{column} = ?' for column in state if column != 'id')
+            cursor.execute(
+                f'UPDATE player_task SET {assignments} WHERE id = ?',
+                tuple(value for column, value in state.items() if column != 'id') + (state['id'],)
+            )
+        cursor.executemany('DELETE FROM player_task WHERE id = ?', [(i,) for i in deletes])
+        self._create_triggers(cursor)
+        if untracked:
+            self._snapshot_untracked(cursor)
+
+        player_task_state_service.ensure_schema(cursor)
+        player_task_state_service.rebuild(cursor)
+        return result
+
+    def start(self, db_path: str) -> None:
+        """启动事件分发线程，从当前最后一个事件之后开始推送"""
+        if self.is_running:
+            return
+        self.db_path = db_path
+        conn = db_connection.connect(db_path)
+        try:
+            cursor = conn.cursor()
+            self.ensure_schema(cursor)
+            cursor.execute('SELECT IFNULL(MAX(id), 0) FROM task_event')
+            self._last_dispatched_id = cursor.fetchone()[0]
+        finally:
+            conn.close()
+        self.is_running = True
+        self._dispatch_thread = threading.Thread(target=self._run_dispatcher, daemon=True)
+        self._dispatch_thread.start()
+        logger.info("任务事件分发线程已启动")
+
+    def stop(self) -> None:
+        self.is_running = False
+        self._dispatch_event.set()
+        if self._dispatch_thread:
+            self._dispatch_thread.join(timeout=5)
+            self._dispatch_thread = None
+
+    def _run_dispatcher(self) -> None:
+        while self.is_running:
+            self._dispatch_event.clear()
+            try:
+                while self.dispatch_pending() == self.DISPATCH_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                logger.error(f"任务事件分发失败: {str(e)}")
+            self._dispatch_event.wait(self.DISPATCH_INTERVAL)
+
+    def dispatch_pending(self) -> int:
+        """按玩家合并推送上次分发之后的新事件，返回读取的事件数（含不推送的事件）"""
+        conn = db_connection.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, player_task_id, player_id, task_id, event_type, from_status, to_status, created_at
+                FROM task_event
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (self._last_dispatched_id or 0, self.DISPATCH_BATCH_SIZE))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        events_by_player: Dict[int, List[Dict]] = {}
+        for row in rows:
+            event = dict(zip(
+                ('id', 'player_task_id', 'player_id', 'task_id', 'event_type', 'from_status', 'to_status', 'created_at'),
+                row
+            ))
+            if event['player_id'] is not None and event['event_type'] not in self.DISPATCH_SKIP_EVENT_TYPES:
+                events_by_player.setdefault(event['player_id'], []).append(event)
+        if rows:
+            self._last_dispatched_id = rows[-1][0]
+
+        # 每个玩家每批推送一次，房间内没有连接的玩家不推送，重连后按事件ID续传
+        for player_id, events in events_by_player.items():
+            room = f"user_{player_id}"
+            if sse_service.get_room_player_count(room):
+                sse_service.broadcast_to_room(room, 'task_event', {
+                    'events': events,
+                    'last_id': events[-1]['id']
+                })
+        return len(rows)
+
+
+# 创建任务事件服务实例
+task_event_service = TaskEventService()
@@ -0,0 +1,247 @@
+"""
+任务层级服务
+维护 task 表父子关系的闭包表 task_closure（祖先, 后代, 层级距离），
+"主线任务的所有子任务"和"任务的所有主线祖先"都只需一次索引查找，不再递归遍历 task 表。
+
+闭包表由 task 表上的插入、修改父任务、删除触发器在同一事务内维护，直接修改数据库或导入任务同样生效；
+首次创建触发器时，或进程首次使用时发现闭包表与 task 表不一致时整体重建。
+"""
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TaskHierarchyService:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TaskHierarchyService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self._schema_ready = False
+            self._lock = threading.Lock()
+            self.initialized = True
+
+    def ensure_schema(self, cursor) -> None:
+        """创建闭包表和 task 表上的触发器，闭包表与 task 表不一致时重建
+
+        触发器创建之前对 task 表的修改无从得知，首次创建触发器时整体重建；之后每个进程首次使用时
+        比较任务数和直接父子关系，不一致时重建。
+        不在事务中时直接提交并标记完成（每个进程一次）；在调用方事务中时随调用方事务提交，
+        此时不标记完成，调用方回滚后下次仍会重新检查。
+        """
+        if self._schema_ready:
+            return
+        with self._lock:
+            if self._schema_ready:
+                return
+            conn = cursor.connection
+            standalone = not conn.in_transaction
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS task_closure (
+                    ancestor_id INTEGER NOT NULL,
+                    descendant_id INTEGER NOT NULL,
+                    depth INTEGER NOT NULL,
+                    PRIMARY KEY (ancestor_id, descendant_id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_task_closure_descendant
+                ON task_closure (descendant_id, depth)
+            ''')
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_task_closure_insert'"
+            )
+            if not cursor.fetchone():
+                self._create_triggers(cursor)
+                self.rebuild(cursor)
+            elif not self._is_consistent(cursor):
+                logger.warning("任务闭包表与 task 表不一致，重新构建")
+                self.rebuild(cursor)
+            if standalone:
+                conn.commit()
+                self._schema_ready = True
+
+    @staticmethod
+    def _create_triggers(cursor) -> None:
+        """task 表的任何写入（包括直接修改数据库、导入任务）都在同一事务内同步闭包表"""
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_task_closure_insert AFTER INSERT ON task
+            BEGIN
+                -- 先于父任务写入的子任务的子树中包含新任务的父任务时会形成环
+                SELECT RAISE(ABORT, '父任务不能是任务自身或其子任务')
+                WHERE EXISTS (
+                    SELECT 1 FROM task child
+                    JOIN task_closure d ON d.ancestor_id = child.id
+                    WHERE child.parent_task_id = NEW.id AND child.id != NEW.id
+                    AND d.descendant_id = NEW.parent_task_id
+                );
+                -- 自身一行，加上父任务的每个祖先（含父任务自身）各一行
+                INSERT OR IGNORE INTO task_closure (ancestor_id, descendant_id, depth)
+                SELECT ancestor_id, NEW.id, depth + 1
+                FROM task_closure
+                WHERE descendant_id = NEW.parent_task_id AND NEW.parent_task_id != NEW.id
+                UNION ALL
+                SELECT NEW.id, NEW.id, 0;
+                -- 先于父任务写入的子任务，连同其子树连接到新任务的祖先链上
+                INSERT OR IGNORE INTO task_closure (ancestor_id, descendant_id, depth)
+                SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1
+                FROM task child
+                JOIN task_closure d ON d.ancestor_id = child.id
+                JOIN task_closure a ON a.descendant_id = NEW.id
+                WHERE child.parent_task_id = NEW.id AND child.id != NEW.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_task_closure_update AFTER UPDATE OF parent_task_id ON task
+            WHEN OLD.parent_task_id IS NOT NEW.parent_task_id
+            BEGIN
+                SELECT RAISE(ABORT, '父任务不能是任务自身或其子任务')
+                WHERE EXISTS (
+                    SELECT 1 FROM task_closure WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_task_id
+                );
+                -- 断开子树与原祖先的关系，再连接到新父任务的祖先链上
+                DELETE FROM task_closure
+                WHERE descendant_id IN (
+                    SELECT descendant_id FROM task_closure WHERE ancestor_id = NEW.id
+                )
+                AND ancestor_id IN (
+                    SELECT ancestor_id FROM task_closure WHERE descendant_id = NEW.id AND depth > 0
+                );
+                INSERT INTO task_closure (ancestor_id, descendant_id, depth)
+                SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1
+                FROM task_closure a
+                JOIN task_closure d ON d.ancestor_id = NEW.id
+                WHERE a.descendant_id = NEW.parent_task_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_task_closure_delete AFTER DELETE ON task
+            BEGIN
+                -- 移除经过该任务的所有祖先-后代关系，其子任务成为独立的任务链
+                DELETE FROM task_closure
+                WHERE descendant_id IN (
+                    SELECT descendant_id FROM task_closure WHERE ancestor_id = OLD.id
+                )
+                AND ancestor_id IN (
+                    SELECT ancestor_id FROM task_closure WHERE descendant_id = OLD.id
+                );
+            END
+        ''')
+
+    @staticmethod
+    def _is_consistent(cursor) -> bool:
+        """闭包表的自身行与任务一一对应，距离为 1 的行与 task.parent_task_id 一致"""
+        parent_edges = '''
+            SELECT t.parent_task_id, t.id FROM task t
+            JOIN task p ON p.id = t.parent_task_id
+            WHERE t.id != t.parent_task_id
+        '''
+        closure_edges = 'SELECT ancestor_id, descendant_id FROM task_closure WHERE depth = 1'
+        cursor.execute(f'''
+            SELECT (SELECT COUNT(*) FROM task) = (SELECT COUNT(*) FROM task_closure WHERE depth = 0)
+                AND NOT EXISTS ({parent_edges} EXCEPT {closure_edges})
+                AND NOT EXISTS ({closure_edges} EXCEPT {parent_edges})
+        ''')
+        return bool(cursor.fetchone()[0])
+
+    def rebuild(self, cursor) -> None:
+        """根据 task.parent_task_id 重建整个闭包表"""
+        cursor.execute('DELETE FROM task_closure')
+        cursor.execute('''
+            WITH RECURSIVE closure (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM task
+                UNION ALL
+                SELECT c.ancestor_id, t.id, c.depth + 1
+                FROM closure c
+                JOIN task t ON t.parent_task_id = c.descendant_id AND t.id != c.descendant_id
+                WHERE c.depth < 1000
+            )
+            INSERT OR IGNORE INTO task_closure (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, descendant_id, depth FROM closure
+        ''')
+        logger.info("任务闭包表已重建")
+
+    def would_create_cycle(self, cursor, task_id: int, parent_task_id: int) -> bool:
+        """将 task_id 挂到 parent_task_id 下是否会形成环（新父任务是其自身或后代）"""
+        self.ensure_schema(cursor)
+        cursor.execute('''
+            SELECT 1 FROM task_closure
+            WHERE ancestor_id = ? AND descendant_id = ?
+        ''', (task_id, parent_task_id))
+        return cursor.fetchone() is not None
+
+    def get_descendant_ids(self, cursor, ancestor_id: int, exclude_type: Optional[str] = None) -> List[int]:
+        """获取任务的所有后代任务ID（不含自身），可排除某类型"""
+        self.ensure_schema(cursor)
+        cursor.execute('''
+            SELECT c.descendant_id
+            FROM task_closure c
+            JOIN task t ON t.id = c.descendant_id
+            WHERE c.ancestor_id = ? AND c.depth > 0 AND t.task_type != ?
+            ORDER BY c.depth, c.descendant_id
+        ''', (ancestor_id, exclude_type or ''))
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_ancestor_ids(self, cursor, task_id: int, task_type: Optional[str] = None) -> List[int]:
+        """获取任务的所有祖先任务ID（不含自身，由近及远），可限定类型"""
+        self.ensure_schema(cursor)
+        if task_type:
+            cursor.execute('''
+                SELECT c.ancestor_id
+                FROM task_closure c
+                JOIN task t ON t.id = c.ancestor_id
+                WHERE c.descendant_id = ? AND c.depth > 0 AND t.task_type = ?
+                ORDER BY c.depth
+            ''', (task_id, task_type))
+        else:
+            cursor.execute('''
+                SELECT ancestor_id FROM task_closure
+                WHERE descendant_id = ? AND depth > 0
+                ORDER BY depth
+            ''', (task_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_main_quest_progress(self, cursor, player_id: int,
+                                main_quest_ids: Optional[List[int]] = None) -> Dict[int, Tuple[int, int]]:
+        """统计玩家在各主线任务下的非主线子任务完成情况
+
+        Args:
+            cursor: 数据库游标
+            player_id: 玩家ID
+            main_quest_ids: 主线任务ID列表，为空时统计全部主线任务
+
+        Returns:
+            Dict[int, Tuple[int, int]]: 主线任务ID -> (子任务总数, 已完成子任务数)，没有子任务的主线任务不出现
+        """
+        self.ensure_schema(cursor)
+        if main_quest_ids is None:
+            ancestor_filter = "c.ancestor_id IN (SELECT id FROM task WHERE task_type = 'MAIN')"
+            params = (player_id,)
+        elif not main_quest_ids:
+            return {}
+        else:
+            ancestor_filter = f"c.ancestor_id IN ({','.join('?' * len(main_quest_ids))})"
+            params = (player_id, *main_quest_ids)
+
+        cursor.execute(f'''
+            SELECT c.ancestor_id, COUNT(*) AS total, COUNT(done.task_id) AS completed
+            FROM task_closure c
+            JOIN task t ON t.id = c.descendant_id
+            LEFT JOIN (
+                SELECT DISTINCT task_id FROM player_task
+                WHERE player_id = ? AND status = 'COMPLETED'
+            ) done ON done.task_id = c.descendant_id
+            WHERE {ancestor_filter} AND c.depth > 0 AND t.task_type != 'MAIN'
+            GROUP BY c.ancestor_id
+        ''', params)
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+
+# 创建任务层级服务实例
+task_hierarchy_service = TaskHierarchyService()
@@ -3,6 +3,7 @@
 处理任务相关的业务逻辑
 """
 import sqlite3
+from utils import db_connection
 import os
 import logging
 import time
@@ -10,12 +11,43 @@ from datetime import datetime
 import json
 from typing import Dict, List, Optional
 from utils.response_handler import ResponseHandler, StatusCode
+from utils.field_projection import parse_fields, select_columns, table_columns
 from function.PlayerService import player_service
+from function.TaskCatalogService import task_catalog_service
+from function.TaskHierarchyService import task_hierarchy_service
+from function.SchedulerService import scheduler_service
+from function.PlayerTaskStateService import player_task_state_service
+from function.TaskEventService import task_event_service
+from function.LeaderboardService import leaderboard_service
 from config.config import DEBUG
 logger = logging.getLogger(__name__)
 
 class TaskService:
     _instance = None
+
+    REVIEW_BATCH_LIMIT = 1000  # 批量审核单次最多处理的任务数
+    SUBMITTABLE_STATUSES = ['IN_PROGRESS']  # 可以提交审核的任务状态
+    TASK_COUNT_CACHE_TTL = 30  # 无法从汇总表得到的分页总数的缓存秒数
+    TASK_COUNT_CACHE_SIZE = 256  # 分页总数缓存的最大条目数
+
+    # 任务列表中来自玩家任务和玩家表的字段 -> SQL 表达式，其余字段为任务表的列
+    TASK_LIST_JOIN_COLUMNS = {
+        'player_task_id': 'pt.id',
+        'player_name': 'p.player_name',
+        'current_status': "COALESCE(pt.status, 'AVAIL')",
+        'starttime': 'pt.starttime',
+        'submit_time': 'pt.submit_time',
+        'complete_time': 'pt.complete_time',
+        'comment': 'pt.comment',
+        'reject_reason': 'pt.reject_reason',
+    }
+
+    # 可用任务列表返回的字段
+    AVAILABLE_TASK_FIELDS = (
+        'id', 'name', 'description', 'stamina_cost',
+        'task_rewards', 'need_check', 'task_type', 'task_status', 'limit_time', 'icon',
+        'parent_task_id', 'task_scope', 'repeatable', 'repeat_time'
+    )
     
     def __new__(cls):
         if cls._instance is None:
@@ -29,18 +61,24 @@ class TaskService:
                 'database', 
                 'game.db'
             )
+            self._count_cache = {}  # (player_id, task_id, status) -> (统计时间, 总数)
             self.initialized = True
             
     def get_db(self):
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = db_connection.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
-    def _get_task_base_query(self):
-        """获取基础任务查询SQL"""
-        return '''
-            SELECT t.*, 
+    def _get_task_base_query(self, select_list: str = None, join_player: bool = True):
+        """获取基础任务查询SQL
+
+        Args:
+            select_list: 列清单，默认 t.* 和全部玩家任务字段
+            join_player: 是否关联玩家表（只有 player_name 需要）
+        """
+        if select_list is None:
+            select_list = '''t.*, 
                    pt.id as player_task_id,
                    p.player_name,
                    COALESCE(pt.status, 'AVAIL') as current_status,
@@ -48,11 +86,32 @@ class TaskService:
                    pt.submit_time,
                    pt.complete_time,
                    pt.comment,
-                   pt.reject_reason
+                   pt.reject_reason'''
+        query = f'''
+            SELECT {select_list}
             FROM task t
             LEFT JOIN player_task pt ON t.id = pt.task_id 
-            LEFT JOIN player_data p ON pt.player_id = p.player_id
         '''
+        if join_player:
+            query += 'LEFT JOIN player_data p ON pt.player_id = p.player_id'
+        return query
+
+    def _task_list_select(self, cursor, fields: Optional[List[str]]) -> tuple:
+        """按请求字段生成任务列表的列清单，返回 (列清单, 是否关联玩家表)
+
+        task_id 由任务ID得到，id 和 player_task_id 用于主ID替换和分页游标，总是读取。
+        """
+        if fields is None:
+            return None, True
+        columns = {
+            name: f't."{name}"' for name in table_columns(cursor, 'task')
+            if name not in self.TASK_LIST_JOIN_COLUMNS
+        }
+        columns.update(self.TASK_LIST_JOIN_COLUMNS)
+        select_list = select_columns(
+            [name for name in fields if name != 'task_id'], columns, required=('id', 'player_task_id')
+        )
+        return select_list, 'player_name' in fields
 
     def _get_task_by_id_base(self, task_id: int, player_id: int = None) -> Dict:
         """基础的任务查询函数
@@ -64,30 +123,64 @@ class TaskService:
         Returns:
             任务信息字典
         """
+        conn = None
         try:
+            # 任务本身从目录缓存读取，只查询玩家任务状态
+            task = task_catalog_service.get(task_id)
+            if not task:
+                return ResponseHandler.error(
+                    code=StatusCode.TASK_NOT_FOUND,
+                    msg="任务不存在"
+                )
+
             conn = self.get_db()
             cursor = conn.cursor()
             
-            query = self._get_task_base_query()
+            query = '''
+                SELECT pt.id as player_task_id,
+                       p.player_name,
+                       COALESCE(pt.status, 'AVAIL') as current_status,
+                       pt.starttime,
+                       pt.submit_time,
+                       pt.complete_time,
+                       pt.comment,
+                       pt.reject_reason
+                FROM player_task pt
+                LEFT JOIN player_data p ON pt.player_id = p.player_id
+                WHERE pt.task_id = ?
+            '''
             params = [task_id]
-            
             if player_id:
-                query += ' WHERE t.id = ? AND pt.player_id = ?'
+                query += ' AND pt.player_id = ?'
                 params.append(player_id)
-            else:
-                query += ' WHERE t.id = ?'
+            query += ' ORDER BY pt.id LIMIT 1'
             
             cursor.execute(query, params)
-            task = cursor.fetchone()
+            player_state = cursor.fetchone()
             
-            if task:
-                return ResponseHandler.success(
-                    data=dict(task),
-                    msg="获取任务成功"
+            if player_state is None and player_id:
+                return ResponseHandler.error(
+                    code=StatusCode.TASK_NOT_FOUND,
+                    msg="任务不存在"
                 )
-            return ResponseHandler.error(
-                code=StatusCode.TASK_NOT_FOUND,
-                msg="任务不存在"
+
+            data = dict(task)
+            if player_state is not None:
+                data.update(dict(player_state))
+            else:
+                data.update({
+                    'player_task_id': None,
+                    'player_name': None,
+                    'current_status': 'AVAIL',
+                    'starttime': None,
+                    'submit_time': None,
+                    'complete_time': None,
+                    'comment': None,
+                    'reject_reason': None
+                })
+            return ResponseHandler.success(
+                data=data,
+                msg="获取任务成功"
             )
         except Exception as e:
             logger.error(f"获取任务失败: {str(e)}")
@@ -96,10 +189,13 @@ class TaskService:
                 msg=f"获取任务失败: {str(e)}"
             )
         finally:
-            conn.close()
+            if conn:
+                conn.close()
 
     def _get_tasks_base(self, conditions: str = "", params: list = None, 
-                       page: int = None, limit: int = None) -> Dict:
+                       page: int = None, limit: int = None,
+                       count_filters: Dict = None, after_id: int = None,
+                       fields=None) -> Dict:
         """基础的任务列表查询函数
         
         Args:
@@ -107,32 +203,63 @@ class TaskService:
             params: 查询参数列表
             page: 页码
             limit: 每页数量
+            count_filters: 玩家任务过滤条件（player_id/task_id/status）。提供时只列出玩家任务，
+                           按玩家任务ID倒序，总数取自汇总表而不是对整个连接查询计数
+            after_id: 游标，上一页返回的 next_cursor；提供时从该玩家任务ID之后继续取，忽略页码
+            fields: 返回的字段（逗号分隔的字符串或列表），默认全部；只查询需要的列
             
         Returns:
             任务列表字典
         """
+        conn = None
         try:
             conn = self.get_db()
             cursor = conn.cursor()
+            params = list(params or [])
             
             # 构建基础查询
-            query = self._get_task_base_query()
-            if conditions:
-                query += f" WHERE {conditions}"
-            
-            # 获取总数
-            count_query = f"SELECT COUNT(*) FROM ({query})"
-            cursor.execute(count_query, params or [])
-            total = cursor.fetchone()[0]
-            
-            # 添加分页
-            if page is not None and limit is not None:
-                offset = (page - 1) * limit
-                query += f" LIMIT {limit} OFFSET {offset}"
+            try:
+                fields = parse_fields(fields)
+                select_list, join_player = self._task_list_select(cursor, fields)
+            except ValueError as e:
+                return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=str(e))
+            query = self._get_task_base_query(select_list, join_player)
+            if count_filters is None:
+                if conditions:
+                    query += f" WHERE {conditions}"
+                # 获取总数
+                count_query = f"SELECT COUNT(*) FROM ({query})"
+                cursor.execute(count_query, params)
+                total = cursor.fetchone()[0]
+                # 添加分页
+                if page is not None and limit is not None:
+                    query += " LIMIT ? OFFSET ?"
+                    params.extend([limit, (page - 1) * limit])
+            else:
+                total = self._count_player_tasks(cursor, **count_filters)
+                where = [conditions] if conditions else []
+                where.append("pt.id IS NOT NULL")
+                if after_id is not None:
+                    where.append("pt.id < ?")
+                    params.append(after_id)
+                query += f" WHERE {' AND '.join(where)} ORDER BY pt.id DESC"
+                if limit is not None:
+                    # 多取一条判断是否还有下一页
+                    query += " LIMIT ?"
+                    params.append(limit + 1)
+                    if after_id is None and page is not None and page > 1:
+                        query += " OFFSET ?"
+                        params.append((page - 1) * limit)
             
-            cursor.execute(query, params or [])
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            next_cursor = None
+            if count_filters is not None and limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = rows[-1]['player_task_id']
+
             tasks = []
-            for row in cursor.fetchall():
+            for row in rows:
                 task_data = dict(row)
                 # 确保返回的数据中包含正确的ID
                 task_data['task_id'] = task_data['id']  # 保存原始任务ID
@@ -148,12 +275,16 @@ class TaskService:
                         
                 tasks.append(task_data)
             
+            data = {
+                "total": total,
+                "tasks": tasks
+            }
+            if count_filters is not None:
+                data["next_cursor"] = next_cursor
             return ResponseHandler.success(
-                data={
-                    "total": total,
-                    "tasks": tasks
-                },
-                msg="获取任务列表成功"
+                data=data,
+                msg="获取任务列表成功",
+                fields=fields
             )
         except Exception as e:
             logger.error(f"获取任务列表失败: {str(e)}")
@@ -162,64 +293,86 @@ class TaskService:
                 msg=f"获取任务列表失败: {str(e)}"
             )
         finally:
-            conn.close()
+            if conn:
+                conn.close()
+
+    def _count_player_tasks(self, cursor, player_id: int = None, task_id: int = None,
+                            status: str = None) -> int:
+        """统计玩家任务数，用于分页总数
+
+        只按玩家/状态过滤时直接读取触发器维护的汇总表；按任务过滤或状态不在汇总表中时，
+        只对 player_task 单表计数，并在 TASK_COUNT_CACHE_TTL 秒内复用结果。
+        """
+        if task_id is None:
+            total = player_task_state_service.count_player_tasks(cursor, player_id, status)
+            if total is not None:
+                return total
+
+        key = (player_id, task_id, status)
+        now = time.time()
+        cached = self._count_cache.get(key)
+        if cached and now - cached[0] < self.TASK_COUNT_CACHE_TTL:
+            return cached[1]
+
+        conditions = []
+        params = []
+        for column, value in (('player_id', player_id), ('task_id', task_id), ('status', status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor.execute(f"SELECT COUNT(*) FROM player_task {where_clause}", params)
+        total = cursor.fetchone()[0]
+        if len(self._count_cache) >= self.TASK_COUNT_CACHE_SIZE:
+            self._count_cache.clear()
+        self._count_cache[key] = (now, total)
+        return total
 
     def _update_task_status(self, task_id: int, player_id: int, 
-                           new_status: str, extra_data: Dict = None) -> Dict:
+                           new_status: str, extra_data: Dict = None,
+                           from_statuses: List[str] = None) -> Dict:
         """更新任务状态
         
         Args:
-            task_id: 任务ID
+            task_id: 玩家任务ID
             player_id: 玩家ID 
             new_status: 新状态
             extra_data: 额外更新的数据
+            from_statuses: 允许变更的当前状态，为空时不限制
             
         Returns:
             更新结果字典
         """
+        conn = None
         try:
             conn = self.get_db()
-            cursor = conn.cursor()
-            
-            # 检查任务是否存在
-            cursor.execute('''
-                SELECT * FROM player_task 
-                WHERE id = ? AND player_id = ?
-            ''', (task_id, player_id))
-            task = cursor.fetchone()
+            # 状态校验和更新在同一条语句中完成，重复请求只有一个会成功
+            updated = db_connection.run_immediate(conn, lambda cursor: task_event_service.transition(
+                cursor, task_id, new_status, from_statuses, player_id, **(extra_data or {})
+            ))
             
-            if not task:
+            if not updated:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT status FROM player_task 
+                    WHERE id = ? AND player_id = ?
+                ''', (task_id, player_id))
+                task = cursor.fetchone()
+                if not task:
+                    return ResponseHandler.error(
+                        code=StatusCode.TASK_NOT_FOUND,
+                        msg="任务不存在"
+                    )
                 return ResponseHandler.error(
-                    code=StatusCode.TASK_NOT_FOUND,
-                    msg="任务不存在"
+                    code=StatusCode.FAIL,
+                    msg=f"任务当前状态为{task['status']}，不能更新为{new_status}"
                 )
             
-            # 构建更新字段
-            update_fields = ['status = ?']
-            params = [new_status]
-            
-            if extra_data:
-                for key, value in extra_data.items():
-                    update_fields.append(f"{key} = ?")
-                    params.append(value)
-            
-            params.extend([task_id, player_id])
-            
-            # 执行更新
-            cursor.execute(f'''
-                UPDATE player_task 
-                SET {", ".join(update_fields)}
-                WHERE id = ? AND player_id = ?
-            ''', params)
-            
-            conn.commit()
             # 返回更新后的任务状态
             return ResponseHandler.success(msg=f"任务状态更新为{new_status}",data={'status':new_status,'extra_data':extra_data})
             
         except Exception as e:
             logger.error(f"更新任务状态失败: {str(e)}")
-            if conn:
-                conn.rollback()
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
                 msg=f"更新任务状态失败: {str(e)}"
@@ -240,27 +393,31 @@ class TaskService:
         """获取任务列表"""
         return self._get_tasks_base(page=page, limit=limit)
 
-    def get_check_tasks(self, page: int = 1, limit: int = 20) -> Dict:
+    def get_check_tasks(self, page: int = 1, limit: int = 20, cursor: int = None,
+                        fields=None) -> Dict:
         """获取待审核任务列表
         
         Args:
             page: 页码
             limit: 每页数量
+            cursor: 上一页返回的 next_cursor，提供时按游标翻页
             
         Returns:
             Dict: 包含待审核任务列表的响应
         """
-        conditions = "pt.status = 'CHECK' AND pt.id IS NOT NULL"
-        return self._get_tasks_base(conditions, [], page, limit)
+        conditions = "pt.status = 'CHECK'"
+        return self._get_tasks_base(conditions, [], page, limit,
+                                    count_filters={'status': 'CHECK'}, after_id=cursor, fields=fields)
 
     def get_task_history(self, task_id: int = None, player_id: int = None, 
-                        status: str = None, page: int = 1, limit: int = 20) -> Dict:
-        """获取任务历史记录"""
+                        status: str = None, page: int = 1, limit: int = 20,
+                        cursor: int = None, fields=None) -> Dict:
+        """获取任务历史记录（玩家任务，按ID倒序），cursor 为上一页返回的 next_cursor"""
         conditions = []
         params = []
         
         if task_id:
-            conditions.append("t.id = ?")
+            conditions.append("pt.task_id = ?")
             params.append(task_id)
         if player_id:
             conditions.append("pt.player_id = ?")
@@ -270,10 +427,41 @@ class TaskService:
             params.append(status)
         
         where_clause = " AND ".join(conditions) if conditions else ""
-        return self._get_tasks_base(where_clause, params, page, limit)
+        count_filters = {'task_id': task_id or None, 'player_id': player_id or None, 'status': status or None}
+        return self._get_tasks_base(where_clause, params, page, limit,
+                                    count_filters=count_filters, after_id=cursor, fields=fields)
+
+    def get_task_events(self, player_task_id: int = None, player_id: int = None,
+                        after_id: int = None, limit: int = 100) -> Dict:
+        """获取任务事件历史，按发生顺序排列，after_id 为上一页返回的 next_cursor"""
+        conn = None
+        try:
+            conn = self.get_db()
+            cursor = conn.cursor()
+            limit = min(limit, task_event_service.HISTORY_LIMIT)
+            events = task_event_service.get_events(cursor, player_task_id, player_id, after_id, limit)
+            next_cursor = events[-1]['id'] if events and len(events) >= limit else None
+            return ResponseHandler.success(
+                data={
+                    "events": events,
+                    "next_cursor": next_cursor
+                },
+                msg="获取任务事件成功"
+            )
+        except Exception as e:
+            logger.error(f"获取任务事件失败: {str(e)}")
+            return ResponseHandler.error(
+                code=StatusCode.SERVER_ERROR,
+                msg=f"获取任务事件失败: {str(e)}"
+            )
+        finally:
+            if conn:
+                conn.close()
 
     def submit_task(self, player_id: int, task_id: int, comment: str = None) -> Dict:
         """提交任务"""
+        conn = None
+        update_result = None
         try:
             # 1. 获取任务信息和玩家信息，用于创建审批
             conn = self.get_db()
@@ -295,7 +483,8 @@ class TaskService:
                         {
                             'submit_time': int(time.time()),
                             'comment': comment
-                        }
+                        },
+                        self.SUBMITTABLE_STATUSES
                     )
                 
                 wechat_userid = player_result['wechat_userid']
@@ -326,8 +515,12 @@ class TaskService:
                 {
                     'submit_time': int(time.time()),
                     'comment': comment
-                }
+                },
+                self.SUBMITTABLE_STATUSES
             )
+            if update_result['code'] != 0:
+                # 重复提交或状态不允许提交时不再创建审批
+                return update_result
             
             # 3. 创建审批申请
             from function.QYWeChat.QYWeChat_Review import qywechat_review
@@ -384,6 +577,9 @@ class TaskService:
                 
         except Exception as e:
             logger.error(f"提交任务并创建审批失败: {str(e)}", exc_info=True)
+            if update_result and update_result.get('code') == 0:
+                # 任务状态已更新，只是审批创建过程出错
+                return update_result
             # 发生异常时，尝试回退到基本的任务提交逻辑
             return self._update_task_status(
                 task_id, 
@@ -392,118 +588,81 @@ class TaskService:
                 {
                     'submit_time': int(time.time()),
                     'comment': comment
-                }
+                },
+                self.SUBMITTABLE_STATUSES
             )
         finally:
             if conn:
                 conn.close()
 
+    def query_available_tasks(self, cursor, player_id: int) -> List[Dict]:
+        """在调用方的连接上计算可用任务
+
+        任务链关系来自任务目录中预先构建的任务链图，玩家的进行中/已完成任务集合来自
+        玩家任务状态汇总，两者做集合运算得到可用任务，不再扫描玩家任务历史。
+        """
+        catalog = task_catalog_service.snapshot()
+        tasks = catalog.tasks
+        
+        # 玩家任务状态汇总：进行中/待审核、已完成的任务集合和今日接受次数
+        state = player_task_state_service.get_state(cursor, player_id)
+        completed_ids = state.completed_ids
+        excluded_ids = state.excluded_ids  # 已进行中/待审核/已完成的任务不再出现在可用列表
+        daily_task_counts = state.daily_counts
+        current_main_id = None
+        current_branch_ids = set()
+        for task_id in state.active_ids:
+            task = tasks.get(task_id)
+            if not task:
+                continue
+            if task['task_type'] == 'MAIN':
+                if current_main_id is None:
+                    current_main_id = task_id
+            elif task['task_type'] == 'BRANCH':
+                current_branch_ids.add(task_id)
+
+        candidate_ids = set()
+
+        # 主线任务：有进行中的主线时只开放其直接后续任务，否则开放首个主线任务和前置已完成的任务
+        if current_main_id is not None:
+            candidate_ids.update(catalog.chain_next('MAIN', (current_main_id,)))
+        else:
+            candidate_ids.update(catalog.chain_roots('MAIN'))
+            candidate_ids.update(catalog.chain_next('MAIN', completed_ids))
+
+        # 支线任务：当前支线的直接后续任务、新的支线任务线和前置已完成的任务
+        candidate_ids.update(catalog.chain_roots('BRANCH'))
+        candidate_ids.update(catalog.chain_next('BRANCH', current_branch_ids | completed_ids))
+
+        # 日常任务：可重复任务检查今日次数，不可重复任务今天未接受过
+        for task_id in catalog.enabled_by_type.get('DAILY', ()):
+            task = tasks[task_id]
+            current_count = daily_task_counts.get(task_id, 0)
+            if task['repeatable']:
+                if current_count < task['repeat_time']:
+                    candidate_ids.add(task_id)
+            elif current_count == 0:
+                candidate_ids.add(task_id)
+
+        # 特殊任务
+        candidate_ids.update(
+            task_id for task_id in catalog.enabled_by_type.get('SPECIAL', ())
+            if tasks[task_id]['task_status'] == 'AVAIL'
+        )
+
+        projected = catalog.projected(self.AVAILABLE_TASK_FIELDS)
+        return [
+            projected[task_id]
+            for task_id in sorted(candidate_ids - excluded_ids)
+            if tasks[task_id]['task_scope'] in (0, player_id)
+        ]
+
     def get_available_tasks(self, player_id: int) -> Dict:
         """获取可用任务列表"""
+        conn = None
         try:
             conn = self.get_db()
-            cursor = conn.cursor()
-            
-            # 获取玩家当前进行中的任务
-            cursor.execute('''
-                SELECT t.task_type, t.id
-                FROM player_task pt
-                JOIN task t ON pt.task_id = t.id
-                WHERE pt.player_id = ? AND (pt.status = 'IN_PROGRESS' OR pt.status = 'CHECK')
-            ''', (player_id,))
-            current_tasks = cursor.fetchall()
-            
-            # 获取玩家已完成的任务
-            cursor.execute('''
-                SELECT t.id, t.task_type
-                FROM player_task pt
-                JOIN task t ON pt.task_id = t.id
-                WHERE pt.player_id = ? AND pt.status = 'COMPLETED'
-            ''', (player_id,))
-            completed_tasks = {row['id']: row['task_type'] for row in cursor.fetchall()}
-
-            # 获取今日已接受的日常任务
-            today_start = int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-            cursor.execute('''
-                SELECT t.id, COUNT(*) as accept_count
-                FROM player_task pt
-                JOIN task t ON pt.task_id = t.id
-                WHERE pt.player_id = ? 
-                AND t.task_type = 'DAILY'
-                AND pt.starttime >= ?
-                GROUP BY t.id
-            ''', (player_id, today_start))
-            daily_task_counts = {row['id']: row['accept_count'] for row in cursor.fetchall()}
-
-            available_tasks = []
-            
-            # 获取所有可能的任务
-            cursor.execute('''
-                SELECT 
-                    t.id, t.name, t.description, t.stamina_cost,
-                    t.task_rewards,t.need_check, t.task_type, t.task_status, t.limit_time, t.icon,
-                    t.parent_task_id, t.task_scope, t.repeatable, t.repeat_time
-                FROM task t
-                WHERE t.is_enabled = 1 
-                AND (t.task_scope = 0 OR t.task_scope = ?)
-                AND t.id NOT IN (
-                    SELECT task_id 
-                    FROM player_task 
-                    WHERE player_id = ? 
-                    AND (status = 'IN_PROGRESS' OR status = 'COMPLETED' or status = 'CHECK')
-                )
-            ''', (player_id, player_id))
-            
-            all_tasks = cursor.fetchall()
-            
-            # 处理每个任务
-            for task in all_tasks:
-                task_dict = dict(task)
-                
-                # 根据任务类型处理
-                if task_dict['task_type'] == 'MAIN':
-                    # 主线任务处理
-                    current_main = next((t for t in current_tasks if t['task_type'] == 'MAIN'), None)
-                    
-                    if current_main:
-                        # 如果有进行中的主线任务，只显示其直接后续任务
-                        if task_dict['parent_task_id'] == current_main['id']:
-                            available_tasks.append(task_dict)
-                    elif task_dict['parent_task_id'] == 0 or task_dict['parent_task_id'] in completed_tasks:
-                        # 如果没有进行中的主线任务，显示第一个主线任务或前置任务已完成的任务
-                        available_tasks.append(task_dict)
-                        
-                elif task_dict['task_type'] == 'BRANCH':
-                    # 支线任务处理
-                    current_BRANCH_tasks = [t for t in current_tasks if t['task_type'] == 'BRANCH']
-                    
-                    # 检查是否是当前支线任务的直接后续任务
-                    is_next_BRANCH = any(task_dict['parent_task_id'] == t['id'] for t in current_BRANCH_tasks)
-                    
-                    if is_next_BRANCH:
-                        available_tasks.append(task_dict)
-                    elif task_dict['parent_task_id'] == 0 or task_dict['parent_task_id'] in completed_tasks:
-                        # 新的支线任务线或前置任务已完成
-                        available_tasks.append(task_dict)
-                        
-                elif task_dict['task_type'] == 'DAILY':
-                    # 日常任务处理
-                    task_id = task_dict['id']
-                    current_count = daily_task_counts.get(task_id, 0)
-                    
-                    if task_dict['repeatable']:
-                        # 可重复任务，检查次数限制
-                        if current_count < task_dict['repeat_time']:
-                            available_tasks.append(task_dict)
-                    elif current_count == 0:
-                        # 不可重复任务，今天还未接受过
-                        available_tasks.append(task_dict)
-                else:
-                    # 特殊任务处理
-                    if task_dict['task_type'] == 'SPECIAL':
-                        if task_dict['task_status'] == 'AVAIL':
-                            available_tasks.append(task_dict)
-
+            available_tasks = self.query_available_tasks(conn.cursor(), player_id)
             return ResponseHandler.success(
                 data=available_tasks,
                 msg="获取可用任务成功"
@@ -519,50 +678,66 @@ class TaskService:
             if conn:
                 conn.close()
 
-    def get_current_tasks(self, player_id: int) -> Dict:
-        """获取用户当前未过期的任务列表"""
+    def get_task_summary(self, player_id: int) -> Dict:
+        """获取玩家任务状态汇总（各状态任务数、进行中和已完成的任务ID、今日接受次数）"""
+        conn = None
         try:
             conn = self.get_db()
-            cursor = conn.cursor()
-            current_timestamp = int(datetime.now().timestamp())
-
-            cursor.execute('''
-                SELECT 
-                    pt.id,
-                    t.name,
-                    t.description,
-                    t.stamina_cost,
-                    t.need_check,
-                    pt.starttime,
-                    pt.status,
-                    t.task_type,
-                    pt.endtime,
-                    t.icon,
-                    t.task_rewards
-                FROM player_task pt
-                JOIN task t ON pt.task_id = t.id
-                WHERE pt.player_id = ? 
-                AND (pt.endtime > ? or pt.endtime is null)
-                AND (pt.status = 'IN_PROGRESS' or pt.status = 'CHECK')
-                ORDER BY pt.starttime DESC
-            ''', (player_id, current_timestamp))
+            state = player_task_state_service.get_state(conn.cursor(), player_id)
+            return ResponseHandler.success(
+                data=state.to_dict(),
+                msg="获取任务汇总成功"
+            )
+        except sqlite3.Error as e:
+            logger.error(f"获取任务汇总失败: {str(e)}")
+            return ResponseHandler.error(
+                code=StatusCode.SERVER_ERROR,
+                msg=f"获取任务汇总失败: {str(e)}"
+            )
+        finally:
+            if conn:
+                conn.close()
 
-            tasks = []
-            for row in cursor.fetchall():
-                tasks.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'description': row[2],
-                    'stamina_cost': row[3],
-                    'need_check': row[4],
-                    'starttime': row[5],
-                    'status': row[6],
-                    'task_type': row[7],
-                    'endtime': row[8],
-                    'icon': row[9],
-                    'task_rewards':row[10]
-                })
+    def query_current_tasks(self, cursor, player_id: int) -> List[Dict]:
+        """在调用方的连接上查询用户当前未过期的任务"""
+        current_timestamp = int(datetime.now().timestamp())
+        cursor.execute('''
+            SELECT id, task_id, starttime, status, endtime
+            FROM player_task
+            WHERE player_id = ? 
+            AND (endtime > ? or endtime is null)
+            AND (status = 'IN_PROGRESS' or status = 'CHECK')
+            ORDER BY starttime DESC
+        ''', (player_id, current_timestamp))
+        rows = cursor.fetchall()
+        catalog = task_catalog_service.get_many({row['task_id'] for row in rows})
+
+        tasks = []
+        for row in rows:
+            task = catalog.get(row['task_id'])
+            if not task:
+                continue
+            tasks.append({
+                'id': row['id'],
+                'name': task['name'],
+                'description': task['description'],
+                'stamina_cost': task['stamina_cost'],
+                'need_check': task['need_check'],
+                'starttime': row['starttime'],
+                'status': row['status'],
+                'task_type': task['task_type'],
+                'endtime': row['endtime'],
+                'icon': task['icon'],
+                'task_rewards': task['task_rewards']
+            })
+        return tasks
 
+    def get_current_tasks(self, player_id: int) -> Dict:
+        """获取用户当前未过期的任务列表"""
+        conn = None
+        try:
+            conn = self.get_db()
+            tasks = self.query_current_tasks(conn.cursor(), player_id)
             return ResponseHandler.success(
                 data=tasks,
                 msg="获取当前任务列表成功"
@@ -574,7 +749,8 @@ class TaskService:
                 msg=f"获取当前任务列表失败: {str(e)}"
             )
         finally:
-            conn.close()
+            if conn:
+                conn.close()
 
     def accept_task(self, player_id: int, task_id: int) -> Dict:
         """接受任务"""
@@ -583,13 +759,9 @@ class TaskService:
             cursor = conn.cursor()
             
             # 检查任务是否存在且启用
-            cursor.execute('''
-                SELECT * FROM task 
-                WHERE id = ? AND is_enabled = 1
-            ''', (task_id,))
-            task = cursor.fetchone()
+            task = task_catalog_service.get(task_id)
             
-            if not task:
+            if not task or not task['is_enabled']:
                 return ResponseHandler.error(
                     code=StatusCode.TASK_NOT_FOUND,
                     msg="任务不存在或未启用"
@@ -623,13 +795,12 @@ class TaskService:
             # 检查是否有进行中的主线任务
             if task['task_type'] == 'MAIN':
                 cursor.execute('''
-                    SELECT * FROM player_task pt
-                    JOIN task t ON pt.task_id = t.id
-                    WHERE pt.player_id = ? AND t.task_type = 'MAIN' 
-                    AND pt.status = 'IN_PROGRESS'
+                    SELECT task_id FROM player_task
+                    WHERE player_id = ? AND status = 'IN_PROGRESS'
                 ''', (player_id,))
+                in_progress = task_catalog_service.get_many(row['task_id'] for row in cursor.fetchall())
                 
-                if cursor.fetchone():
+                if any(t['task_type'] == 'MAIN' for t in in_progress.values()):
                     return ResponseHandler.error(
                         code=StatusCode.FAIL,
                         msg="请先完成当前主线任务"
@@ -646,6 +817,7 @@ class TaskService:
             ''', (player_id, task_id, current_time, endtime))
             
             conn.commit()
+            scheduler_service.notify_task_expiry(endtime)
             return ResponseHandler.success(
                 data={
                     'task_id': task_id,
@@ -700,16 +872,12 @@ class TaskService:
                 )
             
             # 更新任务状态
-            cursor.execute('''
-                UPDATE player_task 
-                SET status = 'ABANDONED', 
-                    complete_time = ? 
-                WHERE player_id = ? 
-                AND id = ? 
-                AND status = 'IN_PROGRESS'
-            ''', (int(time.time()), player_id, task_id))
+            abandoned = task_event_service.transition(
+                cursor, task_id, 'ABANDONED', ('IN_PROGRESS',), player_id,
+                complete_time=int(time.time())
+            )
             
-            if cursor.rowcount == 0:
+            if not abandoned:
                 conn.rollback()
                 return ResponseHandler.error(
                     code=StatusCode.FAIL,
@@ -735,103 +903,44 @@ class TaskService:
 
     def is_main_quest(self, task_id):
         """判断是否为主线任务"""
-        try:
-            conn = self.get_db()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT task_type FROM task WHERE id = ?
-            ''', (task_id,))
-            
-            result = cursor.fetchone()
-            return result and result['task_type'] == 'MAIN'
-            
-        except Exception as e:
-            logger.error(f"判断主线任务失败: {str(e)}")
-            return False
-        finally:
-            conn.close()
+        task = task_catalog_service.get(task_id)
+        return bool(task) and task['task_type'] == 'MAIN'
 
-    def check_main_quest_completion(self, player_id, main_quest_id):
-        """检查主线任务是否满足完成条件"""
+    def check_main_quest_completion(self, player_id, main_quest_id, cursor=None):
+        """检查主线任务是否满足完成条件（所有非主线子任务均已完成）"""
+        conn = None
         try:
-            conn = self.get_db()
-            cursor = conn.cursor()
-            
-            # 获取该主线任务的所有非主线子任务
-            cursor.execute('''
-                WITH RECURSIVE subtasks AS (
-                    -- 直接子任务
-                    SELECT id, task_type, parent_task_id
-                    FROM task 
-                    WHERE parent_task_id = ?
-                    
-                    UNION ALL
-                    
-                    -- 递归获取所有子任务
-                    SELECT t.id, t.task_type, t.parent_task_id
-                    FROM task t
-                    INNER JOIN subtasks s ON t.parent_task_id = s.id
-                )
-                SELECT id FROM subtasks 
-                WHERE task_type != 'MAIN'
-            ''', (main_quest_id,))
-            
-            sub_tasks = cursor.fetchall()
-            if not sub_tasks:
-                return False
-                
-            # 检查所有子任务的完成状态
-            sub_task_ids = [task['id'] for task in sub_tasks]
-            placeholders = ','.join('?' * len(sub_task_ids))
-            
-            cursor.execute(f'''
-                SELECT COUNT(*) as total, 
-                       SUM(CASE WHEN status = 'COMPLETED' THEN 1 ELSE 0 END) as completed
-                FROM player_tasks
-                WHERE player_id = ? AND task_id IN ({placeholders})
-            ''', (player_id, *sub_task_ids))
-            
-            result = cursor.fetchone()
-            return result and result['total'] > 0 and result['total'] == result['completed']
+            if cursor is None:
+                conn = self.get_db()
+                cursor = conn.cursor()
+
+            progress = task_hierarchy_service.get_main_quest_progress(cursor, player_id, [main_quest_id])
+            total, completed = progress.get(main_quest_id, (0, 0))
+            return total > 0 and total == completed
             
         except Exception as e:
             logger.error(f"检查主线任务完成条件失败: {str(e)}")
             return False
         finally:
-            conn.close()
+            if conn:
+                conn.close()
 
-    def get_parent_main_quests(self, task_id):
+    def get_parent_main_quests(self, task_id, cursor=None):
         """获取任务链上的所有主线父任务"""
+        conn = None
         try:
-            conn = self.get_db()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                WITH RECURSIVE parent_tasks AS (
-                    -- 起始任务
-                    SELECT id, task_type, parent_task_id
-                    FROM task
-                    WHERE id = ?
-                    
-                    UNION ALL
-                    
-                    -- 递归获取所有父任务
-                    SELECT t.id, t.task_type, t.parent_task_id
-                    FROM task t
-                    INNER JOIN parent_tasks p ON t.id = p.parent_task_id
-                )
-                SELECT id FROM parent_tasks 
-                WHERE task_type = 'MAIN' AND id != ?
-            ''', (task_id, task_id))
-            
-            return [row['id'] for row in cursor.fetchall()]
+            if cursor is None:
+                conn = self.get_db()
+                cursor = conn.cursor()
+
+            return task_hierarchy_service.get_ancestor_ids(cursor, task_id, 'MAIN')
             
         except Exception as e:
             logger.error(f"获取父主线任务失败: {str(e)}")
             return []
         finally:
-            conn.close()
+            if conn:
+                conn.close()
 
     def complete_task_api(self, player_id: int, task_id: int, comment: str = None) -> Dict:
         """完成任务并发放奖励
@@ -844,21 +953,23 @@ class TaskService:
         Returns:
             Dict: 包含完成状态和奖励信息的响应
         """
+        conn = None
         try:
             conn = self.get_db()
             cursor = conn.cursor()
             
-            # 1. 检查任务状态
+            # 1. 查找进行中的玩家任务，状态在更新语句中再次校验
             cursor.execute('''
-                SELECT pt.*, t.need_check, t.task_rewards
-                FROM player_task pt
-                JOIN task t ON pt.task_id = t.id
-                WHERE pt.player_id = ? AND pt.task_id = ? 
-                AND pt.status = 'IN_PROGRESS'
+                SELECT id FROM player_task
+                WHERE player_id = ? AND task_id = ? 
+                AND status = 'IN_PROGRESS'
+                ORDER BY id
+                LIMIT 1
             ''', (player_id, task_id))
             
-            task_info = cursor.fetchone()
-            if not task_info:
+            player_task = cursor.fetchone()
+            task = task_catalog_service.get(task_id)
+            if not player_task or not task:
                 return ResponseHandler.error(
                     code=StatusCode.TASK_NOT_FOUND,
                     msg="任务状态无效或不存在"
@@ -867,59 +978,65 @@ class TaskService:
             current_time = int(time.time())
             
             # 2. 根据任务配置决定是否需要审核
-            if task_info['need_check']:
+            if task['need_check']:
                 # 需要审核的任务，更新状态为待审核
                 return self._update_task_status(
-                    task_id,
+                    player_task['id'],
                     player_id,
                     'CHECK',
                     {
                         'submit_time': current_time,
                         'comment': comment
-                    }
+                    },
+                    self.SUBMITTABLE_STATUSES
                 )
             
-            # 3. 不需要审核的任务，直接完成并发放奖励
-            try:
+            # 3. 不需要审核的任务，状态变更、奖励发放和主线进度在同一个写事务内完成
+            def complete(cursor):
+                completed = task_event_service.transition(
+                    cursor, player_task['id'], 'COMPLETED', ('IN_PROGRESS',), player_id,
+                    complete_time=current_time, comment=comment
+                )
+                if not completed:
+                    # 重复请求，任务已被其他请求完成或放弃
+                    return None
+                
+                task_info = dict(completed)
+                task_info['need_check'] = task['need_check']
+                task_info['task_rewards'] = task['task_rewards']
+                
                 # 发放奖励
                 rewards_summary = self._process_task_rewards(cursor, player_id, task_info, current_time)
                 
-                # 更新任务状态
-                cursor.execute('''
-                    UPDATE player_task
-                    SET status = 'COMPLETED',
-                        complete_time = ?,
-                        comment = ?
-                    WHERE player_id = ? AND task_id = ?
-                ''', (current_time, comment, player_id, task_id))
-                
                 # 4. 检查并处理主线任务进度
                 completed_main_quests = self._process_main_quest_completion(
                     cursor, player_id, task_id, current_time
                 )
-                
-                conn.commit()
-                
-                # 构建返回结果
-                result = {
+                return {
                     'task_completed': True,
                     'rewards': rewards_summary,
                     'main_quests_completed': completed_main_quests
                 }
-                
-                return ResponseHandler.success(
-                    data=result,
-                    msg="任务完成，奖励已发放"
-                )
-                
+            
+            try:
+                result = db_connection.run_immediate(conn, complete)
             except Exception as e:
-                conn.rollback()
                 logger.error(f"处理任务完成失败: {str(e)}")
                 return ResponseHandler.error(
                     code=StatusCode.SERVER_ERROR,
                     msg=f"处理任务完成失败: {str(e)}"
                 )
             
+            if result is None:
+                return ResponseHandler.error(
+                    code=StatusCode.TASK_NOT_FOUND,
+                    msg="任务状态无效或不存在"
+                )
+            return ResponseHandler.success(
+                data=result,
+                msg="任务完成，奖励已发放"
+            )
+            
         except Exception as e:
             logger.error(f"完成任务失败: {str(e)}")
             return ResponseHandler.error(
@@ -949,10 +1066,11 @@ class TaskService:
             'medals': []
         }
         
-        rewards = json.loads(task_info['task_rewards'])
+        rewards = task_catalog_service.parse_rewards(task_info['task_rewards'])
         
         # 1. 处理积分奖励
         if rewards.get('points_rewards'):
+            player_service.invalidate_player(player_id, cursor)
             for reward in rewards['points_rewards']:
                 if reward['type'] == 'points':
                     points = int(reward['number'])
@@ -961,6 +1079,7 @@ class TaskService:
                         SET points = points + ? 
                         WHERE player_id = ?
                     ''', (points, player_id))
+                    leaderboard_service.add_score('points', player_id, points, cursor)
                     rewards_summary['points'] = points
                 elif reward['type'] == 'exp':
                     exp = int(reward['number'])
@@ -973,6 +1092,7 @@ class TaskService:
                         SET experience = ? 
                         WHERE player_id = ?
                     ''', (new_exp, player_id))
+                    leaderboard_service.set_score('experience', player_id, new_exp, cursor)
                     
                     cursor.execute('''
                         INSERT INTO exp_record (player_id, number, addtime, total)
@@ -1015,6 +1135,7 @@ class TaskService:
                 ''', (player_id, medal_id, current_time))
                 
                 if cursor.rowcount > 0:
+                    leaderboard_service.add_score('medals', player_id, 1, cursor)
                     rewards_summary['medals'].append(medal_id)
         # 输出奖励信息
         logger.info(f"奖励信息: {rewards_summary}")
@@ -1035,30 +1156,32 @@ class TaskService:
         """
         completed_main_quests = []
         
-        # 获取父主线任务
-        parent_main_quests = self.get_parent_main_quests(task_id)
+        # 获取父主线任务及玩家在其下的子任务完成情况（同一事务内，包含刚完成的任务）
+        parent_main_quests = self.get_parent_main_quests(task_id, cursor)
+        progress = task_hierarchy_service.get_main_quest_progress(cursor, player_id, parent_main_quests)
         
         for main_quest_id in parent_main_quests:
             # 检查主线任务是否可以完成
-            if self.check_main_quest_completion(player_id, main_quest_id):
+            total, completed = progress.get(main_quest_id, (0, 0))
+            if total > 0 and total == completed:
                 # 获取主线任务信息
+                main_quest = task_catalog_service.get(main_quest_id)
                 cursor.execute('''
-                    SELECT t.*, pt.player_id
-                    FROM task t
-                    LEFT JOIN player_task pt ON t.id = pt.task_id AND pt.player_id = ?
-                    WHERE t.id = ?
+                    SELECT id FROM player_task
+                    WHERE player_id = ? AND task_id = ?
                 ''', (player_id, main_quest_id))
-                main_quest = cursor.fetchone()
+                main_quest_rows = [row[0] for row in cursor.fetchall()]
                 
-                if main_quest and main_quest['player_id']:
-                    # 更新主线任务状态
-                    cursor.execute('''
-                        UPDATE player_task
-                        SET status = 'COMPLETED',
-                            complete_time = ?
-                        WHERE player_id = ? AND task_id = ?
-                    ''', (current_time, player_id, main_quest_id))
-                    
+                if main_quest and main_quest_rows:
+                    # 更新主线任务状态；已完成的主线任务不再变更，也不重复发放奖励
+                    # （子任务须在父任务完成后才能接取，可重复的子任务每次完成都会走到这里）
+                    changed = task_event_service.transition_many(
+                        cursor, main_quest_rows, 'COMPLETED', ('IN_PROGRESS', 'CHECK'),
+                        complete_time=current_time
+                    )
+                    if not changed:
+                        continue
+
                     # 发放主线任务奖励
                     rewards = self._process_task_rewards(cursor, player_id, main_quest, current_time)
                     
@@ -1069,29 +1192,36 @@ class TaskService:
         
         return completed_main_quests
 
-    def _get_admin_tasks_query(self):
+    def _get_admin_tasks_query(self, select_list: str = 't.*'):
         """获取管理后台任务查询SQL"""
-        return '''
-            SELECT t.*
+        return f'''
+            SELECT {select_list}
             FROM task t
         '''
 
-    def get_tasks(self, page=None, limit=None):
+    def get_tasks(self, page=None, limit=None, fields=None):
         """获取任务列表（管理后台接口）
         
         Args:
             page: 页码
             limit: 每页数量
+            fields: 返回的字段（逗号分隔的字符串或列表），默认全部；只查询需要的列
             
         Returns:
             Dict: 任务列表数据
         """
+        conn = None
         try:
             conn = self.get_db()
             cursor = conn.cursor()
             
             # 构建基础查询
-            query = self._get_admin_tasks_query()
+            try:
+                fields = parse_fields(fields)
+                select_list = select_columns(fields, table_columns(cursor, 'task'), prefix='t.') if fields else 't.*'
+            except ValueError as e:
+                return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg=str(e))
+            query = self._get_admin_tasks_query(select_list)
             
             # 获取总数
             count_query = f"SELECT COUNT(*) FROM task"
@@ -1208,6 +1338,8 @@ class TaskService:
                         if reward.get('name') and reward.get('number') is not None
                     ]
 
+            # 闭包表由 task 表上的触发器同步，插入前确保触发器已创建
+            task_hierarchy_service.ensure_schema(cursor)
             cursor.execute('''
                 INSERT INTO task (
                     name, description, task_chain_id, parent_task_id,
@@ -1234,6 +1366,7 @@ class TaskService:
 
             task_id = cursor.lastrowid
             conn.commit()
+            task_catalog_service.invalidate()
 
             return ResponseHandler.success(
                 data={"id": task_id},
@@ -1263,13 +1396,23 @@ class TaskService:
             cursor = conn.cursor()
             logger.info(f"更新任务: {data}")
             # 检查任务是否存在
-            cursor.execute('SELECT id FROM task WHERE id = ?', (task_id,))
-            if not cursor.fetchone():
+            cursor.execute('SELECT id, parent_task_id FROM task WHERE id = ?', (task_id,))
+            existing = cursor.fetchone()
+            if not existing:
                 return ResponseHandler.error(
                     code=StatusCode.TASK_NOT_FOUND,
                     msg="任务不存在"
                 )
 
+            # 父任务不能是任务自身或其子任务
+            parent_task_id = int(data.get('parent_task_id', 0))
+            parent_changed = parent_task_id != existing['parent_task_id']
+            if parent_changed and task_hierarchy_service.would_create_cycle(cursor, int(task_id), parent_task_id):
+                return ResponseHandler.error(
+                    code=StatusCode.PARAM_ERROR,
+                    msg="父任务不能是任务自身或其子任务"
+                )
+
             # 处理任务奖励数据
             task_rewards = {
                 'points_rewards': [],
@@ -1362,6 +1505,7 @@ class TaskService:
             ))
 
             conn.commit()
+            task_catalog_service.invalidate()
 
             return ResponseHandler.success(msg="更新任务成功")
 
@@ -1388,9 +1532,11 @@ class TaskService:
                     msg="任务不存在"
                 )
 
-            # 删除任务
+            # 删除任务，闭包表由触发器同步
+            task_hierarchy_service.ensure_schema(cursor)
             cursor.execute('DELETE FROM task WHERE id = ?', (task_id,))
             conn.commit()
+            task_catalog_service.invalidate()
 
             return ResponseHandler.success(msg="删除任务成功")
 
@@ -1404,21 +1550,27 @@ class TaskService:
             conn.close()
 
     # admin接口
-    def get_player_tasks(self, page=1, limit=20):
-        """获取玩家任务列表，支持分页"""
+    def get_player_tasks(self, page=1, limit=20, cursor_id=None):
+        """获取玩家任务列表，支持分页
+
+        cursor_id 为上一页返回的 next_cursor，提供时按ID游标翻页（忽略 page），深翻页不再跳过前面的记录
+        """
         try:
             conn = self.get_db()
             cursor = conn.cursor()
 
-            # 获取总数
-            cursor.execute('SELECT COUNT(*) FROM player_task')
-            total = cursor.fetchone()[0]
+            # 总数取自汇总表
+            total = self._count_player_tasks(cursor)
 
-            # 计算偏移量
-            offset = (page - 1) * limit
+            if cursor_id is not None:
+                keyset = 'WHERE pt.id < ?'
+                params = (cursor_id, limit + 1, 0)
+            else:
+                keyset = ''
+                params = (limit + 1, (page - 1) * limit)
 
-            # 获取分页数据
-            cursor.execute('''
+            # 获取分页数据，多取一条判断是否还有下一页
+            cursor.execute(f'''
                 SELECT 
                     pt.id,
                     pt.player_id,
@@ -1431,12 +1583,16 @@ class TaskService:
                     pt.comment
                 FROM player_task pt 
                 LEFT JOIN task t ON pt.task_id = t.id 
+                {keyset}
                 ORDER BY pt.id DESC 
                 LIMIT ? OFFSET ?
-            ''', (limit, offset))
+            ''', params)
+
+            rows = cursor.fetchall()
+            next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
 
             tasks = []
-            for row in cursor.fetchall():
+            for row in rows[:limit]:
                 tasks.append({
                     'id': row['id'],
                     'player_id': row['player_id'],
@@ -1454,7 +1610,8 @@ class TaskService:
                     'tasks': tasks,
                     'total': total,
                     'page': page,
-                    'limit': limit
+                    'limit': limit,
+                    'next_cursor': next_cursor
                 },
                 msg="获取玩家任务列表成功"
             )
@@ -1561,6 +1718,8 @@ class TaskService:
 
             task_id = cursor.lastrowid
             conn.commit()
+            if status == 'IN_PROGRESS':
+                scheduler_service.notify_task_expiry(data.get('endtime'))
 
             return ResponseHandler.success(
                 data={'id': task_id},
@@ -1617,6 +1776,8 @@ class TaskService:
 
             cursor.execute(update_query, params)
             conn.commit()
+            if data.get('status') == 'IN_PROGRESS':
+                scheduler_service.notify_task_expiry(data.get('endtime'))
 
             # 获取更新后的数据
             cursor.execute('''
@@ -1690,129 +1851,253 @@ class TaskService:
 
     def approve_player_task(self, player_task_id: int) -> Dict:
         """通过任务审核"""
-        conn = None
-        try:
-            conn = self.get_db()
-            cursor = conn.cursor()
-            
-            # 检查玩家任务是否存在且状态为待审核
-            cursor.execute('''
-                SELECT pt.*, t.name as task_name, t.task_rewards, t.id as task_id
-                FROM player_task pt
-                JOIN task t ON pt.task_id = t.id
-                WHERE pt.id = ? AND pt.status = 'CHECK'
-            ''', (player_task_id,))
-            
-            task = cursor.fetchone()
-            if not task:
-                return ResponseHandler.error(
-                    code=StatusCode.TASK_NOT_FOUND,
-                    msg="任务不存在或状态不正确"
-                )
-            
-            current_time = int(time.time())
-            
-            # 更新任务状态为已完成
-            cursor.execute('''
-                UPDATE player_task 
-                SET status = 'COMPLETED',
-                    complete_time = ?
-                WHERE id = ? AND status = 'CHECK'
-            ''', (current_time, player_task_id))
-            
-            if cursor.rowcount == 0:
-                conn.rollback()
-                return ResponseHandler.error(
-                    code=StatusCode.FAIL,
-                    msg="更新任务状态失败"
-                )
-            
-            # 处理任务奖励
-            task_dict = dict(task)
-            rewards_summary = self._process_task_rewards(cursor, task_dict['player_id'], task_dict, current_time)
-            
-            conn.commit()
-            return ResponseHandler.success(
-                data={
-                    'task_id': task_dict['task_id'],
-                    'player_task_id': player_task_id,
-                    'rewards': rewards_summary
-                },
-                msg="任务审核通过"
-            )
-            
-        except Exception as e:
-            logger.error(f"任务审核失败: {str(e)}")
-            if conn:
-                conn.rollback()
+        result = self.review_player_tasks(approve_ids=[player_task_id])
+        if result['code'] != 0:
+            return result
+        approved = result['data']['approved']
+        if not approved:
             return ResponseHandler.error(
-                code=StatusCode.SERVER_ERROR,
-                msg=f"任务审核失败: {str(e)}"
+                code=StatusCode.TASK_NOT_FOUND,
+                msg="任务不存在或状态不正确"
             )
-        finally:
-            if conn:
-                conn.close()
+        return ResponseHandler.success(
+            data={
+                'task_id': approved[0]['task_id'],
+                'player_task_id': player_task_id,
+                'rewards': approved[0]['rewards']
+            },
+            msg="任务审核通过"
+        )
 
     def reject_player_task(self, player_task_id: int, reject_reason: str = None) -> Dict:
         """驳回任务"""
+        result = self.review_player_tasks(reject_ids=[player_task_id], reject_reason=reject_reason)
+        if result['code'] != 0:
+            return result
+        rejected = result['data']['rejected']
+        if not rejected:
+            return ResponseHandler.error(
+                code=StatusCode.TASK_NOT_FOUND,
+                msg="任务不存在或状态不正确"
+            )
+        return ResponseHandler.success(
+            data={
+                'player_task_id': player_task_id,
+                'task_name': rejected[0]['task_name'],
+                'reject_reason': reject_reason
+            },
+            msg="任务已驳回"
+        )
+
+    def review_player_tasks(self, approve_ids: List[int] = None, reject_ids: List[int] = None,
+                            reject_reason: str = None) -> Dict:
+        """批量审核待审核任务，所有状态变更和奖励发放在一个事务内完成
+
+        Args:
+            approve_ids: 审核通过的玩家任务ID列表
+            reject_ids: 驳回的玩家任务ID列表
+            reject_reason: 驳回原因
+
+        Returns:
+            Dict: approved / rejected 为处理成功的任务，skipped 为不存在、不是待审核状态或任务已删除的ID，
+                  players 为每个玩家的通过/驳回数量
+        """
+        for ids in (approve_ids, reject_ids):
+            if ids is not None and not (
+                isinstance(ids, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in ids)
+            ):
+                return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg="任务ID列表格式错误")
+        approve_ids = list(dict.fromkeys(approve_ids or []))
+        reject_ids = list(dict.fromkeys(reject_ids or []))
+        if not approve_ids and not reject_ids:
+            return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg="没有需要审核的任务")
+        if len(approve_ids) + len(reject_ids) > self.REVIEW_BATCH_LIMIT:
+            return ResponseHandler.error(
+                code=StatusCode.PARAM_ERROR,
+                msg=f"单次最多审核 {self.REVIEW_BATCH_LIMIT} 个任务"
+            )
+        if set(approve_ids) & set(reject_ids):
+            return ResponseHandler.error(code=StatusCode.PARAM_ERROR, msg="同一任务不能同时通过和驳回")
+
         conn = None
         try:
+            # 在取得写锁之前获取任务目录，事务内不再打开其他连接
+            tasks = task_catalog_service.snapshot().tasks
             conn = self.get_db()
-            cursor = conn.cursor()
-            
-            # 检查玩家任务是否存在且状态为待审核
-            cursor.execute('''
-                SELECT pt.*, t.name as task_name
-                FROM player_task pt
-                JOIN task t ON pt.task_id = t.id
-                WHERE pt.id = ? AND pt.status = 'CHECK'
-            ''', (player_task_id,))
-            
-            task = cursor.fetchone()
-            if not task:
-                return ResponseHandler.error(
-                    code=StatusCode.TASK_NOT_FOUND,
-                    msg="任务不存在或状态不正确"
+            current_time = int(time.time())
+            order = {player_task_id: i for i, player_task_id in enumerate(approve_ids + reject_ids)}
+
+            def review(cursor):
+                # 任务已不在任务目录中的不能发放奖励，保持待审核状态，计入 skipped
+                approvable_ids = []
+                for i in range(0, len(approve_ids), task_event_service.TRANSITION_CHUNK_SIZE):
+                    chunk = approve_ids[i:i + task_event_service.TRANSITION_CHUNK_SIZE]
+                    cursor.execute(
+                        f"SELECT id, task_id FROM player_task WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                    )
+                    approvable_ids.extend(row['id'] for row in cursor.fetchall() if row['task_id'] in tasks)
+                # 每种审核结果一条带状态条件的更新，只返回确实处于待审核状态的任务
+                approve_rows = task_event_service.transition_many(
+                    cursor, approvable_ids, 'COMPLETED', ('CHECK',), complete_time=current_time
                 )
-            
-            # 更新任务状态为已驳回
-            cursor.execute('''
-                UPDATE player_task 
-                SET status = 'REJECT',
-                    reject_reason = ?,
-                    complete_time = ?
-                WHERE id = ? AND status = 'CHECK'
-            ''', (reject_reason or '', int(time.time()), player_task_id))
-            
-            if cursor.rowcount == 0:
-                conn.rollback()
-                return ResponseHandler.error(
-                    code=StatusCode.FAIL,
-                    msg="更新任务状态失败"
+                reject_rows = task_event_service.transition_many(
+                    cursor, reject_ids, 'REJECT', ('CHECK',),
+                    reject_reason=reject_reason or '', complete_time=current_time
                 )
-            
-            conn.commit()
+                # 按请求顺序发放奖励和返回结果
+                approve_rows.sort(key=lambda row: order[row['id']])
+                reject_rows.sort(key=lambda row: order[row['id']])
+                rewards_by_row = self._process_task_rewards_bulk(
+                    cursor, approve_rows, tasks, current_time
+                )
+                return approve_rows, reject_rows, rewards_by_row
+
+            approve_rows, reject_rows, rewards_by_row = db_connection.run_immediate(conn, review)
+            reviewed = {row['id'] for row in approve_rows + reject_rows}
+
+            players = {}
+            approved = []
+            for row in approve_rows:
+                approved.append({
+                    'player_task_id': row['id'],
+                    'player_id': row['player_id'],
+                    'task_id': row['task_id'],
+                    'task_name': tasks.get(row['task_id'], {}).get('name'),
+                    'rewards': rewards_by_row.get(row['id'], {})
+                })
+                players.setdefault(row['player_id'], {'approved': 0, 'rejected': 0})['approved'] += 1
+            rejected = []
+            for row in reject_rows:
+                rejected.append({
+                    'player_task_id': row['id'],
+                    'player_id': row['player_id'],
+                    'task_id': row['task_id'],
+                    'task_name': tasks.get(row['task_id'], {}).get('name')
+                })
+                players.setdefault(row['player_id'], {'approved': 0, 'rejected': 0})['rejected'] += 1
+
+            logger.info(f"批量审核完成: 通过 {len(approved)}，驳回 {len(rejected)}，涉及玩家 {len(players)}")
             return ResponseHandler.success(
                 data={
-                    'player_task_id': player_task_id,
-                    'task_name': task['task_name'],
-                    'reject_reason': reject_reason
+                    'approved': approved,
+                    'rejected': rejected,
+                    'skipped': [i for i in approve_ids + reject_ids if i not in reviewed],
+                    'players': players
                 },
-                msg="任务已驳回"
+                msg="任务审核完成"
             )
-            
+
         except Exception as e:
-            logger.error(f"任务驳回失败: {str(e)}")
-            if conn:
-                conn.rollback()
+            logger.error(f"批量审核任务失败: {str(e)}")
             return ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
-                msg=f"任务驳回失败: {str(e)}"
+                msg=f"任务审核失败: {str(e)}"
             )
         finally:
             if conn:
                 conn.close()
 
+    def _process_task_rewards_bulk(self, cursor, player_tasks: List[Dict], tasks: Dict[int, Dict],
+                                   current_time: int) -> Dict[int, Dict]:
+        """批量发放任务奖励，与逐个调用 _process_task_rewards 的结果一致
+
+        每个玩家的积分和经验只更新一次，经验记录、卡片和勋章使用 executemany 批量写入。
+
+        Returns:
+            Dict[int, Dict]: 玩家任务ID -> 奖励发放摘要
+        """
+        if not player_tasks:
+            return {}
+        player_ids = list({row['player_id'] for row in player_tasks})
+        placeholders = ','.join('?' * len(player_ids))
+
+        cursor.execute(f'''
+            SELECT player_id, experience FROM player_data WHERE player_id IN ({placeholders})
+        ''', player_ids)
+        experience = {row['player_id']: row['experience'] or 0 for row in cursor.fetchall()}
+        cursor.execute(f'''
+            SELECT player_id, medal_id FROM player_medal WHERE player_id IN ({placeholders})
+        ''', player_ids)
+        owned_medals = {(row['player_id'], row['medal_id']) for row in cursor.fetchall()}
+
+        points_delta = {}
+        exp_records = []
+        cards = {}
+        new_medals = []
+        summaries = {}
+        for row in player_tasks:
+            player_id = row['player_id']
+            summary = {'points': 0, 'exp': 0, 'cards': [], 'medals': []}
+            rewards = task_catalog_service.parse_rewards(tasks[row['task_id']]['task_rewards'])
+
+            for reward in rewards.get('points_rewards') or []:
+                if reward['type'] == 'points':
+                    points = int(reward['number'])
+                    points_delta[player_id] = points_delta.get(player_id, 0) + points
+                    summary['points'] = points
+                elif reward['type'] == 'exp':
+                    exp = int(reward['number'])
+                    experience[player_id] = experience.get(player_id, 0) + exp
+                    exp_records.append((player_id, exp, current_time, experience[player_id]))
+                    summary['exp'] = exp
+
+            for card in rewards.get('card_rewards') or []:
+                card_id = card.get('id')
+                number = card.get('number', 1)
+                if not card_id:
+                    continue
+                cards[(player_id, card_id)] = cards.get((player_id, card_id), 0) + number
+                summary['cards'].append({'id': card_id, 'number': number})
+
+            for medal in rewards.get('medal_rewards') or []:
+                medal_id = medal.get('id')
+                if not medal_id or (player_id, medal_id) in owned_medals:
+                    continue
+                owned_medals.add((player_id, medal_id))
+                new_medals.append((player_id, medal_id, current_time))
+                summary['medals'].append(medal_id)
+
+            summaries[row['id']] = summary
+
+        cursor.executemany('''
+            UPDATE player_data
+            SET points = points + ?
+            WHERE player_id = ?
+        ''', [(points, player_id) for player_id, points in points_delta.items()])
+        exp_players = {record[0] for record in exp_records}
+        for player_id in exp_players.union(points_delta):
+            player_service.invalidate_player(player_id, cursor)
+        for player_id, points in points_delta.items():
+            leaderboard_service.add_score('points', player_id, points, cursor)
+        for player_id in exp_players:
+            leaderboard_service.set_score('experience', player_id, experience[player_id], cursor)
+        cursor.executemany('''
+            UPDATE player_data
+            SET experience = ?
+            WHERE player_id = ?
+        ''', [(experience[player_id], player_id) for player_id in exp_players])
+        cursor.executemany('''
+            INSERT INTO exp_record (player_id, number, addtime, total)
+            VALUES (?, ?, ?, ?)
+        ''', exp_records)
+        cursor.executemany('''
+            INSERT INTO player_game_card (player_id, game_card_id, number, timestamp)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(player_id, game_card_id) DO UPDATE
+            SET number = number + ?,
+                timestamp = ?
+        ''', [(player_id, card_id, number, current_time, number, current_time)
+              for (player_id, card_id), number in cards.items()])
+        cursor.executemany('''
+            INSERT OR IGNORE INTO player_medal (player_id, medal_id, addtime)
+            VALUES (?, ?, ?)
+        ''', new_medals)
+        for player_id, _, _ in new_medals:
+            leaderboard_service.add_score('medals', player_id, 1, cursor)
+
+        logger.info(f"批量发放奖励: {len(player_tasks)} 个任务，{len(player_ids)} 个玩家")
+        return summaries
+
     def get_task_approval_status(self, task_id: int, player_id: int) -> Dict:
         """
         查询任务的审批状态
@@ -1872,6 +2157,7 @@ class TaskService:
         :param player_id: 玩家ID
         :return: 同步结果
         """
+        conn = None
         try:
             # 获取审批状态
             approval_result = self.get_task_approval_status(task_id, player_id)
@@ -1881,72 +2167,29 @@ class TaskService:
             status_info = approval_result.get('data', {})
             status_code = status_info.get('status_code')
             
+            # 在取得写锁之前获取任务目录，事务内不再打开其他连接
+            tasks = task_catalog_service.snapshot().tasks
             conn = self.get_db()
-            cursor = conn.cursor()
-            
-            # 先获取任务的当前状态
-            cursor.execute('''
-                SELECT status 
-                FROM player_task 
-                WHERE id = ? AND player_id = ?
-            ''', (task_id, player_id))
-            current_status = cursor.fetchone()
-            
-            if not current_status:
-                return ResponseHandler.error(
-                    code=StatusCode.TASK_NOT_FOUND,
-                    msg="任务不存在"
-                )
-            
-            current_status = current_status["status"]
-            
-            # 如果任务已经完成或已被驳回，不再更新状态
-            if current_status not in ['CHECK']:
-                logger.info(f"任务 {task_id} 当前状态为 {current_status}，不需要同步审批状态")
-                return ResponseHandler.success(
-                    data={
-                        "task_id": task_id,
-                        "player_id": player_id,
-                        "status": current_status,
-                        "approval_status": status_info
-                    },
-                    msg=f"任务当前状态为 {current_status}，不需要同步审批状态"
-                )
+            current_time = int(time.time())
             
-            # 根据审批状态更新任务状态
+            # 根据审批状态更新任务状态，只有仍处于待审核状态的任务会被更新（回调重试时只生效一次）
+            updated = None
+            reject_reason = None
             if status_code == 2:  # 已通过
-                # 更新任务状态为完成
-                cursor.execute('''
-                    UPDATE player_task 
-                    SET status = 'COMPLETED', 
-                        complete_time = ? 
-                    WHERE id = ? AND player_id = ?
-                ''', (int(time.time()), task_id, player_id))
-                conn.commit()
-                
-                # 获取任务信息
-                cursor.execute('''
-                    SELECT t.name, t.task_rewards 
-                    FROM player_task pt
-                    JOIN task t ON pt.task_id = t.id
-                    WHERE pt.id = ? AND pt.player_id = ?
-                ''', (task_id, player_id))
-                task_info = cursor.fetchone()
+                def approve(cursor):
+                    # 更新任务状态为完成并发放奖励
+                    row = task_event_service.transition(
+                        cursor, task_id, 'COMPLETED', ('CHECK',), player_id,
+                        complete_time=current_time
+                    )
+                    task_info = tasks.get(row['task_id']) if row else None
+                    if task_info and task_info['task_rewards']:
+                        self._process_task_rewards(cursor, player_id, task_info, current_time)
+                    return row
                 
-                if task_info and task_info["task_rewards"]:
-                    # 处理任务奖励
-                    self._process_task_rewards(cursor, player_id, task_info, int(time.time()))
-                    conn.commit()
-                
-                return ResponseHandler.success(
-                    data={
-                        "task_id": task_id,
-                        "player_id": player_id,
-                        "status": "COMPLETED",
-                        "approval_status": status_info
-                    },
-                    msg="任务已通过审批并设置为完成状态"
-                )
+                updated = db_connection.run_immediate(conn, approve)
+                new_status = "COMPLETED"
+                msg = "任务已通过审批并设置为完成状态"
                 
             elif status_code == 3:  # 已驳回
                 # 获取驳回原因
@@ -1958,56 +2201,53 @@ class TaskService:
                             break
                 
                 # 更新任务状态为进行中（驳回后可以重新提交）
-                cursor.execute('''
-                    UPDATE player_task 
-                    SET status = 'IN_PROGRESS',
-                        reject_reason = ? 
-                    WHERE id = ? AND player_id = ?
-                ''', (reject_reason, task_id, player_id))
-                conn.commit()
-                
-                # 发送驳回通知
-                from function.NotificationService import notification_service
-                notification_service.add_notification(
-                    message_title="任务被驳回",
-                    content=f"您的任务「{task_id}」已被驳回，原因：{reject_reason}",
-                    target_type="player",
-                    target_id=player_id,
-                    notification_type="task_rejected"
-                )
-                
-                return ResponseHandler.success(
-                    data={
-                        "task_id": task_id,
-                        "player_id": player_id,
-                        "status": "IN_PROGRESS",
-                        "approval_status": status_info,
-                        "reject_reason": reject_reason
-                    },
-                    msg="任务审批被驳回，已重置为进行中状态"
-                )
+                updated = db_connection.run_immediate(conn, lambda cursor: task_event_service.transition(
+                    cursor, task_id, 'IN_PROGRESS', ('CHECK',), player_id,
+                    reject_reason=reject_reason
+                ))
+                new_status = "IN_PROGRESS"
+                msg = "任务审批被驳回，已重置为进行中状态"
                 
             elif status_code == 4 or status_code == 6 or status_code == 7:  # 已撤销、通过后撤销、已删除
                 # 更新任务状态为进行中
+                updated = db_connection.run_immediate(conn, lambda cursor: task_event_service.transition(
+                    cursor, task_id, 'IN_PROGRESS', ('CHECK',), player_id
+                ))
+                new_status = "IN_PROGRESS"
+                msg = "任务审批已撤销/删除，已重置为进行中状态"
+            
+            if not updated:
+                # 未更新时读取当前状态说明原因
+                cursor = conn.cursor()
                 cursor.execute('''
-                    UPDATE player_task 
-                    SET status = 'IN_PROGRESS' 
+                    SELECT status 
+                    FROM player_task 
                     WHERE id = ? AND player_id = ?
                 ''', (task_id, player_id))
-                conn.commit()
+                current_status = cursor.fetchone()
                 
-                return ResponseHandler.success(
-                    data={
-                        "task_id": task_id,
-                        "player_id": player_id,
-                        "status": "IN_PROGRESS",
-                        "approval_status": status_info
-                    },
-                    msg="任务审批已撤销/删除，已重置为进行中状态"
-                )
+                if not current_status:
+                    return ResponseHandler.error(
+                        code=StatusCode.TASK_NOT_FOUND,
+                        msg="任务不存在"
+                    )
                 
-            else:
-                # 其他状态不处理
+                current_status = current_status["status"]
+                
+                # 如果任务已经完成或已被驳回，不再更新状态
+                if current_status not in ['CHECK']:
+                    logger.info(f"任务 {task_id} 当前状态为 {current_status}，不需要同步审批状态")
+                    return ResponseHandler.success(
+                        data={
+                            "task_id": task_id,
+                            "player_id": player_id,
+                            "status": current_status,
+                            "approval_status": status_info
+                        },
+                        msg=f"任务当前状态为 {current_status}，不需要同步审批状态"
+                    )
+                
+                # 其他审批状态不处理
                 return ResponseHandler.success(
                     data={
                         "task_id": task_id,
@@ -2017,6 +2257,26 @@ class TaskService:
                     },
                     msg=f"任务审批状态：{status_info.get('status_text', '未知')}"
                 )
+            
+            data = {
+                "task_id": task_id,
+                "player_id": player_id,
+                "status": new_status,
+                "approval_status": status_info
+            }
+            if status_code == 3:
+                # 发送驳回通知
+                from function.NotificationService import notification_service
+                notification_service.add_notification(
+                    message_title="任务被驳回",
+                    content=f"您的任务「{task_id}」已被驳回，原因：{reject_reason}",
+                    target_type="player",
+                    target_id=player_id,
+                    notification_type="task_rejected"
+                )
+                data["reject_reason"] = reject_reason
+            
+            return ResponseHandler.success(data=data, msg=msg)
                 
         except Exception as e:
             logger.error(f"同步任务审批状态失败: {str(e)}", exc_info=True)
@@ -211,13 +211,12 @@ class WebSocketService:
         except Exception as e:
             logger.error(f"[WebSocket] 广播GPS更新失败: {str(e)}", exc_info=True)
 
-    def broadcast_log_update(self, logs: list, latest: Dict[str, Any]) -> None:
-        """广播日志更新"""
+    def broadcast_log_update(self, latest: Dict[str, Any]) -> None:
+        """广播日志更新（仅发送新增条目）"""
         return
         try:
             logger.debug(f"[WebSocket] 广播日志更新: latest={latest}")
             self.emit('log_update', {
-                'logs': logs,
                 'latest': latest,
                 'timestamp': time.time()
             })
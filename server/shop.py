@@ -5,6 +5,7 @@ import logging
 from utils.response_handler import ResponseHandler, StatusCode, api_response
 from function.ShopService import shop_service
 from function.PlayerService import player_service
+from function.IdempotencyService import idempotency_service
 # 配置日志
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -115,6 +116,7 @@ def delete_item(item_id):
 @shop_bp.route('/api/shop/purchase', methods=['POST'])
 @api_response
 @player_service.player_required
+@idempotency_service.idempotent
 def purchase():
     """购买商品"""
     try:
@@ -48,13 +48,21 @@ class APIClient {
                 headers['Content-Type'] = 'application/json';
             }
 
+            // 写操作携带幂等键，网络异常或服务端仍在处理时用同一个键重试，服务端不会重复执行
+            const { idempotent, ...fetchOptions } = options;
+            if (idempotent && !headers['Idempotency-Key']) {
+                headers['Idempotency-Key'] = this.createIdempotencyKey();
+            }
+
             // 合并选项
             const finalOptions = {
-                ...options,
+                ...fetchOptions,
                 headers
             };
 
-            const response = await fetch(url, finalOptions);
+            const response = idempotent
+                ? await this.fetchWithRetry(url, finalOptions)
+                : await fetch(url, finalOptions);
             
             if (!response.ok) {
                 Logger.error('API', '请求失败:', response.status, await response.text());
@@ -71,6 +79,41 @@ class APIClient {
         }
     }
 
+    /**
+     * 生成幂等键
+     * @returns {string}
+     */
+    createIdempotencyKey() {
+        if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+            return window.crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+    }
+
+    /**
+     * 带幂等键的请求：网络异常或 409（首次请求处理中）时按退避间隔重试
+     * @param {string} url - 完整URL
+     * @param {Object} options - fetch 选项
+     * @param {number} retries - 最大重试次数
+     * @returns {Promise<Response>}
+     */
+    async fetchWithRetry(url, options, retries = 2) {
+        for (let attempt = 0; ; attempt++) {
+            try {
+                const response = await fetch(url, options);
+                if (response.status !== 409 || attempt >= retries) {
+                    return response;
+                }
+            } catch (error) {
+                if (attempt >= retries) {
+                    throw error;
+                }
+                Logger.warn('API', '请求失败，使用相同幂等键重试:', url, error);
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+        }
+    }
+
     // 任务相关 API
     async getCurrentTasks(playerId) {
         Logger.info('API', '获取当前任务:', playerId);
@@ -81,6 +124,7 @@ class APIClient {
         Logger.info('API', '接受任务:', taskId, 'for player:', playerId);
         return this.request('/api/tasks/accept', {
             method: 'POST',
+            idempotent: true,
             body: JSON.stringify({ 
                 player_id: playerId, 
                 task_id: taskId 
@@ -108,13 +152,15 @@ class APIClient {
         Logger.info('API', '提交任务:', taskId, 'for player:', playerId);
         return this.request(`/api/tasks/submit`, {
             method: 'POST',
+            idempotent: true,
             body: JSON.stringify({ player_id: playerId, task_id: taskId })
         });
     }
     async completeTask(taskId, playerId) {
         Logger.info('API', '完成任务:', taskId, 'for player:', playerId);
         return this.request(`/api/tasks/complete`, {
-            method: 'POST', 
+            method: 'POST',
+            idempotent: true,
             body: JSON.stringify({ player_id: playerId, task_id: taskId })
         });
     }
@@ -125,6 +171,13 @@ class APIClient {
         return this.request(`/api/player/${playerId}`);
     }
 
+    // 首屏数据：一次请求获取玩家信息、任务、未读通知数、词云等，include 为需要的部分
+    async getBootstrap(playerId, include = []) {
+        Logger.info('API', '获取首屏数据:', playerId);
+        const query = include.length ? `?include=${include.join(',')}` : '';
+        return this.request(`/api/player/${playerId}/bootstrap${query}`);
+    }
+
     async getPlayerTags() {
         Logger.info('API', '获取玩家标签');
         return this.request('/api/player/tags');
@@ -303,6 +356,7 @@ class APIClient {
         Logger.info('API', '购买商品:', { itemId, quantity, playerId });
         return this.request('/api/shop/purchase', {
             method: 'POST',
+            idempotent: true,
             headers: {
                 'Content-Type': 'application/json'
             },
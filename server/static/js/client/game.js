@@ -261,13 +261,14 @@ class GameManager {
             });
         }
 
-        // 3. 加载任务数据
+        // 3. 加载任务数据，首屏数据请求失败时按原接口分别加载
+        const bootstrap = await this.loadBootstrap(playerId);
         if (this.taskService && this.uiService) {
           await Promise.all([
-            this.taskService.loadTasks().then((tasks) => {
+            this.taskService.loadTasks(bootstrap.available_tasks).then((tasks) => {
               this.uiService.renderTaskList(tasks);
             }),
-            this.taskService.loadCurrentTasks().then((currentTasks) => {
+            this.taskService.loadCurrentTasks(bootstrap.current_tasks).then((currentTasks) => {
               this.uiService.renderCurrentTasks(currentTasks);
             }),
           ]);
@@ -280,7 +281,7 @@ class GameManager {
         }
 
         // 5. 初始化文字云
-        await this.initWordCloud();
+        await this.initWordCloud(bootstrap.wordcloud);
 
         Logger.info("GameManager", "[initializeApplication:237]", "初始化应用完成");
       } catch (error) {
@@ -293,12 +294,27 @@ class GameManager {
 
     return this.initializationPromise;
   }
+  // 一次请求获取首屏需要的任务和词云数据
+  async loadBootstrap(playerId) {
+    if (!playerId) return {};
+    try {
+      const result = await this.api.getBootstrap(playerId, ["current_tasks", "available_tasks", "wordcloud"]);
+      if (result.code === 0 && result.data) {
+        return result.data;
+      }
+      Logger.warn("GameManager", "[loadBootstrap]", "获取首屏数据失败:", result.msg);
+    } catch (error) {
+      Logger.warn("GameManager", "[loadBootstrap]", "获取首屏数据失败:", error);
+    }
+    return {};
+  }
+
   // 初始化文字云
-  async initWordCloud() {
+  async initWordCloud(prefetched = null) {
     Logger.info("GameManager", "初始化文字云");
     const container = document.getElementById("wordCloudContainer");
     if (container) {
-      await this.wordcloudService.initWordCloud(container);
+      await this.wordcloudService.initWordCloud(prefetched);
     } else {
       Logger.error("GameManager", "找不到文字云容器");
     }
@@ -20,13 +20,16 @@ class TaskService {
     this.saveState(); // 保存状态
   }
 
-  async loadTasks() {
+  async loadTasks(prefetched = null) {
     if (this.loading) return;
 
     Logger.info("TaskService", "开始加载任务");
     this.loading = true;
     try {
-      const result = await this.api.getTaskList(this.playerService.getPlayerId());
+      // 首屏数据中已包含可用任务时不再单独请求
+      const result = prefetched
+        ? { code: 0, data: prefetched }
+        : await this.api.getTaskList(this.playerService.getPlayerId());
       Logger.debug("TaskService", "任务列表 API 数据:", result);
 
       if (result.code === 0) {
@@ -49,10 +52,10 @@ class TaskService {
     }
   }
 
-  async loadCurrentTasks() {
+  async loadCurrentTasks(prefetched = null) {
     try {
       Logger.info("TaskService", "开始加载当前任务");
-      const currentTasks = await this.getCurrentTasks();
+      const currentTasks = prefetched || await this.getCurrentTasks();
 
       if (currentTasks) {
         Logger.debug("TaskService", "当前任务加载完成:", currentTasks);
@@ -77,8 +77,9 @@ class WordcloudService {
 
     /**
      * 初始化词云图表
+     * @param {Array} [prefetched] 首屏数据中的词云勋章，未提供时单独请求
      */
-    async initWordCloud() {
+    async initWordCloud(prefetched = null) {
         Logger.info('开始初始化文字云');
         
         try {
@@ -93,7 +94,9 @@ class WordcloudService {
             this.wordCloudChart = echarts.init(container);
             
             // 从后端获取勋章数据
-            const response = await this.api.getWordCloud(this.playerService.getPlayerId());
+            const response = prefetched
+                ? { code: 0, data: prefetched }
+                : await this.api.getWordCloud(this.playerService.getPlayerId());
             if (response.code === 0 && response.data) {
                 // 转换数据格式
                 const wordCloudData = this.transformMedalsToWordCloudData(response.data);
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+主线任务奖励回归测试
+主线任务已完成后，其下可重复的子任务每次完成都会检查主线任务进度，主线任务不应再次变更状态或重复发放奖励。
+
+用法:
+    python test_main_quest_rewards.py
+    python -m pytest test_main_quest_rewards.py
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SCHEMA = '''
+CREATE TABLE player_data (
+    player_id INTEGER PRIMARY KEY, player_name TEXT, points INTEGER DEFAULT 0, experience INTEGER DEFAULT 0,
+    level INTEGER DEFAULT 1, wechat_userid TEXT, stamina INTEGER DEFAULT 100, create_time INTEGER,
+    english_name TEXT, password TEXT, isadmin INTEGER DEFAULT 0
+);
+CREATE TABLE task (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, description TEXT, task_chain_id INTEGER DEFAULT 0,
+    parent_task_id INTEGER DEFAULT 0, task_type TEXT, task_status TEXT DEFAULT 'AVAIL',
+    task_scope INTEGER DEFAULT 0, stamina_cost INTEGER DEFAULT 0, limit_time INTEGER DEFAULT 0,
+    repeat_time INTEGER DEFAULT 1, is_enabled INTEGER DEFAULT 1, repeatable INTEGER DEFAULT 0,
+    need_check INTEGER DEFAULT 0, task_rewards TEXT, icon TEXT, created_at TEXT
+);
+CREATE TABLE player_task (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, player_id INTEGER, task_id INTEGER, status TEXT, starttime INTEGER,
+    endtime INTEGER, submit_time INTEGER, complete_time INTEGER, comment TEXT, reject_reason TEXT, review_id TEXT
+);
+CREATE TABLE exp_record (id INTEGER PRIMARY KEY AUTOINCREMENT, player_id INTEGER, number INTEGER, addtime INTEGER, total INTEGER);
+CREATE TABLE points_record (id INTEGER PRIMARY KEY AUTOINCREMENT, player_id INTEGER, number INTEGER, addtime INTEGER, total INTEGER);
+CREATE TABLE player_game_card (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, player_id INTEGER, game_card_id INTEGER, number INTEGER,
+    timestamp INTEGER, UNIQUE(player_id, game_card_id)
+);
+CREATE TABLE player_medal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, player_id INTEGER, medal_id INTEGER, addtime INTEGER,
+    UNIQUE(player_id, medal_id)
+);
+'''
+
+PLAYER_ID = 1
+MAIN_QUEST_ID = 1
+DAILY_TASK_ID = 2
+MAIN_QUEST_POINTS = 1000
+DAILY_TASK_POINTS = 1
+
+
+def _rewards(points: int) -> str:
+    return json.dumps({'points_rewards': [{'type': 'points', 'number': points}],
+                       'card_rewards': [], 'medal_rewards': [], 'real_rewards': []})
+
+
+def _build_db() -> str:
+    """已完成的主线任务下挂一个可重复的日常子任务"""
+    path = os.path.join(tempfile.mkdtemp(), 'game.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute('INSERT INTO player_data (player_id, player_name) VALUES (?, ?)', (PLAYER_ID, 'player'))
+    conn.executemany('''
+        INSERT INTO task (id, name, description, parent_task_id, task_type, repeatable, repeat_time, task_rewards)
+        VALUES (?, ?, '', ?, ?, ?, ?, ?)
+    ''', [
+        (MAIN_QUEST_ID, '主线任务', 0, 'MAIN', 0, 1, _rewards(MAIN_QUEST_POINTS)),
+        (DAILY_TASK_ID, '日常子任务', MAIN_QUEST_ID, 'DAILY', 1, 10, _rewards(DAILY_TASK_POINTS)),
+    ])
+    now = int(time.time())
+    conn.execute('''
+        INSERT INTO player_task (player_id, task_id, status, starttime, endtime, complete_time)
+        VALUES (?, ?, 'COMPLETED', ?, 0, ?)
+    ''', (PLAYER_ID, MAIN_QUEST_ID, now, now))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _use_db(path: str):
+    from function.TaskService import task_service
+    from function.TaskCatalogService import task_catalog_service
+    from function.PlayerService import player_service
+    from function.PlayerTaskStateService import player_task_state_service
+    from function.TaskHierarchyService import task_hierarchy_service
+    for service in (task_service, task_catalog_service, player_service):
+        service.db_path = path
+    for service in (task_catalog_service, player_task_state_service, task_hierarchy_service):
+        service._schema_ready = False
+    task_catalog_service._snapshot = None
+    return task_service
+
+
+def _player_points(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT points FROM player_data WHERE player_id = ?', (PLAYER_ID,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_repeatable_child_does_not_repay_completed_main_quest():
+    """可重复的子任务多次完成，只发放子任务奖励，已完成的主线任务不再发放奖励"""
+    path = _build_db()
+    task_service = _use_db(path)
+
+    for times in range(1, 4):
+        result = task_service.accept_task(PLAYER_ID, DAILY_TASK_ID)
+        assert result['code'] == 0, result
+        result = task_service.complete_task_api(PLAYER_ID, DAILY_TASK_ID)
+        assert result['code'] == 0, result
+        assert result['data']['main_quests_completed'] == [], result
+        assert _player_points(path) == DAILY_TASK_POINTS * times
+
+
+if __name__ == '__main__':
+    test_repeatable_child_does_not_repay_completed_main_quest()
+    print("主线任务奖励回归测试通过")
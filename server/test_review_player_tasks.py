@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+批量审核回归测试
+approve_ids / reject_ids 不是整数列表时返回参数错误，不按字符串逐字符审核；
+任务已从任务目录删除的待审核任务保持待审核状态，计入 skipped，不发放奖励。
+
+用法:
+    python test_review_player_tasks.py
+    python -m pytest test_review_player_tasks.py
+"""
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.response_handler import StatusCode
+from test_main_quest_rewards import SCHEMA, PLAYER_ID, _use_db
+
+TASK_POINTS = 10
+MISSING_TASK_ID = 99
+
+
+def _build_db() -> str:
+    """玩家有 3 个待审核任务，其中第 3 个对应的任务已删除"""
+    path = os.path.join(tempfile.mkdtemp(), 'game.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute('INSERT INTO player_data (player_id, player_name) VALUES (?, ?)', (PLAYER_ID, 'player'))
+    rewards = json.dumps({'points_rewards': [{'type': 'points', 'number': TASK_POINTS}],
+                          'card_rewards': [], 'medal_rewards': [], 'real_rewards': []})
+    conn.executemany('''
+        INSERT INTO task (id, name, description, task_type, need_check, task_rewards)
+        VALUES (?, ?, '', 'BRANCH', 1, ?)
+    ''', [(1, '任务1', rewards), (2, '任务2', rewards)])
+    conn.executemany('''
+        INSERT INTO player_task (id, player_id, task_id, status, starttime) VALUES (?, ?, ?, 'CHECK', 0)
+    ''', [(1, PLAYER_ID, 1), (2, PLAYER_ID, 2), (3, PLAYER_ID, MISSING_TASK_ID)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _query(path: str, sql: str):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_ids_must_be_integer_lists():
+    """字符串、整数、含非整数元素的列表都返回参数错误，不改变任何任务"""
+    path = _build_db()
+    task_service = _use_db(path)
+
+    for approve_ids in ('123', 1, [1, '2'], [True], {'1': 1}):
+        result = task_service.review_player_tasks(approve_ids=approve_ids)
+        assert result['code'] == StatusCode.PARAM_ERROR, (approve_ids, result)
+    result = task_service.review_player_tasks(reject_ids='12')
+    assert result['code'] == StatusCode.PARAM_ERROR, result
+    assert _query(path, "SELECT COUNT(*) FROM player_task WHERE status = 'CHECK'") == [(3,)]
+
+
+def test_task_missing_from_catalog_is_skipped():
+    """任务已删除的待审核任务保持待审核，计入 skipped，其余任务正常通过并发放奖励"""
+    path = _build_db()
+    task_service = _use_db(path)
+
+    result = task_service.review_player_tasks(approve_ids=[1, 2, 3])
+    assert result['code'] == 0, result
+    assert [item['player_task_id'] for item in result['data']['approved']] == [1, 2]
+    assert result['data']['skipped'] == [3]
+    assert _query(path, 'SELECT id, status FROM player_task ORDER BY id') == [
+        (1, 'COMPLETED'), (2, 'COMPLETED'), (3, 'CHECK')
+    ]
+    assert _query(path, 'SELECT points FROM player_data') == [(TASK_POINTS * 2,)]
+
+
+if __name__ == '__main__':
+    test_ids_must_be_integer_lists()
+    test_task_missing_from_catalog_is_skipped()
+    print("批量审核回归测试通过")
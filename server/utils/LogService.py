@@ -2,18 +2,94 @@
 日志服务模块，负责初始化和管理应用日志
 """
 import os
+import glob
+import gzip
+import shutil
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from datetime import datetime, timedelta
 import json
 import uuid
+import time
+import random
 from functools import wraps
-from typing import Dict, List, Optional, Callable
+from typing import Dict, List, Optional, Callable, Tuple
+from collections import deque, defaultdict
+import threading
 from flask import request, jsonify
 from utils.response_handler import ResponseHandler, StatusCode
+from flask import g
+from config.config import REQUEST_LOG, ACCESS_LOG
 import logging.handlers
 import queue
 
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """按大小和日期轮转的文件处理器，轮转后的文件压缩为 .gz 归档"""
+
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0,
+                 rotate_daily: bool = True, encoding: str = 'utf-8'):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding)
+        self.rotate_daily = rotate_daily
+        self.rollover_at = self._next_midnight()
+
+    @staticmethod
+    def _next_midnight() -> float:
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+    def shouldRollover(self, record) -> int:
+        if self.rotate_daily and time.time() >= self.rollover_at:
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            # 归档名带时间戳和同秒序号，保证按文件名排序即按时间排序
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            suffix = 0
+            archive = f"{self.baseFilename}.{stamp}-{suffix:03d}.gz"
+            while os.path.exists(archive):
+                suffix += 1
+                archive = f"{self.baseFilename}.{stamp}-{suffix:03d}.gz"
+            with open(self.baseFilename, 'rb') as source, gzip.open(archive, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(self.baseFilename)
+
+            # 清理超出保留数量的归档
+            if self.backupCount > 0:
+                archives = sorted(glob.glob(f"{glob.escape(self.baseFilename)}.*.gz"))
+                for old_archive in archives[:-self.backupCount]:
+                    os.remove(old_archive)
+
+        self.rollover_at = self._next_midnight()
+        self.stream = self._open()
+
+
+class JsonLineFormatter(logging.Formatter):
+    """将字典日志消息格式化为单行JSON"""
+
+    def format(self, record) -> str:
+        if isinstance(record.msg, dict):
+            data = dict(record.msg)
+        else:
+            data = {'message': record.getMessage()}
+        data['time'] = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """直接入队原始日志记录，格式化工作由后台监听线程完成"""
+
+    def prepare(self, record):
+        return record
+
+
 class LogService:
     _instance = None
     
@@ -29,11 +105,53 @@ class LogService:
             
         self._initialized = True
         self.logger = None
-        self.request_logs = []  # 请求记录列表
         self.MAX_LOGS = 100    # 最多保存100条记录
+        self.PATH_INDEX_DEPTH = 2  # 路径前缀索引的最大层级，如 /api/tasks
+        # 环形缓冲区：序号 seq 对应槽位 seq % MAX_LOGS
+        self._log_buffer = [None] * self.MAX_LOGS
+        self._next_seq = 0    # 下一条记录的序号
+        self._start_seq = 0   # 最早的有效记录序号
+        # 二级索引：键 -> 按序号递增排列的 deque
+        self._method_index = defaultdict(deque)
+        self._path_index = defaultdict(deque)
+        self._status_index = defaultdict(deque)
+        self._log_lock = threading.Lock()
+        self._route_levels = {}  # 端点 -> 采集级别缓存
         self.websocket_service = None  # 将在init_websocket中设置
         self.sse_service = None  # 将在init_sse中设置
-        
+        self.access_logger = None  # 将在setup_access_log中设置
+        self._listeners = {}  # 名称 -> 后台日志写入线程
+        atexit.register(self.shutdown)
+
+    @staticmethod
+    def get_log_dir() -> str:
+        """获取日志目录，不存在时创建"""
+        log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        return log_dir
+
+    def _start_listener(self, name: str, *handlers) -> queue.Queue:
+        """启动后台写入线程，返回供请求线程写入的队列"""
+        old_listener = self._listeners.pop(name, None)
+        if old_listener:
+            old_listener.stop()
+
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        self._listeners[name] = listener
+        return log_queue
+
+    def shutdown(self) -> None:
+        """停止后台写入线程并刷新剩余日志"""
+        for listener in self._listeners.values():
+            try:
+                listener.stop()
+            except Exception:
+                pass
+        self._listeners.clear()
+
     def setup_logging(self, debug_mode: bool = False) -> logging.Logger:
         """配置日志系统
         
@@ -44,9 +162,7 @@ class LogService:
             logging.Logger: 配置好的日志记录器
         """
         # 创建日志目录
-        log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+        log_dir = self.get_log_dir()
             
         # 设置日志文件名
         log_file = os.path.join(log_dir, f'{datetime.now().strftime("%Y-%m-%d")}.log')
@@ -81,19 +197,69 @@ class LogService:
         # 清除现有的处理器
         logger.handlers = []
         
-        # 使用内存队列处理日志
-        memory_handler = logging.handlers.QueueHandler(queue.Queue(-1))
-        logger.addHandler(memory_handler)
-        
-        # 添加处理器
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        # 请求线程只负责入队，文件和控制台输出由后台线程完成
+        log_queue = self._start_listener('app', file_handler, console_handler)
+        logger.addHandler(QueueHandler(log_queue))
         
         # 保存logger实例
         self.logger = logger
         
         return logger
         
+    def setup_access_log(self) -> Optional[logging.Logger]:
+        """配置结构化访问日志（JSONL），由后台线程写入并按大小/日期轮转压缩"""
+        if not ACCESS_LOG.get('enabled'):
+            return None
+
+        handler = CompressedRotatingFileHandler(
+            os.path.join(self.get_log_dir(), ACCESS_LOG.get('filename', 'access.jsonl')),
+            maxBytes=ACCESS_LOG.get('max_bytes', 0),
+            backupCount=ACCESS_LOG.get('backup_count', 0),
+            rotate_daily=ACCESS_LOG.get('rotate_daily', True)
+        )
+        handler.setFormatter(JsonLineFormatter())
+
+        access_logger = logging.getLogger(f'{__name__}.access')
+        access_logger.setLevel(logging.INFO)
+        access_logger.propagate = False
+        access_logger.handlers = [DeferredQueueHandler(self._start_listener('access', handler))]
+
+        self.access_logger = access_logger
+        return access_logger
+
+    def init_access_log(self, app) -> None:
+        """为应用注册访问日志钩子"""
+        if self.setup_access_log() is None:
+            return
+
+        exclude_prefixes = tuple(ACCESS_LOG.get('exclude_prefixes') or ())
+
+        @app.before_request
+        def access_log_start():
+            g.access_log_start = time.time()
+
+        @app.after_request
+        def access_log_write(response):
+            if not request.path.startswith(exclude_prefixes):
+                self.write_access_log(request, response)
+            return response
+
+    def write_access_log(self, req, response) -> None:
+        """写入一条访问日志，序列化和落盘在后台线程完成"""
+        if self.access_logger is None:
+            return
+        started = g.get('access_log_start')
+        self.access_logger.info({
+            'ts': started,
+            'method': req.method,
+            'path': req.path,
+            'route': req.url_rule.rule if req.url_rule else None,
+            'status': response.status_code,
+            'duration_ms': round((time.time() - started) * 1000, 2) if started else None,
+            'size': response.content_length,
+            'remote_addr': req.remote_addr
+        })
+
     def init_app(self, app):
         """初始化应用日志"""
         # 添加处理器到应用
@@ -132,27 +298,148 @@ class LogService:
         """初始化SSE服务"""
         self.sse_service = sse_service
             
-    def add_request_log(self, log_entry: Dict) -> None:
-        """添加新的请求记录"""
-        self.request_logs.insert(0, log_entry)
-        if len(self.request_logs) > self.MAX_LOGS:
-            self.request_logs.pop()
-            
-    def get_request_logs(self, method_filter: str = None, path_filter: str = None) -> List[Dict]:
-        """获取请求记录"""
-        filtered_logs = self.request_logs
-        
+    def _path_prefixes(self, path: str) -> List[str]:
+        """获取路径的前缀索引键，如 /api/tasks/1 -> ['/api', '/api/tasks']"""
+        segments = [seg for seg in path.split('/') if seg][:self.PATH_INDEX_DEPTH]
+        return ['/' + '/'.join(segments[:i + 1]) for i in range(len(segments))]
+
+    def _index_keys(self, entry: Dict) -> List[Tuple[Dict, str]]:
+        """获取日志条目对应的所有索引位置"""
+        keys = [(self._method_index, entry.get('method'))]
+        keys.extend((self._path_index, prefix) for prefix in self._path_prefixes(entry.get('path', '')))
+        status_code = (entry.get('response') or {}).get('status_code')
+        if status_code is not None:
+            keys.append((self._status_index, int(status_code)))
+        return keys
+
+    def _lookup_path_key(self, path_filter: str) -> Optional[str]:
+        """获取路径过滤条件可用的最长前缀索引键，只使用以 / 结尾的完整路径段"""
+        segments = path_filter.split('/')[1:-1]
+        segments = [seg for seg in segments if seg][:self.PATH_INDEX_DEPTH]
+        if not segments:
+            return None
+        return '/' + '/'.join(segments)
+
+    def add_request_log(self, log_entry: Dict) -> int:
+        """添加新的请求记录
+
+        Returns:
+            int: 记录序号，可作为分页游标
+        """
+        with self._log_lock:
+            seq = self._next_seq
+            self._next_seq += 1
+
+            # 缓冲区已满时淘汰最早的记录，其序号必然位于各索引 deque 的最左侧
+            if seq - self._start_seq >= self.MAX_LOGS:
+                evicted = self._log_buffer[self._start_seq % self.MAX_LOGS]
+                if evicted is not None:
+                    for index, key in self._index_keys(evicted):
+                        bucket = index.get(key)
+                        if bucket and bucket[0] == self._start_seq:
+                            bucket.popleft()
+                            if not bucket:
+                                del index[key]
+                self._start_seq += 1
+
+            self._log_buffer[seq % self.MAX_LOGS] = log_entry
+            for index, key in self._index_keys(log_entry):
+                index[key].append(seq)
+            return seq
+
+    def _iter_logs(self, method_filter: str = None, path_filter: str = None,
+                   status_filter: int = None, cursor: int = None):
+        """按从新到旧的顺序遍历符合条件的记录，产出 (seq, entry)
+
+        调用方需持有 _log_lock
+        """
+        # 选择最小的索引候选集，其余条件逐条校验
+        candidates = None
         if method_filter:
-            filtered_logs = [log for log in filtered_logs if log['method'] == method_filter.upper()]
-        if path_filter:
-            filtered_logs = [log for log in filtered_logs if path_filter in log['path']]
-            
-        return filtered_logs
-        
+            candidates = self._method_index.get(method_filter.upper(), ())
+        if status_filter is not None:
+            bucket = self._status_index.get(int(status_filter), ())
+            if candidates is None or len(bucket) < len(candidates):
+                candidates = bucket
+        if path_filter and path_filter.startswith('/'):
+            path_key = self._lookup_path_key(path_filter)
+            if path_key is not None:
+                bucket = self._path_index.get(path_key, ())
+                if candidates is None or len(bucket) < len(candidates):
+                    candidates = bucket
+        if candidates is None:
+            candidates = range(self._next_seq - 1, self._start_seq - 1, -1)
+        else:
+            candidates = reversed(candidates)
+
+        for seq in candidates:
+            if cursor is not None and seq >= cursor:
+                continue
+            if seq < self._start_seq:
+                break
+            entry = self._log_buffer[seq % self.MAX_LOGS]
+            if entry is None:
+                continue
+            if method_filter and entry['method'] != method_filter.upper():
+                continue
+            if status_filter is not None and (entry.get('response') or {}).get('status_code') != int(status_filter):
+                continue
+            if path_filter:
+                # 以 / 开头按前缀匹配（可走索引），否则按子串匹配
+                if path_filter.startswith('/'):
+                    if not entry['path'].startswith(path_filter):
+                        continue
+                elif path_filter not in entry['path']:
+                    continue
+            yield seq, entry
+
+    def get_request_logs(self, method_filter: str = None, path_filter: str = None,
+                         status_filter: int = None) -> List[Dict]:
+        """获取请求记录（从新到旧）"""
+        with self._log_lock:
+            return [self._materialize(entry) for _, entry in self._iter_logs(method_filter, path_filter, status_filter)]
+
+    def get_request_logs_page(self, method_filter: str = None, path_filter: str = None,
+                              status_filter: int = None, cursor: int = None,
+                              limit: int = 20) -> Dict:
+        """按游标分页获取请求记录
+
+        Args:
+            method_filter: 请求方法
+            path_filter: 路径过滤，以 / 开头时按前缀匹配
+            status_filter: 响应状态码
+            cursor: 上一页返回的 next_cursor，为空时从最新记录开始
+            limit: 每页数量
+
+        Returns:
+            Dict: {'logs': [...], 'next_cursor': int或None}
+        """
+        logs = []
+        last_seq = None
+        next_cursor = None
+        with self._log_lock:
+            for seq, entry in self._iter_logs(method_filter, path_filter, status_filter, cursor):
+                if len(logs) >= limit:
+                    next_cursor = last_seq
+                    break
+                logs.append(self._materialize(entry))
+                last_seq = seq
+        return {'logs': logs, 'next_cursor': next_cursor}
+
+    @property
+    def request_logs(self) -> List[Dict]:
+        """全部请求记录（从新到旧）"""
+        return self.get_request_logs()
+
     def clear_logs(self) -> None:
         """清除所有请求记录"""
-        self.request_logs = []
-        
+        with self._log_lock:
+            self._log_buffer = [None] * self.MAX_LOGS
+            self._start_seq = self._next_seq
+            self._method_index.clear()
+            self._path_index.clear()
+            self._status_index.clear()
+
     def format_log_entry(self, entry: Dict) -> str:
         """格式化日志条目为HTML"""
         return f"""
@@ -167,151 +454,179 @@ class LogService:
             </div>
         """
 
-    def log_request(self, f: Callable) -> Callable:
-        """请求日志记录装饰器"""
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            # 获取请求信息
-            log_entry = {
-                'id': str(uuid.uuid4()),
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'method': request.method,
-                'path': request.path,
-                'args': dict(request.args),
-                'form': dict(request.form),
-                'headers': {k: v for k, v in request.headers.items()},
-                'remote_addr': request.remote_addr,
-                'request_data': None
-            }
-            
-            # 安全获取JSON数据，避免空请求体导致的异常
-            if request.is_json:
+    def _get_capture_level(self) -> str:
+        """获取当前请求的日志采集级别，按端点缓存路由覆盖结果"""
+        routes = REQUEST_LOG.get('routes') or {}
+        if not routes:
+            return REQUEST_LOG.get('level', 'metadata')
+
+        endpoint = request.endpoint
+        level = self._route_levels.get(endpoint)
+        if level is None:
+            rule = request.url_rule.rule if request.url_rule else request.path
+            matched = [prefix for prefix in routes if rule.startswith(prefix)]
+            if matched:
+                level = routes[max(matched, key=len)]
+            else:
+                level = REQUEST_LOG.get('level', 'metadata')
+            self._route_levels[endpoint] = level
+        return level
+
+    def _should_capture_full(self, level: str, is_error: bool) -> bool:
+        """判断是否需要完整采集请求和响应内容"""
+        if level == 'full':
+            return True
+        if level == 'errors':
+            return is_error
+        if level == 'sampled':
+            return is_error or random.random() < REQUEST_LOG.get('sample_rate', 0)
+        return False
+
+    def _materialize(self, entry: Dict) -> Dict:
+        """展开延迟采集的字段，只在读取日志时执行
+
+        调用方需持有 _log_lock
+        """
+        deferred = entry.pop('_deferred', None)
+        if deferred:
+            for resolve in deferred:
                 try:
-                    log_entry['request_data'] = request.get_json()
-                except Exception:
-                    # 如果获取JSON失败，不记录request_data
-                    pass
+                    resolve(entry)
+                except Exception as e:
+                    entry.setdefault('capture_error', str(e))
+        return entry
 
+    @staticmethod
+    def _extract_response_data(response_data, path: str):
+        """从响应对象中提取可记录的数据，不读取流式响应"""
+        if '/api/sse' in path or (hasattr(response_data, 'mimetype') and response_data.mimetype == 'text/event-stream'):
+            return {
+                'type': 'sse_response',
+                'mimetype': 'text/event-stream'
+            }
+        mimetype = response_data.mimetype if hasattr(response_data, 'mimetype') else 'unknown'
+        if getattr(response_data, 'direct_passthrough', False) or getattr(response_data, 'is_streamed', False):
+            return {
+                'type': 'streaming_response',
+                'mimetype': mimetype
+            }
+        # 已序列化的响应保存了原始数据，不再解析响应内容
+        payload = getattr(response_data, 'json_payload', None)
+        if payload is not None:
+            return payload
+        if hasattr(response_data, 'get_json'):
             try:
-                response = f(*args, **kwargs)
-                
-                # 检查是否为静态文件响应
-                if request.path.startswith('/static/'):
-                    log_entry['response'] = {
-                        'status_code': 200,
-                        'data': {
-                            'type': 'static_file',
-                            'path': request.path
-                        }
-                    }
-                    self.add_request_log(log_entry)
-                    
-                    # 记录日志后立即返回，不再执行后续代码
-                    return response
-                
-                # 检查是否为SSE响应 - 这是修复SSE连接延迟的关键
-                if '/api/sse' in request.path:
-                    # 特殊处理SSE响应，避免阻塞
-                    log_entry['response'] = {
-                        'status_code': 200,
-                        'data': {
-                            'type': 'sse_response',
-                            'message': 'SSE连接已建立'
-                        }
-                    }
-                    self.add_request_log(log_entry)
-                    
-                    # 立即返回响应，不执行任何后续代码
-                    # 这是修复SSE连接延迟的核心：直接返回，不等待其他处理
-                    return response
-                    
-                # 处理其他类型的响应
-                if isinstance(response, tuple):
-                    response_data, status_code = response
-                else:
-                    response_data = response
-                    status_code = 200
-
-                # 处理Response对象
-                if hasattr(response_data, 'mimetype') and response_data.mimetype == 'text/event-stream':
-                    # 明确处理SSE响应，避免读取流
-                    response_data = {
-                        'type': 'sse_response',
-                        'mimetype': 'text/event-stream'
-                    }
-                elif hasattr(response_data, 'get_json'):
-                    try:
-                        # 检查是否为SSE响应的另一种方式（通过路径）
-                        if '/api/sse' in request.path:
-                            response_data = {
-                                'type': 'sse_response',
-                                'mimetype': response_data.mimetype if hasattr(response_data, 'mimetype') else 'unknown'
-                            }
-                        else:
-                            response_data = response_data.get_json()
-                    except:
-                        response_data = {
-                            'type': 'non_json_response',
-                            'mimetype': response_data.mimetype if hasattr(response_data, 'mimetype') else 'unknown'
-                        }
-                elif hasattr(response_data, 'response'):
-                    try:
-                        # 检查是否为流式响应
-                        if callable(response_data.response):
-                            # 流式响应，不尝试读取内容
-                            response_data = {
-                                'type': 'streaming_response',
-                                'mimetype': response_data.mimetype if hasattr(response_data, 'mimetype') else 'unknown'
-                            }
-                        elif hasattr(response_data.response, '__iter__') and not isinstance(response_data.response, list):
-                            # 迭代器响应，不尝试读取内容
-                            response_data = {
-                                'type': 'iterator_response',
-                                'mimetype': response_data.mimetype if hasattr(response_data, 'mimetype') else 'unknown'
-                            }
-                        elif isinstance(response_data.response, list) and response_data.response:
-                            # 列表响应，尝试读取第一个元素
-                            response_data = response_data.response[0].decode('utf-8')
-                            response_data = json.loads(response_data)
-                        else:
-                            response_data = str(response_data.response)
-                    except:
-                        response_data = {
-                            'type': 'non_json_response',
-                            'mimetype': response_data.mimetype if hasattr(response_data, 'mimetype') else 'unknown'
-                        }
-
-                log_entry['response'] = {
-                    'status_code': status_code,
-                    'data': response_data
+                data = response_data.get_json(silent=True)
+                if data is not None:
+                    return data
+                return response_data.get_data(as_text=True)
+            except Exception:
+                return {
+                    'type': 'non_json_response',
+                    'mimetype': mimetype
                 }
+        if isinstance(response_data, (dict, list, str)):
+            return response_data
+        return str(response_data)
 
+    def log_request(self, f: Callable) -> Callable:
+        """请求日志记录装饰器
+
+        采集级别由 config.REQUEST_LOG 控制。元数据在请求中同步记录，
+        请求头、参数、请求体和响应内容只保留引用，在读取日志时才序列化。
+        任何级别下视图抛出的异常都转换为 500 错误响应，off 只跳过请求日志。
+        """
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            level = self._get_capture_level()
+            started = time.time()
+            error = None
+            try:
+                response = f(*args, **kwargs)
             except Exception as e:
                 self.logger.error(f"请求处理失败: {str(e)}", exc_info=True)
-                log_entry['response'] = {
-                    'error': str(e),
-                    'status_code': 500
-                }
+                error = str(e)
                 response = jsonify(ResponseHandler.error(
                     code=StatusCode.SERVER_ERROR,
                     msg=f"服务器错误: {str(e)}"
                 )), 500
-            else:
-                # 只有非SSE响应才执行后续处理
-                if '/api/sse' not in request.path:
-                    # 记录请求日志 - 仅对非SSE响应执行
-                    self.add_request_log(log_entry)
-
-                    # 通过SSE广播日志更新 - 仅对非SSE响应执行
-                    if self.sse_service and hasattr(self.sse_service, 'broadcast_log_update'):
-                        self.sse_service.broadcast_log_update(
-                            self.get_request_logs(),
-                            log_entry
-                        )
+
+            if level == 'off':
+                return response
+
+            # 解析状态码，不读取响应内容
+            response_data = response
+            status_code = 200
+            if isinstance(response, tuple):
+                response_data = response[0]
+                if len(response) > 1 and isinstance(response[1], int):
+                    status_code = response[1]
+            elif hasattr(response, 'status_code'):
+                status_code = response.status_code
+
+            # api_response/jsonify 生成的响应带有原始数据，直接读取业务码
+            payload = getattr(response_data, 'json_payload', response_data)
+            is_error = error is not None or status_code >= 400 or (
+                isinstance(payload, dict) and payload.get('code', 0) != 0
+            )
+
+            path = request.path
+            log_entry = {
+                'method': request.method,
+                'path': path,
+                'remote_addr': request.remote_addr,
+                'duration_ms': round((time.time() - started) * 1000, 2),
+                'response': {'status_code': status_code},
+                '_deferred': [self._make_metadata_resolver(started)]
+            }
+            if error is not None:
+                log_entry['response']['error'] = error
+
+            if self._should_capture_full(level, is_error):
+                log_entry['_deferred'].append(self._make_request_resolver())
+                if '/api/sse' not in path and not path.startswith('/static/'):
+                    log_entry['_deferred'].append(self._make_response_resolver(response_data, path))
+
+            self.add_request_log(log_entry)
+
+            # 通过SSE广播日志更新 - 仅发送新增条目，SSE请求本身不广播
+            if '/api/sse' not in path and self.sse_service and hasattr(self.sse_service, 'broadcast_log_update'):
+                with self._log_lock:
+                    self._materialize(log_entry)
+                self.sse_service.broadcast_log_update(log_entry)
 
             return response
 
         return decorated_function
 
+    @staticmethod
+    def _make_metadata_resolver(started: float) -> Callable:
+        """延迟生成日志ID和格式化时间"""
+        def resolve(entry: Dict) -> None:
+            entry['id'] = str(uuid.uuid4())
+            entry['timestamp'] = datetime.fromtimestamp(started).strftime('%Y-%m-%d %H:%M:%S')
+        return resolve
+
+    @staticmethod
+    def _make_request_resolver() -> Callable:
+        """保存请求对象的引用，读取日志时再复制为字典"""
+        args = request.args
+        form = request.form
+        headers = request.headers
+        request_data = request.get_json(silent=True) if request.is_json else None
+
+        def resolve(entry: Dict) -> None:
+            entry['args'] = dict(args)
+            entry['form'] = dict(form)
+            entry['headers'] = {k: v for k, v in headers.items()}
+            entry['request_data'] = request_data
+        return resolve
+
+    def _make_response_resolver(self, response_data, path: str) -> Callable:
+        """保存响应对象的引用，读取日志时再解析响应内容"""
+        def resolve(entry: Dict) -> None:
+            entry['response']['data'] = self._extract_response_data(response_data, path)
+        return resolve
+
 # 创建日志服务实例
 log_service = LogService()
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+请求指标服务
+按路由记录延迟直方图、状态码计数、并发请求数和数据库耗时，
+通过 Prometheus 文本格式的 /metrics 接口输出
+"""
+import math
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+from flask import g, request, has_request_context, make_response
+
+from config.config import METRICS
+from utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """HDR风格的对数-线性分桶直方图（单位：秒）
+
+    每个2的幂区间再等分为 SUB_BUCKETS 个子桶，相对误差约 1/SUB_BUCKETS。
+    桶下标由 math.frexp 直接算出，记录一次耗时为 O(1)。
+    """
+    SUB_BUCKETS = 4
+    MIN_EXP = -13   # 最小桶上界约 0.07 毫秒
+    MAX_EXP = 7     # 最大桶上界 64 秒，超出计入 +Inf
+
+    BOUNDS: List[float] = []  # 各桶上界，类定义后计算
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)  # 最后一个为 +Inf 桶
+        self.sum = 0.0
+        self.count = 0
+
+    @classmethod
+    def bucket_index(cls, value: float) -> int:
+        if value <= 0:
+            return 0
+        mantissa, exp = math.frexp(value)  # value = mantissa * 2**exp, mantissa ∈ [0.5, 1)
+        if exp < cls.MIN_EXP:
+            return 0
+        if exp >= cls.MAX_EXP:
+            return len(cls.BOUNDS)
+        sub = int((mantissa * 2 - 1) * cls.SUB_BUCKETS)
+        return (exp - cls.MIN_EXP) * cls.SUB_BUCKETS + sub
+
+    def observe(self, value: float) -> None:
+        self.counts[self.bucket_index(value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+LatencyHistogram.BOUNDS = [
+    2.0 ** (exp - 1) * (1 + (sub + 1) / LatencyHistogram.SUB_BUCKETS)
+    for exp in range(LatencyHistogram.MIN_EXP, LatencyHistogram.MAX_EXP)
+    for sub in range(LatencyHistogram.SUB_BUCKETS)
+]
+
+
+class MetricsService:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MetricsService, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self._initialized = True
+        self._lock = threading.Lock()
+        # (method, route) -> 直方图
+        self._latency: Dict[Tuple[str, str], LatencyHistogram] = defaultdict(LatencyHistogram)
+        self._db_latency: Dict[Tuple[str, str], LatencyHistogram] = defaultdict(LatencyHistogram)
+        # (method, route) -> 数据库语句数
+        self._db_queries: Dict[Tuple[str, str], int] = defaultdict(int)
+        # (method, route, status) -> 请求数
+        self._status_counts: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        # (method, route) -> 当前处理中的请求数
+        self._in_flight: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.sse_service = None  # 将在init_sse中设置
+        # 缓存名 -> 返回命中统计的函数
+        self._cache_providers: Dict[str, Callable[[], Dict]] = {}
+        self.started_at = time.time()
+
+    def init_sse(self, sse_service) -> None:
+        """设置SSE服务，用于输出连接数"""
+        self.sse_service = sse_service
+
+    def add_cache(self, name: str, provider: Callable[[], Dict]) -> None:
+        """注册缓存命中统计，provider 返回包含 hits/misses/entries 的字典"""
+        self._cache_providers[name] = provider
+
+    def init_app(self, app) -> None:
+        """注册请求钩子和指标接口"""
+        if not METRICS.get('enabled'):
+            return
+
+        db_connection.add_statement_listener(self._on_statement)
+
+        @app.before_request
+        def metrics_start():
+            key = (request.method, request.url_rule.rule if request.url_rule else '<unmatched>')
+            g.metrics_key = key
+            g.metrics_start = time.perf_counter()
+            g.metrics_db_time = 0.0
+            g.metrics_db_count = 0
+            with self._lock:
+                self._in_flight[key] += 1
+
+        @app.after_request
+        def metrics_status(response):
+            g.metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def metrics_finish(exc):
+            # teardown 在异常和被拦截的请求中同样执行，保证并发数能回落
+            started = g.pop('metrics_start', None)
+            if started is None:
+                return
+            self.record_request(
+                g.metrics_key,
+                g.get('metrics_status', 500),
+                time.perf_counter() - started,
+                g.metrics_db_time,
+                g.metrics_db_count
+            )
+
+        app.add_url_rule(METRICS.get('path', '/metrics'), 'metrics', self.metrics_view)
+
+    @staticmethod
+    def _on_statement(conn, sql, params, elapsed: float) -> None:
+        """数据库语句监听器，累计到当前请求"""
+        if has_request_context() and 'metrics_db_time' in g:
+            g.metrics_db_time += elapsed
+            g.metrics_db_count += 1
+
+    def record_request(self, key: Tuple[str, str], status: int, duration: float,
+                       db_time: float = 0.0, db_count: int = 0) -> None:
+        """记录一次请求的指标"""
+        with self._lock:
+            self._in_flight[key] -= 1
+            self._latency[key].observe(duration)
+            self._status_counts[key + (status,)] += 1
+            if db_count:
+                self._db_latency[key].observe(db_time)
+                self._db_queries[key] += db_count
+
+    def metrics_view(self):
+        """Prometheus 指标接口"""
+        allowed_ips = METRICS.get('allowed_ips')
+        if allowed_ips and request.remote_addr not in allowed_ips:
+            return make_response('Forbidden', 403)
+
+        response = make_response(self.render())
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        return response
+
+    @staticmethod
+    def _labels(method: str, route: str, **extra) -> str:
+        route = route.replace('\\', '\\\\').replace('"', '\\"')
+        labels = f'method="{method}",route="{route}"'
+        for name, value in extra.items():
+            labels += f',{name}="{value}"'
+        return labels
+
+    def _render_histogram(self, lines: List[str], name: str, histograms) -> None:
+        bounds = [f'{bound:.6g}' for bound in LatencyHistogram.BOUNDS] + ['+Inf']
+        for (method, route), hist in histograms:
+            labels = self._labels(method, route)
+            cumulative = 0
+            for le, bucket_count in zip(bounds, hist.counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {hist.sum:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {hist.count}')
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式的指标"""
+        # 加锁期间只做浅拷贝，格式化在锁外完成
+        with self._lock:
+            latency = [(key, self._copy_histogram(hist)) for key, hist in self._latency.items()]
+            db_latency = [(key, self._copy_histogram(hist)) for key, hist in self._db_latency.items()]
+            db_queries = list(self._db_queries.items())
+            status_counts = list(self._status_counts.items())
+            in_flight = list(self._in_flight.items())
+
+        lines = []
+        lines.append('# HELP http_request_duration_seconds 请求处理耗时')
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        self._render_histogram(lines, 'http_request_duration_seconds', latency)
+
+        lines.append('# HELP http_requests_total 按状态码统计的请求数')
+        lines.append('# TYPE http_requests_total counter')
+        for (method, route, status), count in status_counts:
+            lines.append(f'http_requests_total{{{self._labels(method, route, status=status)}}} {count}')
+
+        lines.append('# HELP http_requests_in_flight 正在处理的请求数')
+        lines.append('# TYPE http_requests_in_flight gauge')
+        for (method, route), count in in_flight:
+            lines.append(f'http_requests_in_flight{{{self._labels(method, route)}}} {count}')
+
+        lines.append('# HELP http_request_db_seconds 单个请求内数据库语句总耗时')
+        lines.append('# TYPE http_request_db_seconds histogram')
+        self._render_histogram(lines, 'http_request_db_seconds', db_latency)
+
+        lines.append('# HELP http_request_db_queries_total 数据库语句执行数')
+        lines.append('# TYPE http_request_db_queries_total counter')
+        for (method, route), count in db_queries:
+            lines.append(f'http_request_db_queries_total{{{self._labels(method, route)}}} {count}')
+
+        if self.sse_service:
+            lines.append('# HELP sse_connections 当前SSE连接数')
+            lines.append('# TYPE sse_connections gauge')
+            lines.append(f'sse_connections {self.sse_service.get_connection_count()}')
+            lines.append('# HELP sse_connected_players 当前建立SSE连接的玩家数')
+            lines.append('# TYPE sse_connected_players gauge')
+            with self.sse_service.connection_lock:
+                players = sum(1 for conns in self.sse_service.connections.values() if conns)
+            lines.append(f'sse_connected_players {players}')
+
+        if self._cache_providers:
+            caches = []
+            for name, provider in self._cache_providers.items():
+                try:
+                    caches.append((name, provider()))
+                except Exception:
+                    continue
+            for metric, field, metric_type, help_text in (
+                ('cache_hits_total', 'hits', 'counter', '缓存命中次数'),
+                ('cache_misses_total', 'misses', 'counter', '缓存未命中次数'),
+                ('cache_entries', 'entries', 'gauge', '缓存条目数'),
+            ):
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} {metric_type}')
+                for name, stats in caches:
+                    lines.append(f'{metric}{{cache="{name}"}} {stats.get(field, 0)}')
+
+        lines.append('# HELP process_uptime_seconds 服务运行时长')
+        lines.append('# TYPE process_uptime_seconds gauge')
+        lines.append(f'process_uptime_seconds {time.time() - self.started_at:.0f}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _copy_histogram(hist: LatencyHistogram) -> LatencyHistogram:
+        copy = LatencyHistogram()
+        copy.counts = list(hist.counts)
+        copy.sum = hist.sum
+        copy.count = hist.count
+        return copy
+
+
+# 创建全局实例
+metrics_service = MetricsService()
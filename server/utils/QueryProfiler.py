@@ -0,0 +1,218 @@
+"""
+数据库查询分析服务
+统计单个请求（或后台任务）内每条语句的次数和耗时，识别重复执行的同形语句（N+1），
+慢语句附带 EXPLAIN QUERY PLAN 输出到日志。
+
+请求携带 DB_PROFILER['header'] 请求头时开启，响应中返回统计头:
+    X-DB-Query-Count / X-DB-Query-Time / X-DB-N-Plus-One
+"""
+import re
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Optional
+
+from flask import request
+
+from config.config import DB_PROFILER
+from utils import db_connection
+
+logger = logging.getLogger(__name__)
+
+# 语句归一化：字面量替换为 ?，IN 列表折叠，空白压缩
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT|REPLACE|WITH)\b', re.IGNORECASE)
+
+
+class QueryProfile:
+    """单次请求或任务的语句统计"""
+    __slots__ = ('name', 'started', 'count', 'total_time', 'shapes', 'slow', 'explained')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes: Dict[str, List] = {}  # 语句形状 -> [次数, 总耗时]
+        self.slow: List[Dict] = []
+        self.explained = set()  # 已获取过查询计划的语句形状
+
+    def n_plus_one(self, threshold: int) -> List[Dict]:
+        """返回执行次数达到阈值的语句形状，按次数降序"""
+        repeated = [
+            {'sql': shape, 'count': stat[0], 'time_ms': round(stat[1] * 1000, 2)}
+            for shape, stat in self.shapes.items()
+            if stat[0] >= threshold
+        ]
+        repeated.sort(key=lambda item: item['count'], reverse=True)
+        return repeated
+
+    def summary(self, threshold: int) -> Dict:
+        return {
+            'name': self.name,
+            'query_count': self.count,
+            'query_time_ms': round(self.total_time * 1000, 2),
+            'elapsed_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'n_plus_one': self.n_plus_one(threshold),
+            'slow': self.slow
+        }
+
+
+class QueryProfiler:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(QueryProfiler, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self._initialized = True
+        self._local = threading.local()  # 当前线程/协程正在进行的分析
+        self._shape_cache: Dict[str, str] = {}
+        self.SHAPE_CACHE_SIZE = 1024
+        self.slow_seconds = DB_PROFILER.get('slow_ms', 100) / 1000
+        self.n_plus_one_threshold = DB_PROFILER.get('n_plus_one_threshold', 5)
+        if DB_PROFILER.get('enabled'):
+            db_connection.add_statement_listener(self._on_statement)
+
+    def init_app(self, app) -> None:
+        """注册请求钩子"""
+        if not DB_PROFILER.get('enabled'):
+            return
+
+        header = DB_PROFILER.get('header', 'X-Debug-DB-Profile')
+        always_on = DB_PROFILER.get('always_on', False)
+
+        @app.before_request
+        def db_profile_start():
+            if always_on or request.headers.get(header) == '1':
+                self._local.profile = QueryProfile(f'{request.method} {request.path}')
+
+        @app.after_request
+        def db_profile_finish(response):
+            profile = self._finish()
+            if profile is not None:
+                summary = self._report(profile)
+                response.headers['X-DB-Query-Count'] = str(summary['query_count'])
+                response.headers['X-DB-Query-Time'] = f"{summary['query_time_ms']}ms"
+                response.headers['X-DB-N-Plus-One'] = str(len(summary['n_plus_one']))
+            return response
+
+        @app.teardown_request
+        def db_profile_cleanup(exc):
+            # 请求异常时 after_request 可能未执行，确保不遗留到下一个请求
+            self._local.profile = None
+
+    @contextmanager
+    def profile(self, name: str):
+        """在请求之外（如定时任务）分析一段代码的数据库访问"""
+        previous = getattr(self._local, 'profile', None)
+        self._local.profile = QueryProfile(name)
+        try:
+            yield self._local.profile
+        finally:
+            profile = self._finish()
+            self._local.profile = previous
+            if profile is not None:
+                self._report(profile)
+
+    def profiled(self, name: str):
+        """装饰器：DB_PROFILER['background_jobs'] 开启时分析被装饰函数"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not (DB_PROFILER.get('enabled') and DB_PROFILER.get('background_jobs')):
+                    return func(*args, **kwargs)
+                with self.profile(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self) -> Optional[QueryProfile]:
+        profile = getattr(self._local, 'profile', None)
+        self._local.profile = None
+        return profile
+
+    def normalize(self, sql: str) -> str:
+        """将语句归一化为形状，用于识别重复执行"""
+        shape = self._shape_cache.get(sql)
+        if shape is None:
+            shape = _STRING_LITERAL.sub('?', sql)
+            shape = _NUMBER_LITERAL.sub('?', shape)
+            shape = _IN_LIST.sub('IN (?)', shape)
+            shape = _WHITESPACE.sub(' ', shape).strip()
+            if len(self._shape_cache) >= self.SHAPE_CACHE_SIZE:
+                self._shape_cache.clear()
+            self._shape_cache[sql] = shape
+        return shape
+
+    def _on_statement(self, conn, sql, params, elapsed: float) -> None:
+        """数据库语句监听器"""
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return
+
+        shape = self.normalize(sql)
+        profile.count += 1
+        profile.total_time += elapsed
+        stat = profile.shapes.get(shape)
+        if stat is None:
+            profile.shapes[shape] = [1, elapsed]
+        else:
+            stat[0] += 1
+            stat[1] += elapsed
+
+        if elapsed >= self.slow_seconds:
+            # 同形语句只获取一次查询计划
+            plan = None
+            if DB_PROFILER.get('explain_slow', True) and shape not in profile.explained:
+                profile.explained.add(shape)
+                plan = self.explain(conn, sql, params)
+            profile.slow.append({'sql': shape, 'time_ms': round(elapsed * 1000, 2), 'plan': plan})
+
+    @staticmethod
+    def explain(conn, sql: str, params) -> Optional[List[str]]:
+        """获取语句的查询计划，使用原生游标避免再次触发监听器"""
+        if params is None or not _EXPLAINABLE.match(sql):
+            return None
+        try:
+            cursor = sqlite3.Cursor(conn)
+            cursor.row_factory = None
+            sqlite3.Cursor.execute(cursor, f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            return [f'EXPLAIN失败: {str(e)}']
+
+    def _report(self, profile: QueryProfile) -> Dict:
+        """输出分析结果到日志"""
+        summary = profile.summary(self.n_plus_one_threshold)
+        logger.info(
+            f"[DB Profile] {summary['name']}: {summary['query_count']}条语句, "
+            f"数据库耗时{summary['query_time_ms']}ms, 总耗时{summary['elapsed_ms']}ms"
+        )
+        for item in summary['n_plus_one']:
+            logger.warning(
+                f"[DB Profile] {summary['name']} 疑似N+1查询: 执行{item['count']}次, "
+                f"共{item['time_ms']}ms: {item['sql']}"
+            )
+        for item in summary['slow']:
+            plan = ' | '.join(item['plan']) if item['plan'] else '-'
+            logger.warning(
+                f"[DB Profile] {summary['name']} 慢查询 {item['time_ms']}ms: {item['sql']} 查询计划: {plan}"
+            )
+        return summary
+
+
+# 创建全局实例
+query_profiler = QueryProfiler()
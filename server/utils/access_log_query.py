@@ -0,0 +1,159 @@
+"""
+访问日志查询工具
+扫描 logs 目录下的结构化访问日志（access.jsonl 及其 .gz 归档）
+
+未压缩文件使用 mmap 定位匹配的行，只解析命中的记录；压缩归档按行流式解压。
+
+用法:
+    python utils/access_log_query.py --path /api/tasks --status 500 --since "2025-03-10 00:00:00"
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import mmap
+import argparse
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import ACCESS_LOG
+
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
+
+
+def get_log_files(log_dir: str = DEFAULT_LOG_DIR, filename: str = None) -> List[str]:
+    """获取访问日志文件列表，按时间从旧到新排列（归档在前，当前文件在后）"""
+    base = os.path.join(log_dir, filename or ACCESS_LOG.get('filename', 'access.jsonl'))
+    files = sorted(glob.glob(f"{glob.escape(base)}.*.gz"))
+    if os.path.exists(base):
+        files.append(base)
+    return files
+
+
+def _scan_plain(path: str, needle: Optional[bytes]) -> Iterator[bytes]:
+    """使用 mmap 扫描未压缩文件，有 needle 时只返回包含它的行"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if needle is None:
+                line = mm.readline()
+                while line:
+                    yield line
+                    line = mm.readline()
+                return
+
+            pos = mm.find(needle)
+            while pos != -1:
+                start = mm.rfind(b'\n', 0, pos) + 1
+                end = mm.find(b'\n', pos)
+                if end == -1:
+                    end = len(mm)
+                yield mm[start:end]
+                pos = mm.find(needle, end)
+
+
+def _scan_gzip(path: str, needle: Optional[bytes]) -> Iterator[bytes]:
+    """流式扫描压缩归档"""
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            if needle is None or needle in line:
+                yield line
+
+
+def query_access_log(path_prefix: str = None, method: str = None, status: int = None,
+                     min_ms: float = None, since: float = None, until: float = None,
+                     limit: int = None, log_dir: str = DEFAULT_LOG_DIR) -> Iterator[Dict]:
+    """查询访问日志
+
+    Args:
+        path_prefix: 请求路径前缀
+        method: 请求方法
+        status: 响应状态码
+        min_ms: 最小耗时（毫秒）
+        since: 起始时间戳
+        until: 结束时间戳
+        limit: 最多返回条数
+        log_dir: 日志目录
+
+    Returns:
+        Iterator[Dict]: 按时间顺序产出匹配的记录
+    """
+    # 路径前缀作为字节级预过滤条件，避免逐行解析JSON
+    needle = None
+    if path_prefix and '"' not in path_prefix and '\\' not in path_prefix:
+        needle = b'"path":"' + path_prefix.encode('utf-8')
+
+    count = 0
+    for path in get_log_files(log_dir):
+        # 最后修改时间早于起始时间的文件不可能包含匹配记录
+        if since is not None and os.path.getmtime(path) < since:
+            continue
+
+        scanner = _scan_gzip if path.endswith('.gz') else _scan_plain
+        for line in scanner(path, needle):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            ts = record.get('ts') or 0
+            if since is not None and ts < since:
+                continue
+            if until is not None and ts > until:
+                continue
+            if path_prefix and not record.get('path', '').startswith(path_prefix):
+                continue
+            if method and record.get('method') != method.upper():
+                continue
+            if status is not None and record.get('status') != status:
+                continue
+            if min_ms is not None and (record.get('duration_ms') or 0) < min_ms:
+                continue
+
+            yield record
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+
+def _parse_time(value: str) -> Optional[float]:
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查询结构化访问日志')
+    parser.add_argument('--dir', default=DEFAULT_LOG_DIR, help='日志目录')
+    parser.add_argument('--path', help='请求路径前缀')
+    parser.add_argument('--method', help='请求方法')
+    parser.add_argument('--status', type=int, help='响应状态码')
+    parser.add_argument('--min-ms', type=float, help='最小耗时（毫秒）')
+    parser.add_argument('--since', help='起始时间，格式 YYYY-MM-DD HH:MM:SS')
+    parser.add_argument('--until', help='结束时间，格式 YYYY-MM-DD HH:MM:SS')
+    parser.add_argument('--limit', type=int, help='最多返回条数')
+    args = parser.parse_args()
+
+    for record in query_access_log(
+        path_prefix=args.path,
+        method=args.method,
+        status=args.status,
+        min_ms=args.min_ms,
+        since=_parse_time(args.since),
+        until=_parse_time(args.until),
+        limit=args.limit,
+        log_dir=args.dir
+    ):
+        print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
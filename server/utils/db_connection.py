@@ -0,0 +1,168 @@
+"""
+数据库连接封装
+所有服务通过 connect() 获取 sqlite3 连接，语句执行时统一计时并通知监听器
+（请求指标、慢查询分析等），未注册监听器时只有一次列表判断的开销
+
+run_immediate() 在 BEGIN IMMEDIATE 写事务中执行一组语句，遇到 SQLITE_BUSY 时回滚并退避重试
+after_commit() 注册事务提交后的回调，用于在数据提交后再清除缓存
+"""
+import random
+import sqlite3
+import time
+from typing import Any, Callable, List
+
+# 监听器签名: listener(conn, sql, params, elapsed_seconds)
+_statement_listeners: List[Callable] = []
+
+# 支持 UPDATE ... RETURNING（SQLite 3.35+）
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+BUSY_RETRIES = 3  # SQLITE_BUSY 时的最大重试次数
+BUSY_BACKOFF = 0.05  # 首次重试前的等待秒数，之后每次翻倍并加随机抖动
+
+
+def add_statement_listener(listener: Callable) -> None:
+    """注册语句执行监听器"""
+    if listener not in _statement_listeners:
+        _statement_listeners.append(listener)
+
+
+def remove_statement_listener(listener: Callable) -> None:
+    """移除语句执行监听器"""
+    if listener in _statement_listeners:
+        _statement_listeners.remove(listener)
+
+
+def _notify(conn, sql, params, elapsed: float) -> None:
+    for listener in _statement_listeners:
+        try:
+            listener(conn, sql, params, elapsed)
+        except Exception:
+            # 监听器异常不能影响业务查询
+            pass
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录执行耗时的游标"""
+
+    def execute(self, sql, parameters=()):
+        if not _statement_listeners:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _notify(self.connection, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not _statement_listeners:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _notify(self.connection, sql, None, time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        if not _statement_listeners:
+            return super().executescript(sql_script)
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _notify(self.connection, sql_script, None, time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """默认使用 InstrumentedCursor 的连接，支持提交后回调"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._after_commit: List[Callable[[], None]] = []
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        super().commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # 回调异常不能影响已提交的事务
+                pass
+
+    def rollback(self):
+        self._after_commit = []
+        super().rollback()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """with conn: 正常退出时提交、异常时回滚
+
+        sqlite3.Connection 的 __exit__ 直接提交，不经过 commit()，提交后回调会被丢弃，这里改为调用 commit()。
+        """
+        if exc_type is not None:
+            self.rollback()
+            return False
+        try:
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+        return False
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connect(database, **kwargs) -> sqlite3.Connection:
+    """创建数据库连接，参数与 sqlite3.connect 相同"""
+    kwargs.setdefault('factory', InstrumentedConnection)
+    return sqlite3.connect(database, **kwargs)
+
+
+def after_commit(conn: sqlite3.Connection, callback: Callable[[], None]) -> None:
+    """事务提交后执行 callback（如清除缓存），回滚时丢弃；不在事务中或非封装连接时立即执行"""
+    if conn.in_transaction and isinstance(conn, InstrumentedConnection):
+        conn._after_commit.append(callback)
+    else:
+        callback()
+
+
+def is_busy_error(error: Exception) -> bool:
+    """是否为数据库被锁定（SQLITE_BUSY / SQLITE_LOCKED）"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def run_immediate(conn: sqlite3.Connection, work: Callable[[sqlite3.Cursor], Any],
+                  retries: int = BUSY_RETRIES, backoff: float = BUSY_BACKOFF) -> Any:
+    """在 BEGIN IMMEDIATE 事务中执行 work(cursor) 并提交，返回 work 的返回值
+
+    开始时即取得写锁，事务内的读取在提交前不会被其他写入改变。数据库被锁定时回滚并按指数退避重试，
+    work 会被重新执行，因此 work 内只能有数据库操作。work 需要放弃修改时自行调用 conn.rollback()
+    后返回；抛出的其他异常回滚后向上抛出。
+    """
+    attempt = 0
+    while True:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            result = work(cursor)
+            conn.commit()
+            return result
+        except Exception as e:
+            conn.rollback()
+            if not is_busy_error(e) or attempt >= retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+            attempt += 1
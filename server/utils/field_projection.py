@@ -0,0 +1,69 @@
+"""
+列表接口字段投影
+客户端用 fields 参数（逗号分隔）只取需要展示的字段，例如 /api/gps/sync?fields=x,y,addtime：
+
+    parse_fields     解析请求参数
+    select_columns   服务层据此生成 SQL 列清单，只读取需要的列，响应中只包含这些字段
+
+未传 fields 时返回全部字段，与原接口一致；包含不存在的字段时抛出 ValueError，由接口返回参数错误。
+"""
+import re
+from typing import Iterable, List, Mapping, Optional, Sequence, Union
+
+FIELDS_PARAM = 'fields'
+MAX_FIELDS = 64  # 单次请求最多字段数
+
+_FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def parse_fields(value: Union[str, Iterable[str], None]) -> Optional[List[str]]:
+    """解析逗号分隔的字段列表，去重并保持顺序；为空时返回 None 表示全部字段"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    fields = []
+    for name in value:
+        name = name.strip()
+        if not name:
+            continue
+        if not _FIELD_NAME.match(name):
+            raise ValueError(f"无效的字段名: {name}")
+        if name not in fields:
+            fields.append(name)
+    if len(fields) > MAX_FIELDS:
+        raise ValueError(f"字段数不能超过 {MAX_FIELDS}")
+    return fields or None
+
+
+def table_columns(cursor, table: str) -> List[str]:
+    """读取表的列名"""
+    cursor.execute(f'PRAGMA table_info("{table}")')
+    return [row[1] for row in cursor.fetchall()]
+
+
+def select_columns(fields: Optional[Sequence[str]], columns: Union[Mapping[str, str], Sequence[str]],
+                   required: Sequence[str] = (), prefix: str = '') -> str:
+    """生成 SQL 列清单
+
+    Args:
+        fields: 请求的字段，None 表示全部
+        columns: 可选字段；列表为同名列，字典为 字段名 -> SQL 表达式
+        required: 服务内部需要的字段（如分页游标、主键），总是读取
+        prefix: 同名列的表别名前缀，如 't.'
+
+    Raises:
+        ValueError: fields 中有不支持的字段
+    """
+    if not isinstance(columns, Mapping):
+        columns = {name: f'{prefix}"{name}"' for name in columns}
+    if fields is None:
+        selected = list(columns)
+    else:
+        unknown = [name for name in fields if name not in columns]
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+        selected = list(fields)
+        selected.extend(name for name in required if name in columns and name not in selected)
+    return ', '.join(f'{columns[name]} AS "{name}"' for name in selected)
+
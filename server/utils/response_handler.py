@@ -1,12 +1,95 @@
 """
 统一响应处理模块
 包含状态码定义和统一的响应格式处理
+
+JSON 序列化：安装了 orjson 时使用 orjson，否则使用标准库 json，两者输出一致（UTF-8、紧凑格式，
+datetime 为 YYYY-MM-DD HH:MM:SS，Decimal 为字符串，sqlite3.Row 为对象）。api_response 和 jsonify
+（FastJSONProvider）生成的响应只序列化一次，原始数据保存在 response.json_payload，请求日志直接读取，
+不再解析响应内容。
 """
-from flask import jsonify, redirect, url_for, Response, current_app
+import json
+import sqlite3
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from flask import redirect, url_for, Response, current_app
+from flask.json.provider import DefaultJSONProvider
 from typing import Any, Optional, Union, Dict
 import logging
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+JSON_MIMETYPE = 'application/json'
+
+if orjson is not None:
+    # 日期时间交给 _json_default，与标准库输出格式一致；int 键转为字符串，与标准库一致
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _json_default(obj: Any) -> Any:
+    """序列化 JSON 不支持的类型"""
+    if isinstance(obj, datetime):
+        return obj.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(obj, date):
+        return obj.strftime('%Y-%m-%d')
+    if isinstance(obj, dt_time):
+        return obj.strftime('%H:%M:%S')
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, sqlite3.Row):
+        return dict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'tolist'):  # numpy 数组和数值
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_dumps(obj: Any) -> bytes:
+    """序列化为 UTF-8 编码的 JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """解析 JSON"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(payload: Any, status: int = 200, response_class=None) -> Response:
+    """生成 JSON 响应，原始数据保存在 response.json_payload"""
+    response_class = response_class or current_app.response_class
+    response = response_class(json_dumps(payload), status=status, mimetype=JSON_MIMETYPE)
+    response.json_payload = payload
+    return response
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON 提供者，jsonify 和 request.get_json 使用上面的序列化函数
+
+    用法: app.json = FastJSONProvider(app)
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:  # 调用方指定了 indent 等参数时按标准库处理
+            return super().dumps(obj, **kwargs)
+        return json_dumps(obj).decode('utf-8')
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        return json_response(self._prepare_response_obj(args, kwargs), response_class=self._app.response_class)
+
 
 class StatusCode:
     """状态码定义"""
@@ -116,6 +199,11 @@ class StatusCode:
     SYSTEM_CONFIG_ERROR = 2003  # 系统配置错误
     SYSTEM_VERSION_ERROR = 2004  # 系统版本错误
 
+    # 商店相关状态码 (2100-2199)
+    SHOP_ITEM_NOT_FOUND = 2100   # 商品不存在或未上架
+    SHOP_ITEM_SOLD_OUT = 2101    # 商品库存不足
+    SHOP_PURCHASE_FAILED = 2102  # 购买失败
+
     @staticmethod
     def get_message(code: int) -> str:
         """获取状态码对应的默认消息"""
@@ -152,7 +240,12 @@ class StatusCode:
             # 数据库相关状态码消息
             StatusCode.DB_CONNECTION_ERROR: "数据库连接错误",
             StatusCode.DB_QUERY_ERROR: "数据库查询错误",
-            StatusCode.DB_UPDATE_ERROR: "数据库更新错误"
+            StatusCode.DB_UPDATE_ERROR: "数据库更新错误",
+
+            # 商店相关状态码消息
+            StatusCode.SHOP_ITEM_NOT_FOUND: "商品不存在",
+            StatusCode.SHOP_ITEM_SOLD_OUT: "商品库存不足",
+            StatusCode.SHOP_PURCHASE_FAILED: "购买失败"
         }
         return messages.get(code, "未知错误")
 
@@ -216,20 +309,20 @@ def api_response(func):
         try:
             result = func(*args, **kwargs)
 
-            # 处理重定向响应
-            if isinstance(result, Response) and result.status_code in [301, 302, 307, 308]:
+            # 已生成的响应（重定向、幂等重放等）直接返回
+            if isinstance(result, Response):
                 return result
 
             # 处理普通响应
             if isinstance(result, dict) and "code" in result:
-                return jsonify(result)
+                return json_response(result)
 
             # 包装为成功响应
-            return jsonify(ResponseHandler.success(data=result))
+            return json_response(ResponseHandler.success(data=result))
 
         except Exception as e:
             logger.exception(f"API异常: {str(e)}")
-            return jsonify(ResponseHandler.error(
+            return json_response(ResponseHandler.error(
                 code=StatusCode.SERVER_ERROR,
                 msg=f"服务器错误: {str(e)}"
             ))
@@ -0,0 +1,182 @@
+"""
+可用任务计算基准测试
+在临时数据库中生成任务链（默认 10000 个任务、1000 个玩家），对比原逐任务扫描方式
+与任务链图方式（TaskService.get_available_tasks）的耗时，并校验两者结果一致。
+
+用法:
+    python utils/tools/bench_available_tasks.py --tasks 10000 --players 1000
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from function.TaskService import task_service
+from function.TaskCatalogService import task_catalog_service
+
+SCHEMA = '''
+CREATE TABLE task (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, description TEXT, task_chain_id INTEGER DEFAULT 0,
+    parent_task_id INTEGER DEFAULT 0, task_type TEXT, task_status TEXT DEFAULT 'AVAIL', task_scope INTEGER DEFAULT 0,
+    stamina_cost INTEGER DEFAULT 0, limit_time INTEGER DEFAULT 0, repeat_time INTEGER DEFAULT 1,
+    is_enabled INTEGER DEFAULT 1, repeatable INTEGER DEFAULT 0, need_check INTEGER DEFAULT 0,
+    task_rewards TEXT, icon TEXT
+);
+CREATE TABLE player_task (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, player_id INTEGER, task_id INTEGER, status TEXT,
+    starttime INTEGER, endtime INTEGER, complete_time INTEGER
+);
+CREATE INDEX idx_player_task_player ON player_task (player_id, status);
+'''
+
+TASK_TYPES = ['MAIN', 'BRANCH', 'BRANCH', 'DAILY', 'SPECIAL']
+PLAYER_STATUSES = ['COMPLETED', 'COMPLETED', 'COMPLETED', 'IN_PROGRESS', 'CHECK', 'REJECT', 'ABANDONED']
+
+
+def build_database(path: str, task_count: int, player_count: int, tasks_per_player: int, seed: int) -> None:
+    """生成任务链和玩家任务记录"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+
+    tasks = []
+    ids_by_type = {task_type: [] for task_type in TASK_TYPES}
+    for task_id in range(1, task_count + 1):
+        task_type = rng.choice(TASK_TYPES)
+        same_type = ids_by_type[task_type]
+        parent_id = rng.choice(same_type) if same_type and task_type in ('MAIN', 'BRANCH') and rng.random() < 0.8 else 0
+        same_type.append(task_id)
+        scope = rng.randint(1, player_count) if rng.random() < 0.05 else 0
+        repeatable = 1 if task_type == 'DAILY' and rng.random() < 0.5 else 0
+        tasks.append((
+            task_id, f'task{task_id}', parent_id, task_type, scope,
+            rng.choice(['AVAIL', 'AVAIL', 'LOCKED']), int(rng.random() < 0.95), repeatable, rng.randint(1, 3)
+        ))
+    conn.executemany('''
+        INSERT INTO task (id, name, description, parent_task_id, task_type, task_scope,
+                          task_status, is_enabled, repeatable, repeat_time, task_rewards)
+        VALUES (?, ?, '', ?, ?, ?, ?, ?, ?, ?, '{}')
+    ''', tasks)
+
+    now = int(time.time())
+    conn.executemany('''
+        INSERT INTO player_task (player_id, task_id, status, starttime, endtime)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (
+        (player_id, rng.randint(1, task_count), rng.choice(PLAYER_STATUSES), now - rng.randint(0, 172800), now + 3600)
+        for player_id in range(1, player_count + 1)
+        for _ in range(tasks_per_player)
+    ))
+    conn.commit()
+    conn.close()
+
+
+def legacy_available_tasks(conn, player_id: int):
+    """原实现：逐个候选任务扫描玩家的进行中任务"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT t.task_type, t.id FROM player_task pt JOIN task t ON pt.task_id = t.id
+        WHERE pt.player_id = ? AND (pt.status = 'IN_PROGRESS' OR pt.status = 'CHECK')
+    ''', (player_id,))
+    current_tasks = cursor.fetchall()
+    cursor.execute('''
+        SELECT t.id, t.task_type FROM player_task pt JOIN task t ON pt.task_id = t.id
+        WHERE pt.player_id = ? AND pt.status = 'COMPLETED'
+    ''', (player_id,))
+    completed_tasks = {row['id']: row['task_type'] for row in cursor.fetchall()}
+    today_start = int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+    cursor.execute('''
+        SELECT t.id, COUNT(*) as accept_count FROM player_task pt JOIN task t ON pt.task_id = t.id
+        WHERE pt.player_id = ? AND t.task_type = 'DAILY' AND pt.starttime >= ? GROUP BY t.id
+    ''', (player_id, today_start))
+    daily_task_counts = {row['id']: row['accept_count'] for row in cursor.fetchall()}
+    cursor.execute('''
+        SELECT t.id, t.task_type, t.task_status, t.parent_task_id, t.repeatable, t.repeat_time
+        FROM task t
+        WHERE t.is_enabled = 1 AND (t.task_scope = 0 OR t.task_scope = ?)
+        AND t.id NOT IN (
+            SELECT task_id FROM player_task WHERE player_id = ?
+            AND (status = 'IN_PROGRESS' OR status = 'COMPLETED' or status = 'CHECK')
+        )
+    ''', (player_id, player_id))
+
+    available = []
+    for task in cursor.fetchall():
+        if task['task_type'] == 'MAIN':
+            current_main = next((t for t in current_tasks if t['task_type'] == 'MAIN'), None)
+            if current_main:
+                if task['parent_task_id'] == current_main['id']:
+                    available.append(task['id'])
+            elif task['parent_task_id'] == 0 or task['parent_task_id'] in completed_tasks:
+                available.append(task['id'])
+        elif task['task_type'] == 'BRANCH':
+            current_branch = [t for t in current_tasks if t['task_type'] == 'BRANCH']
+            if any(task['parent_task_id'] == t['id'] for t in current_branch):
+                available.append(task['id'])
+            elif task['parent_task_id'] == 0 or task['parent_task_id'] in completed_tasks:
+                available.append(task['id'])
+        elif task['task_type'] == 'DAILY':
+            count = daily_task_counts.get(task['id'], 0)
+            if (task['repeatable'] and count < task['repeat_time']) or (not task['repeatable'] and count == 0):
+                available.append(task['id'])
+        elif task['task_type'] == 'SPECIAL' and task['task_status'] == 'AVAIL':
+            available.append(task['id'])
+    return sorted(available)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='可用任务计算基准测试')
+    parser.add_argument('--tasks', type=int, default=10000, help='任务数量')
+    parser.add_argument('--players', type=int, default=1000, help='玩家数量')
+    parser.add_argument('--tasks-per-player', type=int, default=30, help='每个玩家的任务记录数')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_tasks_')
+    db_path = os.path.join(workdir, 'game.db')
+    try:
+        print(f"生成数据: {args.tasks} 个任务, {args.players} 个玩家 ...")
+        build_database(db_path, args.tasks, args.players, args.tasks_per_player, args.seed)
+
+        task_service.db_path = db_path
+        task_catalog_service.db_path = db_path
+        task_catalog_service.snapshot()  # 预先加载任务目录，不计入耗时
+
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        legacy_results = {}
+        started = time.perf_counter()
+        for player_id in range(1, args.players + 1):
+            legacy_results[player_id] = legacy_available_tasks(conn, player_id)
+        legacy_elapsed = time.perf_counter() - started
+        conn.close()
+
+        graph_results = {}
+        started = time.perf_counter()
+        for player_id in range(1, args.players + 1):
+            result = task_service.get_available_tasks(player_id)
+            graph_results[player_id] = [task['id'] for task in result['data']]
+        graph_elapsed = time.perf_counter() - started
+
+        mismatched = [pid for pid in legacy_results if legacy_results[pid] != graph_results[pid]]
+        print(f"逐任务扫描: {legacy_elapsed:.3f}s ({legacy_elapsed / args.players * 1000:.2f}ms/玩家)")
+        print(f"任务链图:   {graph_elapsed:.3f}s ({graph_elapsed / args.players * 1000:.2f}ms/玩家)")
+        print(f"加速比: {legacy_elapsed / graph_elapsed:.1f}x")
+        if mismatched:
+            print(f"结果不一致的玩家: {mismatched[:20]}")
+            sys.exit(1)
+        print("结果一致")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
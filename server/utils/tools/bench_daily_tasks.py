@@ -0,0 +1,179 @@
+"""
+每日任务分配基准测试
+在临时数据库中生成玩家和每日任务（默认 100000 个玩家、10 个每日任务），对比原逐玩家逐任务
+SELECT + INSERT 的方式与 SchedulerService.assign_daily_tasks 的分批 INSERT ... SELECT 方式，
+并校验分配结果一致、重复执行不会重复分配。
+
+两种方式都在生产环境的表结构上运行：player_task 上安装玩家任务统计（PlayerTaskStateService）和
+事件日志（TaskEventService）的触发器。原方式逐行触发；分批方式插入期间暂停插入触发器，按批次一次
+维护统计和事件，运行后校验统计与全量重建一致、每条分配记录有且只有一条 CREATED 事件。
+
+用法:
+    python utils/tools/bench_daily_tasks.py --players 100000 --tasks 10
+    python utils/tools/bench_daily_tasks.py --players 100000 --skip-legacy
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, time as dt_time
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from utils import db_connection
+from function.SchedulerService import scheduler_service
+from function.TaskEventService import task_event_service
+from function.PlayerTaskStateService import player_task_state_service
+
+SCHEMA = '''
+CREATE TABLE player_data (player_id INTEGER PRIMARY KEY, player_name TEXT);
+CREATE TABLE task (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, task_type TEXT, task_scope INTEGER DEFAULT 0,
+    is_enabled INTEGER DEFAULT 1
+);
+CREATE TABLE player_task (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, player_id INTEGER, task_id INTEGER, starttime INTEGER,
+    endtime INTEGER, status TEXT, comment TEXT, complete_time INTEGER, submit_time INTEGER
+);
+'''
+
+
+def build_database(path: str, player_count: int, task_count: int, seed: int) -> None:
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany('INSERT INTO player_data (player_id, player_name) VALUES (?, ?)',
+                     ((player_id, f'player{player_id}') for player_id in range(1, player_count + 1)))
+    tasks = [(f'daily{i}', 'DAILY', rng.randint(1, player_count) if i % 5 == 4 else 0) for i in range(task_count)]
+    tasks += [(f'main{i}', 'MAIN', 0) for i in range(task_count)]
+    conn.executemany('INSERT INTO task (name, task_type, task_scope) VALUES (?, ?, ?)', tasks)
+    conn.commit()
+    conn.close()
+
+
+def install_triggers(path: str) -> None:
+    """安装生产环境 player_task 上的统计和事件触发器"""
+    conn = db_connection.connect(path)
+    try:
+        cursor = conn.cursor()
+        player_task_state_service.ensure_schema(cursor)
+        task_event_service.ensure_schema(cursor)
+    finally:
+        conn.close()
+
+
+def legacy_assign(path: str) -> None:
+    """原实现：逐任务逐玩家检查后插入，单个事务（补上同样的索引，只比较语句往返次数的差异）"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_player_task_player_task_start ON player_task (player_id, task_id, starttime)')
+    today = datetime.now().date()
+    start_timestamp = int(datetime.combine(today, dt_time(7, 0)).timestamp())
+    end_timestamp = int(datetime.combine(today, dt_time(22, 0)).timestamp())
+    cursor.execute("SELECT id, task_scope FROM task WHERE is_enabled = 1 AND task_type = 'DAILY'")
+    daily_tasks = cursor.fetchall()
+    cursor.execute('SELECT player_id FROM player_data')
+    all_players = [row[0] for row in cursor.fetchall()]
+    for task_id, task_scope in daily_tasks:
+        players = all_players if task_scope == 0 else [task_scope]
+        for player_id in players:
+            cursor.execute('''
+                SELECT id FROM player_task
+                WHERE player_id = ? AND task_id = ? AND starttime >= ? AND starttime < ?
+            ''', (player_id, task_id, start_timestamp, end_timestamp))
+            if not cursor.fetchone():
+                cursor.execute('''
+                    INSERT INTO player_task (player_id, task_id, starttime, endtime, status)
+                    VALUES (?, ?, ?, ?, 'IN_PROGRESS')
+                ''', (player_id, task_id, start_timestamp, end_timestamp))
+    conn.commit()
+    conn.close()
+
+
+def assignments(path: str):
+    conn = sqlite3.connect(path)
+    rows = conn.execute('SELECT player_id, task_id, starttime, endtime, status FROM player_task').fetchall()
+    conn.close()
+    return sorted(rows)
+
+
+def check_projections(path: str) -> list:
+    """统计表与全量重建一致，每条玩家任务有且只有一条 CREATED 事件，返回发现的问题"""
+    problems = []
+    conn = db_connection.connect(path)
+    try:
+        cursor = conn.cursor()
+        current = [sorted(cursor.execute(f'SELECT * FROM {table}').fetchall())
+                   for table in ('player_task_summary', 'player_task_stat')]
+        cursor.execute('BEGIN IMMEDIATE')
+        player_task_state_service.rebuild(cursor)
+        rebuilt = [sorted(cursor.execute(f'SELECT * FROM {table}').fetchall())
+                   for table in ('player_task_summary', 'player_task_stat')]
+        conn.rollback()
+        if current != rebuilt:
+            problems.append('玩家任务统计与全量重建不一致')
+        cursor.execute('''
+            SELECT COUNT(*) FROM player_task pt
+            WHERE (SELECT COUNT(*) FROM task_event e
+                   WHERE e.player_task_id = pt.id AND e.event_type = 'CREATED') != 1
+        ''')
+        missing = cursor.fetchone()[0]
+        if missing:
+            problems.append(f'{missing} 条玩家任务的 CREATED 事件数不为 1')
+    finally:
+        conn.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='每日任务分配基准测试')
+    parser.add_argument('--players', type=int, default=100000, help='玩家数量')
+    parser.add_argument('--tasks', type=int, default=10, help='每日任务数量')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--skip-legacy', action='store_true', help='不运行原实现')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_daily_')
+    legacy_db = os.path.join(workdir, 'legacy.db')
+    bulk_db = os.path.join(workdir, 'game.db')
+    try:
+        print(f"生成数据: {args.players} 个玩家, {args.tasks} 个每日任务 ...")
+        build_database(bulk_db, args.players, args.tasks, args.seed)
+        install_triggers(bulk_db)
+        if not args.skip_legacy:
+            shutil.copyfile(bulk_db, legacy_db)
+            started = time.perf_counter()
+            legacy_assign(legacy_db)
+            print(f"逐条分配:   {time.perf_counter() - started:.2f}s")
+
+        scheduler_service.db_path = bulk_db
+        started = time.perf_counter()
+        scheduler_service.assign_daily_tasks()
+        print(f"分批分配:   {time.perf_counter() - started:.2f}s")
+
+        first = assignments(bulk_db)
+        started = time.perf_counter()
+        scheduler_service.assign_daily_tasks()
+        print(f"重复执行:   {time.perf_counter() - started:.2f}s")
+        if assignments(bulk_db) != first:
+            print("重复执行产生了重复分配")
+            sys.exit(1)
+        if not args.skip_legacy and assignments(legacy_db) != first:
+            print("分配结果与原实现不一致")
+            sys.exit(1)
+        problems = check_projections(bulk_db)
+        if problems:
+            print("\n".join(problems))
+            sys.exit(1)
+        print(f"分配任务数: {len(first)}, 结果一致")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
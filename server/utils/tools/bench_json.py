@@ -0,0 +1,146 @@
+"""
+JSON 响应序列化基准测试
+按最大的几个接口生成同样形状的数据，对比原方式（jsonify 使用 Flask 默认 JSON 提供者：ensure_ascii、
+sort_keys，请求日志再用 get_json 解析一次响应）与 utils.response_handler.json_response（只序列化一次，
+请求日志读取 json_payload），并校验两者解析后的数据一致。
+
+    gps        /api/gps/sync，默认 1000 条 GPS 记录
+    car_park   /car_park 同步模式，人员和车牌全表
+    tasks      管理后台任务列表（不分页），含任务奖励和中文描述
+
+用法:
+    python utils/tools/bench_json.py
+    python utils/tools/bench_json.py --gps 5000 --persons 3000 --plates 5000 --tasks 1000
+    python utils/tools/bench_json.py --backend json   # 未安装 orjson 时的标准库路径
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from utils import response_handler
+from utils.response_handler import ResponseHandler, json_response
+
+NAMES = ['张伟', '王芳', '李娜', '刘洋', '陈静', '杨帆', '赵磊', '黄敏']
+
+
+def gps_payload(rng: random.Random, count: int) -> dict:
+    records = [{
+        'id': i,
+        'x': round(116.3 + rng.random() / 10, 6),
+        'y': round(39.9 + rng.random() / 10, 6),
+        'player_id': rng.randint(1, 50),
+        'addtime': 1700000000 + i * 30,
+        'device': rng.choice(['iPhone', 'Android', 'GPS-T1']),
+        'remark': rng.choice(['', '自动上报', '手动定位']),
+        'accuracy': round(rng.random() * 30, 2)
+    } for i in range(count)]
+    return ResponseHandler.success(data={'records': records, 'total': len(records)}, msg="获取最新GPS记录成功")
+
+
+def car_park_payload(rng: random.Random, persons: int, plates: int) -> dict:
+    person_rows = [{
+        'id': i, 'pName': rng.choice(NAMES), 'pSex': rng.choice(['男', '女']), 'departId': rng.randint(1, 20),
+        'pAddress': f'{rng.randint(1, 30)}栋{rng.randint(1, 30)}0{rng.randint(1, 9)}', 'pPhone': f'138{i:08d}',
+        'pParkSpaceCount': rng.randint(0, 3), 'pNumber': f'P{i:06d}', 'upload_yun': 1,
+        'IDCardNumber': f'110101199{i % 10}01011234', 'upload_yun2': 0, 'personIdStr': f'person-{i}',
+        'address1': '一区', 'address2': '二单元', 'address3': ''
+    } for i in range(persons)]
+    plate_rows = [{
+        'id': i, 'personId': rng.randint(0, persons), 'plateNumber': f'京A{i:05d}', 'plateType': '蓝牌',
+        'plateParkingSpaceName': f'B{rng.randint(1, 500)}', 'beginTime': '2025-01-01 00:00:00',
+        'endTime': '2025-12-31 23:59:59', 'createTime': '2024-12-20 10:00:00', 'authType': 1, 'upload_yun': 1,
+        'cNumber': '', 'pChargeId': rng.randint(1, 5), 'pRemark': rng.choice(['', '月租车', '业主车辆']),
+        'balance': round(rng.random() * 500, 2), 'cardNumber': '', 'plateStandard': 0, 'thirdCount': 0,
+        'upload_third': 0, 'freeTime': 0, 'createName': 'admin', 'plateIdStr': f'plate-{i}', 'isDel': 0,
+        'upload_yun2': 0, 'parkHourMinutes': 0
+    } for i in range(plates)]
+    return ResponseHandler.success(data={'persons': person_rows, 'plates': plate_rows})
+
+
+def tasks_payload(rng: random.Random, count: int) -> dict:
+    tasks = [{
+        'id': i, 'name': f'任务{i}', 'description': '完成指定地点的打卡并提交照片，审核通过后发放奖励。' * 2,
+        'task_chain_id': 0, 'parent_task_id': max(0, i - 1) if i % 3 else 0,
+        'task_type': rng.choice(['MAIN', 'BRANCH', 'DAILY', 'SPECIAL']), 'task_status': 'AVAIL', 'task_scope': 0,
+        'stamina_cost': rng.randint(0, 20), 'limit_time': 86400, 'repeat_time': 1, 'is_enabled': 1,
+        'repeatable': 0, 'need_check': rng.randint(0, 1), 'icon': f'/static/img/task/{i % 20}.png',
+        'created_at': '2025-03-01 12:00:00',
+        'task_rewards': {
+            'points_rewards': [{'type': 'exp', 'number': 10}, {'type': 'points', 'number': 5}],
+            'card_rewards': [{'id': rng.randint(1, 10), 'number': 1}], 'medal_rewards': [], 'real_rewards': []
+        }
+    } for i in range(count)]
+    return ResponseHandler.success(data={'total': len(tasks), 'tasks': tasks}, msg="获取任务列表成功")
+
+
+def measure(func, repeat: int) -> float:
+    """返回最快一次的耗时（毫秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 响应序列化基准测试')
+    parser.add_argument('--gps', type=int, default=1000, help='GPS 记录数')
+    parser.add_argument('--persons', type=int, default=2000, help='停车场人员数')
+    parser.add_argument('--plates', type=int, default=3000, help='停车场车牌数')
+    parser.add_argument('--tasks', type=int, default=500, help='任务数')
+    parser.add_argument('--repeat', type=int, default=20, help='每项重复次数，取最快一次')
+    parser.add_argument('--backend', choices=['auto', 'json'], default='auto',
+                        help='auto: 安装了 orjson 时使用 orjson；json: 强制使用标准库')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.backend == 'json':
+        response_handler.orjson = None
+    backend = 'orjson' if response_handler.orjson is not None else 'json'
+
+    rng = random.Random(args.seed)
+    payloads = {
+        'gps': gps_payload(rng, args.gps),
+        'car_park': car_park_payload(rng, args.persons, args.plates),
+        'tasks': tasks_payload(rng, args.tasks),
+    }
+
+    app = Flask(__name__)
+    legacy_provider = DefaultJSONProvider(app)
+
+    def legacy(payload):
+        # 原方式：jsonify 序列化，请求日志 get_json 再解析一次
+        response = legacy_provider.response(payload)
+        response.get_json()
+        return response
+
+    def current(payload):
+        response = json_response(payload)
+        response.json_payload
+        return response
+
+    print(f"序列化后端: {backend}")
+    print(f"{'接口':<10}{'原方式(ms)':>12}{'新方式(ms)':>12}{'加速':>8}{'原大小(KB)':>12}{'新大小(KB)':>12}")
+    with app.app_context():
+        for name, payload in payloads.items():
+            old_response = legacy(payload)
+            new_response = current(payload)
+            if json.loads(old_response.get_data()) != json.loads(new_response.get_data()):
+                raise SystemExit(f"{name}: 新旧方式的响应内容不一致")
+            legacy_ms = measure(lambda: legacy(payload), args.repeat)
+            current_ms = measure(lambda: current(payload), args.repeat)
+            print(f"{name:<10}{legacy_ms:>12.2f}{current_ms:>12.2f}{legacy_ms / current_ms:>7.1f}x"
+                  f"{len(old_response.get_data()) / 1024:>12.1f}{len(new_response.get_data()) / 1024:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
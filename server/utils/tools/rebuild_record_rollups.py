@@ -0,0 +1,151 @@
+"""
+积分/经验流水汇总回填工具
+根据 exp_record / points_record 全量重建 player_record_rollup（按天、按周汇总）。
+手工修改或删除流水、从备份导入流水后执行。
+
+--verify 不修改数据，只做校验：
+    1. 在内存数据库中按触发器逐条写入一份 total 有值/为空混合的流水（商店流水带 total，NFC 流水不带），
+       与全量重建的结果比较
+    2. 将数据库中现有的汇总与全量重建的结果比较（重建后回滚），列出不一致的周期
+
+用法:
+    python utils/tools/rebuild_record_rollups.py
+    python utils/tools/rebuild_record_rollups.py --kind points
+    python utils/tools/rebuild_record_rollups.py --db /path/to/game.db
+    python utils/tools/rebuild_record_rollups.py --verify
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from utils import db_connection
+from function.RecordRollupService import record_rollup_service, RECORD_TABLES
+
+DEFAULT_DB = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'database', 'game.db'
+)
+
+ROLLUP_QUERY = 'SELECT * FROM player_record_rollup ORDER BY kind, period, player_id, period_start'
+
+
+def _rebuilt_rows(cursor, kind=None):
+    """在事务中重建并读取汇总，之后回滚"""
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        record_rollup_service.rebuild(cursor, kind)
+        cursor.execute(ROLLUP_QUERY)
+        return cursor.fetchall()
+    finally:
+        cursor.connection.rollback()
+
+
+def _diff(expected, actual):
+    """返回不一致的汇总行（按主键比较）"""
+    expected = {row[:4]: row for row in expected}
+    actual = {row[:4]: row for row in actual}
+    return [
+        (key, expected.get(key), actual.get(key))
+        for key in sorted(set(expected) | set(actual))
+        if expected.get(key) != actual.get(key)
+    ]
+
+
+def verify_mixed_totals(rows: int = 2000, seed: int = 1) -> list:
+    """触发器与全量重建在 total 有值/为空混合的流水上结果一致"""
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        for table in RECORD_TABLES.values():
+            cursor.execute(f'''
+                CREATE TABLE {table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, player_id INTEGER, number INTEGER,
+                    addtime INTEGER, total INTEGER
+                )
+            ''')
+        # 内存数据库单独建表和触发器，不影响服务记录的建表状态
+        cursor.execute('BEGIN')
+        record_rollup_service._create_schema(cursor)
+        conn.commit()
+
+        rng = random.Random(seed)
+        addtime = int(time.time()) - 90 * 86400
+        totals = {1: 1000, 2: 0, 3: 500}
+        for _ in range(rows):
+            player_id = rng.choice(list(totals))
+            addtime += rng.randint(0, 20000)
+            number = rng.randint(-30, 30)
+            totals[player_id] += number
+            total = totals[player_id] if rng.random() < 0.5 else None
+            for table in RECORD_TABLES.values():
+                cursor.execute(
+                    f'INSERT INTO {table} (player_id, number, addtime, total) VALUES (?, ?, ?, ?)',
+                    (player_id, number, addtime, total)
+                )
+
+        cursor.execute(ROLLUP_QUERY)
+        incremental = cursor.fetchall()
+        return _diff(_rebuilt_rows(cursor), incremental)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='积分/经验流水汇总回填工具')
+    parser.add_argument('--db', default=DEFAULT_DB, help='数据库路径')
+    parser.add_argument('--kind', choices=sorted(RECORD_TABLES), help='只重建指定类型')
+    parser.add_argument('--verify', action='store_true', help='只校验，不修改数据')
+    args = parser.parse_args()
+
+    failed = False
+    if args.verify:
+        mismatches = verify_mixed_totals()
+        failed = bool(mismatches)
+        print(f"混合 total 流水：触发器与全量重建{'一致' if not mismatches else f'有 {len(mismatches)} 个周期不一致'}")
+        for key, expected, actual in mismatches[:20]:
+            print(f"  {key}: 重建 {expected}，触发器 {actual}")
+
+    conn = db_connection.connect(args.db)
+    try:
+        cursor = conn.cursor()
+        record_rollup_service.ensure_schema(cursor)
+        started = time.perf_counter()
+        if args.verify:
+            rebuilt = _rebuilt_rows(cursor, args.kind)
+            cursor.execute(ROLLUP_QUERY)
+            stored = cursor.fetchall()
+            if args.kind:
+                rebuilt = [row for row in rebuilt if row[0] == args.kind]
+                stored = [row for row in stored if row[0] == args.kind]
+            mismatches = _diff(rebuilt, stored)
+            failed = failed or bool(mismatches)
+            print(f"数据库汇总：{'与全量重建一致' if not mismatches else f'有 {len(mismatches)} 个周期与全量重建不一致'}"
+                  f"，耗时 {time.perf_counter() - started:.2f} 秒")
+            for key, expected, actual in mismatches[:20]:
+                print(f"  {key}: 重建 {expected}，现有 {actual}")
+            if failed:
+                sys.exit(1)
+            return
+        cursor.execute('BEGIN IMMEDIATE')
+        record_rollup_service.rebuild(cursor, args.kind)
+        conn.commit()
+        cursor.execute('SELECT kind, period, COUNT(*) FROM player_record_rollup GROUP BY kind, period')
+        counts = cursor.fetchall()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"重建完成，耗时 {time.perf_counter() - started:.2f} 秒")
+    for kind, period, count in counts:
+        print(f"  {kind:<7} {period:<5} {count} 行")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+任务事件重放工具
+根据 task_event 事件日志重建投影：player_task 取每个玩家任务最后一条事件的快照，
+之后重建玩家任务统计（player_task_summary / player_task_stat）。
+
+用法:
+    python utils/tools/replay_task_events.py --check
+    python utils/tools/replay_task_events.py
+    python utils/tools/replay_task_events.py --db /path/to/game.db
+"""
+import os
+import sys
+import argparse
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from utils import db_connection
+from function.TaskEventService import task_event_service
+
+DEFAULT_DB = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'database', 'game.db'
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='任务事件重放工具')
+    parser.add_argument('--db', default=DEFAULT_DB, help='数据库路径')
+    parser.add_argument('--check', action='store_true', help='只比较差异，不修改数据')
+    args = parser.parse_args()
+
+    conn = db_connection.connect(args.db)
+    try:
+        cursor = conn.cursor()
+        task_event_service.ensure_schema(cursor)
+        cursor.execute('BEGIN IMMEDIATE')
+        result = task_event_service.replay(cursor, apply=not args.check)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    action = '需要修正' if args.check else '已修正'
+    print(f"{action}: 新增 {result['inserted']} 条, 更新 {result['updated']} 条, 删除 {result['deleted']} 条")
+    if result['untracked']:
+        print(f"没有事件记录的玩家任务: {result['untracked']} 条" + ('' if args.check else '（已补写快照事件）'))
+    if args.check and any(result[key] for key in ('inserted', 'updated', 'deleted')):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()